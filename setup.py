@@ -16,10 +16,12 @@ setup (name = "tupelo",
     author_email = "jari.tenhunen@iki.fi",
     license = "BSD",
     packages = ['tupelo'],
-    scripts = ['scripts/tupelo', 'scripts/tupelo-server'],
+    scripts = ['scripts/tupelo', 'scripts/tupelo-server',
+            'scripts/tupelo-tournament'],
     data_files = [('share/tupelo/www', ['www/index.html', 'www/tupelo.js',
             'www/tupelo-main.js', 'www/tupelo.css', 'www/buttons.css']),
             ('share/tupelo/www/img', ['www/img/bg.png', 'www/img/bg-button.gif'])],
+    extras_require = {'batch': ['numpy']},
     platforms="Python 2.5 and later.",
     test_suite = "nose.collector"
     )
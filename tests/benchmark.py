@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+"""
+Benchmarks for tupelo.
+
+Run from the source tree:
+
+    python tests/benchmark.py -o results.json
+    python tests/benchmark.py -c results.json   # compare against a baseline
+
+Results are written as JSON with the time per operation in seconds. When
+comparing, benchmarks that got slower than the threshold are reported and
+the exit status is 1.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import timeit
+import threading
+import http.client
+import xmlrpc.client
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tupelo import rpc, binary
+from tupelo.common import Card, CardSet, BitCardSet, GameState, HEART, SPADE, CLUB, PlayedCard
+from tupelo.events import EventList, CardPlayedEvent, MessageEvent
+from tupelo.game import GameController
+from tupelo.players import Player, DummyBotPlayer, CountingBotPlayer
+
+BENCHMARKS = []
+
+def benchmark(group):
+    """
+    Decorator for registering a benchmark function.
+
+    The function gets no arguments and returns either a callable to be
+    timed with timeit, or a dict of already measured results.
+    """
+    def decorator(func):
+        BENCHMARKS.append(('%s.%s' % (group, func.__name__), func))
+        return func
+    return decorator
+
+def _time(func, repeat=5):
+    """
+    Time a callable. Return a result dict.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times = [t / number for t in timer.repeat(repeat, number)]
+    times.sort()
+    return {'seconds': times[0], 'median': times[len(times) // 2],
+            'number': number}
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def _latencies(func, count):
+    """
+    Call func count times and return a result dict with latencies.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(count):
+        t0 = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    return {'seconds': elapsed / count, 'median': _percentile(latencies, 50),
+            'p95': _percentile(latencies, 95), 'number': count}
+
+def _sample_state():
+    state = GameState()
+    state.status = GameState.ONGOING
+    state.table.append(PlayedCard(Card(HEART, 5), 'abc'))
+    state.table.append(PlayedCard(Card(HEART, 11), 'def'))
+    state.table.append(PlayedCard(Card(SPADE, 2), 'ghi'))
+    state.score = [12, 0]
+    state.tricks = [3, 4]
+    return state
+
+def _sample_events(count=20):
+    events = EventList()
+    player = Player('Seppo')
+    player.id = 'abc'
+    for i in range(count):
+        if i % 4 == 3:
+            events.append(MessageEvent('', 'Team 1 takes this trick'))
+        else:
+            events.append(CardPlayedEvent(player, PlayedCard(Card(CLUB, 2 + i % 13), 'abc'),
+                _sample_state()))
+    return events
+
+def _deal_hand():
+    hand = BitCardSet()
+    BitCardSet.new_full_deck().deal([hand, BitCardSet(), BitCardSet(), BitCardSet()],
+            random.Random(1))
+    return hand
+
+### cards
+
+@benchmark('cards')
+def new_full_deck():
+    return CardSet.new_full_deck
+
+@benchmark('cards')
+def bitcardset_deal():
+    def func():
+        hands = [BitCardSet() for _ in range(4)]
+        BitCardSet.new_full_deck().deal(hands)
+    return func
+
+@benchmark('cards')
+def bitcardset_get_cards_suit():
+    hand = _deal_hand()
+    return lambda: hand.get_cards(suit=HEART)
+
+@benchmark('cards')
+def bitcardset_highest_lowest():
+    hand = _deal_hand()
+    return lambda: (hand.get_highest(roof=10), hand.get_lowest(floor=5))
+
+@benchmark('cards')
+def bitcardset_take():
+    hand = _deal_hand()
+    card = hand[5]
+    def func():
+        hand.take(card)
+        hand.append(card)
+    return func
+
+@benchmark('cards')
+def cardset_sub():
+    deck = CardSet.new_full_deck()
+    hand = CardSet(_deal_hand())
+    return lambda: deck - hand
+
+### rpc
+
+@benchmark('rpc')
+def encode_game_state():
+    state = _sample_state()
+    return lambda: rpc.rpc_encode(state)
+
+@benchmark('rpc')
+def decode_game_state():
+    encoded = rpc.rpc_encode(_sample_state())
+    return lambda: rpc.rpc_decode(GameState, encoded)
+
+def _uncached(events):
+    """
+    Drop the cached RPC forms of the events, so that they are encoded anew.
+    """
+    for event in events:
+        event.__dict__.pop('_rpcobj', None)
+    return events
+
+@benchmark('rpc')
+def encode_event_list():
+    events = _sample_events()
+    return lambda: rpc.rpc_encode(_uncached(events))
+
+@benchmark('rpc')
+def decode_event_list():
+    encoded = rpc.rpc_encode(_sample_events())
+    return lambda: rpc.rpc_decode(EventList, encoded)
+
+@benchmark('rpc')
+def encode_event_list_binary():
+    events = _sample_events()
+    return lambda: binary.encode_events(rpc.rpc_encode(_uncached(events)))
+
+@benchmark('rpc')
+def decode_event_list_json():
+    encoded = json.dumps(rpc.rpc_encode(_sample_events()))
+    return lambda: rpc.rpc_decode(EventList, json.loads(encoded))
+
+@benchmark('rpc')
+def decode_event_list_binary():
+    encoded = binary.encode_events(rpc.rpc_encode(_sample_events()))
+    return lambda: rpc.rpc_decode(EventList, binary.decode_events(encoded))
+
+### game
+
+@benchmark('game')
+def headless_game():
+    seeds = iter(range(1000000))
+    def func():
+        game = GameController(random.Random(next(seeds)))
+        for i in range(4):
+            cls = CountingBotPlayer if i % 2 else DummyBotPlayer
+            game.register_player(cls('Robotti %d' % i))
+        game.run_headless(max_hands=50)
+    return func
+
+### server
+
+class _ServerFixture():
+    """
+    A TupeloServer running in a background thread, with one registered
+    player in a game against bots.
+    """
+    def __init__(self):
+        from tupelo.server import TupeloServer
+        self.server = TupeloServer(('127.0.0.1', 0), logRequests=False)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.proxy = xmlrpc.client.ServerProxy('http://127.0.0.1:%d/RPC2' % self.port)
+        data = self.proxy.player.register(rpc.rpc_encode(Player('Bench')))
+        self.akey = data['akey']
+        self.player_id = data['id']
+        self.game_id = self.proxy.game.create(self.akey)
+        self.proxy.game.start_with_bots(self.akey, self.game_id)
+
+    def get(self, path):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port)
+        conn.request('GET', path, headers={'Cookie': 'akey=%s' % self.akey})
+        response = conn.getresponse()
+        body = response.read()
+        conn.close()
+        return body
+
+    def play_card(self):
+        """
+        Wait for our turn and play a legal card over XML-RPC.
+        Return the time spent in the play_card call.
+        """
+        while True:
+            state = self.proxy.game.get_state(self.akey, self.game_id)
+            game_state = rpc.rpc_decode(GameState, state['game_state'])
+            if game_state.turn_id == self.player_id and \
+                    game_state.status in (GameState.VOTING, GameState.ONGOING):
+                break
+            time.sleep(0.001)
+
+        hand = rpc.rpc_decode(BitCardSet, state['hand'])
+        choices = hand
+        if game_state.status == GameState.ONGOING and len(game_state.table) > 0:
+            choices = hand.get_cards(suit=game_state.table[0].suit) or hand
+        card = choices[0]
+        start = time.perf_counter()
+        self.proxy.game.play_card(self.akey, self.game_id, rpc.rpc_encode(card))
+        return time.perf_counter() - start
+
+    def close(self):
+        self.proxy.player.quit(self.akey)
+        self.server.shutdown()
+        self.server.server_close()
+
+_fixture = None
+
+def _server():
+    global _fixture
+    if _fixture is None:
+        _fixture = _ServerFixture()
+    return _fixture
+
+@benchmark('server')
+def api_get_events():
+    server = _server()
+    return _latencies(lambda: server.get('/api/get_events'), 300)
+
+@benchmark('server')
+def api_game_get_state():
+    server = _server()
+    path = '/api/game/get_state?game_id=%s' % json.dumps(server.game_id)
+    return _latencies(lambda: server.get(path), 300)
+
+@benchmark('server')
+def xmlrpc_play_card():
+    server = _server()
+    latencies = [server.play_card() for _ in range(40)]
+    return {'seconds': sum(latencies) / len(latencies),
+            'median': _percentile(latencies, 50),
+            'p95': _percentile(latencies, 95), 'number': len(latencies)}
+
+def run(pattern=None) -> dict:
+    results = {}
+    try:
+        for name, func in BENCHMARKS:
+            if pattern and pattern not in name:
+                continue
+            result = func()
+            if callable(result):
+                result = _time(result)
+            result['ops_per_second'] = 1.0 / result['seconds']
+            results[name] = result
+            print('%-40s %12.3f us/op %12.1f ops/s' % (name,
+                result['seconds'] * 1e6, result['ops_per_second']))
+    finally:
+        if _fixture is not None:
+            _fixture.close()
+
+    return results
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Compare results to a baseline. Return a list of regressed benchmarks.
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        ratio = results[name]['seconds'] / baseline[name]['seconds']
+        flag = ''
+        if ratio > 1.0 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('%-40s %6.2fx%s' % (name, ratio, flag))
+
+    return regressions
+
+def _main():
+    parser = OptionParser()
+    parser.add_option("-o", "--output", dest='output', action="store",
+            help="write results as JSON to this file")
+    parser.add_option("-c", "--compare", dest='compare', action="store",
+            help="compare results against a JSON baseline file")
+    parser.add_option("-t", "--threshold", dest='threshold', action="store",
+            type="float", default=0.2,
+            help="allowed slowdown ratio before reporting a regression")
+    parser.add_option("-k", dest='pattern', action="store",
+            help="run only benchmarks whose name contains this string")
+    (opts, args) = parser.parse_args()
+
+    results = run(opts.pattern)
+    if opts.output:
+        with open(opts.output, 'w') as outfile:
+            json.dump({'python': sys.version.split()[0], 'results': results},
+                    outfile, indent=2, sort_keys=True)
+
+    if opts.compare:
+        with open(opts.compare) as infile:
+            baseline = json.load(infile)['results']
+        if compare(results, baseline, opts.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    _main()
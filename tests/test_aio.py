@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import unittest
+import json
+import time
+import socket
+import threading
+import http.client
+from tupelo import rpc
+from tupelo.server import AsyncTupeloServer
+from tupelo.xmlrpc import XMLRPCProxyController
+from tupelo.players import Player
+from tupelo.events import Event
+
+class TestAsyncServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = AsyncTupeloServer(('127.0.0.1', 0), logRequests=False)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server.shutdown_games()
+        self.thread.join()
+
+    def _get(self, url, headers=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            conn.request('GET', url, headers=headers or {})
+            response = conn.getresponse()
+            return response, response.read()
+        finally:
+            conn.close()
+
+    def testXMLRPC(self):
+        client = XMLRPCProxyController('http://127.0.0.1:%d' % self.port)
+        player = Player('Asynkroninen')
+        client.register_player(player)
+        client.create_game()
+        client.start_game_with_bots()
+        events = client.get_events(player.id)
+        self.assertTrue(len(events) > 0)
+        self.assertTrue(isinstance(events[0], Event))
+        self.assertEqual(len(client.get_state(player.id)['hand']), 13)
+        client.player_quit(player.id)
+
+    def testJSON(self):
+        response, data = self._get('/api/hello')
+        self.assertEqual(response.status, 200)
+        self.assertTrue('version' in json.loads(data.decode()))
+        response, data = self._get('/api/nosuchmethod')
+        self.assertEqual(response.status, 404)
+        response, data = self._get('/api/get_events?akey="invalid"')
+        self.assertEqual(response.status, 403)
+        self.assertEqual(json.loads(data.decode())['message'], 'Invalid authentication key')
+        self.assertEqual(response.getheader('X-Error-Message'), 'Invalid authentication key')
+
+    def testSlowClient(self):
+        # a client that never finishes its request does not block others
+        slow = socket.create_connection(('127.0.0.1', self.port))
+        try:
+            slow.sendall(b'GET /api/hello HTTP/1.1\r\n')
+            response, _ = self._get('/api/hello')
+            self.assertEqual(response.status, 200)
+        finally:
+            slow.close()
+
+    def testLongPoll(self):
+        iface = self.server.instance
+        p_data = iface.player_register(rpc.rpc_encode(Player('Odottaja')))
+        player = iface._get_player(p_data['id'])
+        url = '/api/get_events?akey="%s"&timeout=5' % p_data['akey']
+        timer = threading.Timer(0.3, player.send_message, ('', 'hello'))
+        timer.start()
+        start = time.time()
+        response, data = self._get(url)
+        self.assertTrue(time.time() - start < 4)
+        self.assertEqual(json.loads(data.decode())[0]['message'], 'hello')
+        timer.join()
+
+        # other requests are served while waiting
+        result = []
+        thread = threading.Thread(target=lambda: result.append(
+            self._get(url.replace('timeout=5', 'timeout=2'))))
+        thread.start()
+        response, _ = self._get('/api/hello')
+        self.assertEqual(response.status, 200)
+        self.assertTrue(thread.is_alive())
+        thread.join()
+        self.assertEqual(json.loads(result[0][1].decode()), [])
+
+    def testLockedInterface(self):
+        # a call waiting for the interface lock does not block the others
+        result = []
+        with self.server.instance.lock:
+            thread = threading.Thread(target=lambda: result.append(self._get('/api/hello')))
+            thread.start()
+            time.sleep(0.2)
+            response, _ = self._get('/nosuchpage')
+            self.assertEqual(response.status, 404)
+            self.assertEqual(result, [])
+        thread.join()
+        self.assertEqual(result[0][0].status, 200)
+
+    def testBadRequest(self):
+        conn = socket.create_connection(('127.0.0.1', self.port))
+        try:
+            conn.sendall(b'garbage\r\n\r\n')
+            self.assertTrue(conn.recv(1024).startswith(b'HTTP/1.1 400'))
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
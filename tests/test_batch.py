@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import unittest
+import random
+try:
+    import numpy as np
+    from tupelo import batch
+except ImportError:
+    np = None
+from tupelo.common import BitCardSet
+from tupelo.game import GameController
+from tupelo.players import DummyBotPlayer
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class TestBatchGame(unittest.TestCase):
+
+    def testRanks(self):
+        ranks = np.array([[False] * 13, [True] + [False] * 11 + [True]])
+        top, found = batch.highest_rank(ranks)
+        self.assertEqual(list(found), [False, True])
+        self.assertEqual(top[1], 12)
+        top, found = batch.highest_rank(ranks, roof=np.array([5, 5]))
+        self.assertEqual(top[1], 0)
+        bottom, found = batch.lowest_rank(ranks, floor=np.array([5, 5]))
+        self.assertEqual(bottom[1], 12)
+
+    def testPlayHand(self):
+        game = batch.BatchGame(20, [batch.RandomPolicy(np.random.default_rng(1))] * 4,
+                seed=1)
+        result = game.play_hand()
+        self.assertTrue((result['tricks'].sum(axis=1) == 13).all())
+        self.assertFalse(game.hands.any())
+        # every card is played exactly once
+        plays = np.sort(result['plays'].reshape(20, 52), axis=1)
+        self.assertTrue((plays == np.arange(52)).all())
+
+    def testPlayGames(self):
+        game = batch.BatchGame(10, [batch.DummyPolicy()] * 4, seed=2)
+        winners = game.play_games(max_hands=2000)
+        self.assertEqual(len(winners), 10)
+        for i, winner in enumerate(winners):
+            if winner >= 0:
+                self.assertTrue(game.final_score[i, winner] > batch.WIN_SCORE)
+
+    def testSameAsGameController(self):
+        count = 30
+        hands = np.zeros((count, 4, 52), dtype=bool)
+        expected = []
+        for i in range(count):
+            # deal like GameController does with the same seed
+            cardsets = [BitCardSet() for _ in range(4)]
+            BitCardSet.new_full_deck().deal(cardsets, random.Random(i))
+            for seat, cset in enumerate(cardsets):
+                for card in cset:
+                    hands[i, seat, card.index] = True
+
+            game = GameController(random.Random(i))
+            for seat in range(4):
+                game.register_player(DummyBotPlayer('Robotti %d' % seat))
+            expected.append(game.run_headless(max_hands=1).hands[0])
+
+        game = batch.BatchGame(count, [batch.DummyPolicy()] * 4)
+        game.deal(hands)
+        result = game.play_hand()
+        for i, hand in enumerate(expected):
+            self.assertEqual(list(result['tricks'][i]), hand.tricks)
+            self.assertEqual(result['mode'][i], hand.mode)
+            self.assertEqual(result['winner'][i], hand.winner)
+            self.assertEqual(result['score'][i], hand.score)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import unittest
+import json
+import threading
+from tupelo import binary, rpc
+from tupelo.common import Card, PlayedCard, BitCardSet, GameState, ProtocolError, \
+        HEART, SPADE, CLUB, TURN_NONE
+from tupelo.events import EventList, Event, CardPlayedEvent, MessageEvent, \
+        TrickPlayedEvent, TurnEvent, StateChangedEvent
+from tupelo.players import Player
+
+def _state():
+    state = GameState()
+    state.status = GameState.ONGOING
+    state.table.append(PlayedCard(Card(HEART, 5), 'abc'))
+    state.table.append(PlayedCard(Card(HEART, 14), 'def'))
+    state.score = [12, 0]
+    state.tricks = [3, 4]
+    state.turn = TURN_NONE
+    state.turn_id = 'ghi'
+    return state
+
+def _events():
+    player = Player('Mörkö')
+    player.id = 'abc'
+    player.team = 1
+    events = EventList()
+    events.append(Event())
+    events.append(CardPlayedEvent())
+    events.append(CardPlayedEvent(player, PlayedCard(Card(CLUB, 2), 'abc'), _state()))
+    events.append(MessageEvent('', 'Team 1 takes this trick'))
+    events.append(MessageEvent(None, 'x' * 1000))
+    events.append(TrickPlayedEvent(player, _state()))
+    events.append(TurnEvent(GameState()))
+    events.append(StateChangedEvent(_state()))
+    return events
+
+
+class TestBinary(unittest.TestCase):
+
+    def testEvents(self):
+        encoded = rpc.rpc_encode(_events())
+        data = binary.encode_events(encoded)
+        self.assertEqual(binary.decode_events(data), encoded)
+        # much smaller than JSON
+        cards = [event for event in encoded if event['type'] == CardPlayedEvent.type]
+        self.assertTrue(len(binary.encode_events(cards)) < len(json.dumps(cards)) / 4)
+        decoded = rpc.rpc_decode(EventList, binary.decode_events(data))
+        self.assertEqual(decoded[2].card, Card(CLUB, 2))
+        self.assertEqual(decoded[2].card.played_by, 'abc')
+        self.assertEqual(decoded[2].player.player_name, 'Mörkö')
+
+    def testEmptyEvents(self):
+        self.assertEqual(binary.decode_events(binary.encode_events([])), [])
+
+    def testState(self):
+        hand = BitCardSet([Card(SPADE, 2), Card(HEART, 14), Card(CLUB, 10)])
+        response = {'game_state': rpc.rpc_encode(_state()),
+                'hand': rpc.rpc_encode(hand)}
+        data = binary.encode_state(response)
+        self.assertEqual(binary.decode_state(data), response)
+
+    def testIntegerIds(self):
+        ids = [0, -1, 2**31 - 1, -2**31, 2**31, -2**31 - 1, 2**64, -2**100]
+        encoded = [rpc.rpc_encode(MessageEvent(player_id, player_id))
+                   for player_id in ids]
+        data = binary.encode_events(encoded)
+        self.assertEqual(binary.decode_events(data), encoded)
+        self.assertRaises(ProtocolError, binary.decode_events, data[:-1])
+
+    def testInvalid(self):
+        data = binary.encode_events(rpc.rpc_encode(_events()))
+        self.assertRaises(ProtocolError, binary.decode_events, data[:-1])
+        self.assertRaises(ProtocolError, binary.decode_events, bytes((binary.VERSION + 1,)))
+        self.assertRaises(ProtocolError, binary.decode_state, b'\x01\x00')
+
+
+class TestBinaryAPI(unittest.TestCase):
+
+    def testClient(self):
+        from tupelo.server import TupeloServer
+        from tupelo.xmlrpc import XMLRPCProxyController
+        server = TupeloServer(('127.0.0.1', 0), logRequests=False)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            uri = 'http://127.0.0.1:%d' % server.server_address[1]
+            client = XMLRPCProxyController(uri, use_binary=True)
+            player = Player('Binääri')
+            client.register_player(player)
+            client.create_game()
+            client.start_game_with_bots()
+            events = client.get_events(player.id)
+            self.assertTrue(len(events) > 0)
+            self.assertTrue(isinstance(events[0], Event))
+            state = client.get_state(player.id)
+            self.assertEqual(len(state['hand']), 13)
+            client.use_binary = False
+            self.assertEqual(client.get_state(player.id), state)
+            client.player_quit(player.id)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import unittest
+import json
+import threading
+import http.client
+from tupelo import rpc
+from tupelo.server import TupeloServer, AsyncTupeloServer
+from tupelo.server.cache import ResponseCache, etag_matches
+from tupelo.players import Player
+from tupelo.common import GameState
+
+class TestResponseCache(unittest.TestCase):
+
+    def testGet(self):
+        cache = ResponseCache(size=2)
+        calls = []
+        def compute(value):
+            def _compute():
+                calls.append(value)
+                return value
+            return _compute
+
+        self.assertEqual(cache.get('a', 1, compute('a1')), ('a1', True))
+        self.assertEqual(cache.get('a', 1, compute('x')), ('a1', False))
+        # a new version replaces the old one
+        self.assertEqual(cache.get('a', 2, compute('a2')), ('a2', True))
+        cache.get('b', 1, compute('b1'))
+        cache.get('c', 1, compute('c1'))
+        # 'a' was the least recently used
+        self.assertEqual(cache.get('a', 2, compute('a2')), ('a2', True))
+        self.assertEqual(calls, ['a1', 'a2', 'b1', 'c1', 'a2'])
+
+    def testError(self):
+        cache = ResponseCache()
+        def fail():
+            raise ValueError('failed')
+        self.assertRaises(ValueError, cache.get, 'a', 1, fail)
+        self.assertEqual(cache.get('a', 1, lambda: 'a1'), ('a1', True))
+
+    def testCoalesce(self):
+        cache = ResponseCache()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'value'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('a', 1, compute)))
+                for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('value', False)] * 3 + [('value', True)])
+
+    def testETag(self):
+        cache = ResponseCache()
+        etag = cache.etag('a', 1)
+        self.assertEqual(etag, cache.etag('a', 1))
+        self.assertNotEqual(etag, cache.etag('a', 2))
+        self.assertNotEqual(etag, ResponseCache().etag('a', 1))
+        self.assertTrue(etag_matches(etag, etag))
+        self.assertTrue(etag_matches('"x", W/%s' % etag, etag))
+        self.assertTrue(etag_matches('*', etag))
+        self.assertFalse(etag_matches(None, etag))
+        self.assertFalse(etag_matches('"x"', etag))
+
+
+class _ConditionalTests():
+    """
+    Conditional GET tests run against both server classes.
+    """
+    server_class = None
+
+    def setUp(self):
+        self.server = self.server_class(('127.0.0.1', 0), logRequests=False)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.port = self.server.server_address[1]
+        self.iface = self.server.instance
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _get(self, url, headers=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            conn.request('GET', url, headers=headers or {})
+            response = conn.getresponse()
+            return response, response.read()
+        finally:
+            conn.close()
+
+    def _register(self, name):
+        return self.iface.player_register(rpc.rpc_encode(Player(name)))
+
+    def testConditionalGet(self):
+        p_data = self._register('Ehdollinen')
+        game_id = self.iface.game_create(p_data['akey'])
+        response, data = self._get('/api/game/list')
+        etag = response.getheader('ETag')
+        self.assertTrue(etag)
+        self.assertTrue(game_id in json.loads(data.decode()))
+
+        response, data = self._get('/api/game/list', {'If-None-Match': etag})
+        self.assertEqual(response.status, 304)
+        self.assertEqual(data, b'')
+        self.assertEqual(response.getheader('ETag'), etag)
+
+        # a player joining changes the list
+        self.iface.game_enter(self._register('Toinen')['akey'], game_id)
+        response, data = self._get('/api/game/list', {'If-None-Match': etag})
+        self.assertEqual(response.status, 200)
+        self.assertNotEqual(response.getheader('ETag'), etag)
+        self.assertEqual(len(json.loads(data.decode())[game_id]), 2)
+
+        url = '/api/game/get_info?game_id=%s' % game_id
+        response, data = self._get(url)
+        info_etag = response.getheader('ETag')
+        response, data = self._get(url, {'If-None-Match': info_etag})
+        self.assertEqual(response.status, 304)
+
+        # unversioned calls have no ETag
+        response, data = self._get('/api/hello')
+        self.assertEqual(response.getheader('ETag'), None)
+
+    def testGetState(self):
+        p_data = self._register('Tila')
+        game_id = self.iface.game_create(p_data['akey'])
+        url = '/api/game/get_state?game_id=%s' % game_id
+        cookie = 'akey=%s' % p_data['akey']
+        response, data = self._get(url, {'Cookie': cookie})
+        self.assertEqual(response.status, 200)
+        etag = response.getheader('ETag')
+        player = self.iface._get_player(p_data['id'])
+        player.state_deltas.reset(None)
+        player.last_activity = 0
+        response, data = self._get(url, {'Cookie': cookie, 'If-None-Match': etag})
+        self.assertEqual(response.status, 304)
+        # the cached state keeps the session alive
+        self.assertTrue(player.last_activity > 0)
+        # the delta base is reset also when the cached state is sent
+        self.assertEqual(player.state_deltas.base['version'],
+                self.iface._get_game(game_id).version)
+
+        # another player gets another ETag
+        other = self._register('Toinen')
+        self.iface.game_enter(other['akey'], game_id)
+        response, data = self._get(url, {'Cookie': cookie})
+        self.assertNotEqual(response.getheader('ETag'), etag)
+        response, data = self._get(url, {'Cookie': 'akey=%s' % other['akey']})
+        self.assertNotEqual(response.getheader('ETag'), etag)
+
+    def testFinalState(self):
+        players = [self._register('Pelaaja %d' % i) for i in range(4)]
+        game_id = self.iface.game_create(players[0]['akey'])
+        for p_data in players[1:]:
+            self.iface.game_enter(p_data['akey'], game_id)
+        game = self.iface._get_game(game_id)
+        akeys = dict((p_data['id'], p_data['akey']) for p_data in players)
+        url = '/api/game/get_state?game_id=%s' % game_id
+        headers = {'Cookie': 'akey=%s' % players[0]['akey']}
+
+        # a client asks for the state while the players see a trick
+        proxy = self.iface._get_player(players[0]['id'])
+        trick_played = proxy.trick_played
+        def fetching_trick_played(*args):
+            trick_played(*args)
+            self.server.api_dispatch(url, headers)
+        proxy.trick_played = fetching_trick_played
+
+        self.iface.game_start(players[0]['akey'], game_id)
+        while not game.shutdown_event.is_set():
+            player = game.get_player(game.state.turn_id)
+            cards = player.hand
+            if game.state.status == GameState.ONGOING and game.state.table:
+                cards = player.hand.get_cards(suit=game.state.table[0].suit) or cards
+            self.iface.game_play_card(akeys[player.id], game_id,
+                    rpc.rpc_encode(list(cards)[0]))
+
+        _, response, _ = self.server.api_dispatch(url, headers)
+        state = json.loads(response.decode())['game_state']
+        self.assertEqual(state, json.loads(json.dumps(rpc.rpc_encode(game.state))))
+        self.assertEqual(state['table'], [])
+        self.assertTrue(max(state['score']) > 52)
+
+
+class TestConditionalThreaded(_ConditionalTests, unittest.TestCase):
+    server_class = TupeloServer
+
+
+class TestConditionalAsync(_ConditionalTests, unittest.TestCase):
+    server_class = AsyncTupeloServer
+
+
+if __name__ == '__main__':
+    unittest.main()
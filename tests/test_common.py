@@ -5,7 +5,7 @@
 import unittest
 from tupelo import rpc
 from tupelo import common
-from tupelo.common import Card, CardSet
+from tupelo.common import Card, CardSet, BitCardSet
 import threading
 import copy
 import time
@@ -56,6 +56,26 @@ class TestCommon(unittest.TestCase):
         self.assertTrue(isinstance(decoded, common.Card))
         self.assertEqual(card, decoded)
 
+    def testCardInterned(self):
+        card = Card(common.HEART, 5)
+        self.assertTrue(card is Card(common.HEART, 5))
+        self.assertTrue(copy.deepcopy(card) is card)
+        self.assertEqual(len(set(CardSet.new_full_deck())), 52)
+        self.assertRaises(AttributeError, setattr, card, 'value', 6)
+        self.assertRaises(ValueError, Card, common.HEART, 15)
+
+    def testPlayedCardRPC(self):
+        card = common.PlayedCard(Card(common.HEART, 5), 'abc')
+        self.assertEqual(card, Card(common.HEART, 5))
+        self.assertEqual(hash(card), hash(Card(common.HEART, 5)))
+        self.assertTrue(card.card is Card(common.HEART, 5))
+        encoded = rpc.rpc_encode(card)
+        self.assertEqual(encoded, {'suit': 3, 'value': 5, 'played_by': 'abc'})
+        decoded = rpc.rpc_decode(common.Card, encoded)
+        self.assertTrue(isinstance(decoded, common.PlayedCard))
+        self.assertEqual(decoded.played_by, 'abc')
+        self.assertEqual(decoded, card)
+
     def testCardSet(self):
         deck = CardSet.new_full_deck()
         self.assertTrue(len(deck) == 52)
@@ -114,6 +134,65 @@ class TestCommon(unittest.TestCase):
         sorted_cs.append(Card(common.HEART, 7))
         self.assertEqual(cs, sorted_cs)
 
+    def testBitCardSet(self):
+        deck = BitCardSet.new_full_deck()
+        self.assertEqual(len(deck), 52)
+        self.assertEqual(list(deck), sorted(CardSet.new_full_deck()))
+        for suit in common.ALL_SUITS:
+            cards = deck.get_cards(suit=suit)
+            self.assertEqual(len(cards), 13)
+            self.assertTrue(all(card.suit == suit for card in cards))
+
+        for i in range(2, 15):
+            cards = deck.get_cards(value=i)
+            self.assertEqual(len(cards), 4)
+
+        card = Card(common.CLUB, 12)
+        self.assertTrue(card in deck)
+        self.assertEqual(deck.take(card), card)
+        self.assertFalse(card in deck)
+        self.assertRaises(ValueError, deck.take, card)
+        self.assertEqual(len(deck), 51)
+
+        deck.clear()
+        self.assertEqual(len(deck), 0)
+
+    def testBitCardSetHighestLowest(self):
+        for cls in (CardSet, BitCardSet):
+            cs = cls()
+            cs.append(Card(common.HEART, 5))
+            cs.append(Card(common.SPADE, 7))
+            cs.append(Card(common.HEART, 7))
+            cs.append(Card(common.CLUB, 11))
+            self.assertEqual(cs.get_highest(), Card(common.CLUB, 11))
+            self.assertEqual(cs.get_highest(roof=9), Card(common.SPADE, 7))
+            self.assertEqual(cs.get_highest(roof=2), None)
+            self.assertEqual(cs.get_lowest(), Card(common.HEART, 5))
+            self.assertEqual(cs.get_lowest(floor=6), Card(common.SPADE, 7))
+            self.assertEqual(cs.get_lowest(floor=6, roof=6), None)
+            self.assertEqual(cs.get_lowest(floor=12), None)
+
+    def testBitCardSetDealSub(self):
+        deck = BitCardSet.new_full_deck()
+        hands = [BitCardSet() for i in range(4)]
+        deck.deal(hands)
+        self.assertEqual(len(deck), 0)
+        for hand in hands:
+            self.assertEqual(len(hand), 13)
+
+        rest = BitCardSet.new_full_deck() - hands[0]
+        self.assertEqual(len(rest), 39)
+        self.assertEqual(len(rest - CardSet(hands[1])), 26)
+        for card in hands[0]:
+            self.assertFalse(card in rest)
+
+    def testBitCardSetRPC(self):
+        cs = BitCardSet([Card(common.HEART, 5), Card(common.SPADE, 14)])
+        encoded = rpc.rpc_encode(cs)
+        self.assertEqual(encoded, [{'suit': 0, 'value': 14}, {'suit': 3, 'value': 5}])
+        self.assertEqual(rpc.rpc_decode(BitCardSet, encoded), cs)
+        self.assertEqual(rpc.rpc_decode(CardSet, encoded), cs)
+
     def testGameStateRPC(self):
         gs = common.GameState()
         gs.table.append(Card(common.HEART, 5))
@@ -124,6 +203,25 @@ class TestCommon(unittest.TestCase):
         self.assertEqual(len(gs2.table), len(gs.table))
         self.assertEqual(gs2.table, gs.table)
 
+    def testGameStateSnapshot(self):
+        gs = common.GameState()
+        gs.status = common.GameState.ONGOING
+        gs.table.append(common.PlayedCard(Card(common.HEART, 5), 'abc'))
+        gs.score = [4, 0]
+        gs.turn_id = 'abc'
+        snapshot = common.GameStateSnapshot(gs)
+        self.assertEqual(rpc.rpc_encode(snapshot), rpc.rpc_encode(gs))
+        self.assertTrue(rpc.rpc_encode(snapshot) is rpc.rpc_encode(snapshot))
+        # later changes to the state do not show in the snapshot
+        gs.table.clear()
+        gs.score[0] = 8
+        self.assertEqual(len(snapshot.table), 1)
+        self.assertEqual(snapshot.score, (4, 0))
+        self.assertRaises(AttributeError, setattr, snapshot, 'turn', 2)
+        self.assertTrue(copy.deepcopy(snapshot) is snapshot)
+        gs2 = rpc.rpc_decode(common.GameState, rpc.rpc_encode(snapshot))
+        self.assertEqual(gs2.table[0].played_by, 'abc')
+
     def testShortUUID(self):
         suuid = common.short_uuid()
         self.assertTrue(isinstance(suuid, str))
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import unittest
+import json
+import zlib
+import gzip
+import threading
+import http.client
+from tupelo import rpc
+from tupelo.server import TupeloServer, AsyncTupeloServer
+from tupelo.server import compression, sse
+from tupelo.players import Player
+
+class TestCompression(unittest.TestCase):
+
+    def testAcceptedEncoding(self):
+        self.assertEqual(compression.accepted_encoding(None), None)
+        self.assertEqual(compression.accepted_encoding('identity'), None)
+        self.assertEqual(compression.accepted_encoding('gzip, deflate, br'), 'gzip')
+        self.assertEqual(compression.accepted_encoding('deflate'), 'deflate')
+        self.assertEqual(compression.accepted_encoding('gzip;q=0.5, deflate'), 'deflate')
+        self.assertEqual(compression.accepted_encoding('gzip;q=0, *'), 'deflate')
+        self.assertEqual(compression.accepted_encoding('*;q=0'), None)
+
+    def testResponseEncoding(self):
+        self.assertEqual(compression.response_encoding('gzip', 100, 1400), None)
+        self.assertEqual(compression.response_encoding('gzip', 1400, 1400), 'gzip')
+        self.assertEqual(compression.response_encoding('gzip', 1400, None), None)
+
+    def testCompress(self):
+        data = b'tupelo ' * 1000
+        self.assertEqual(gzip.decompress(compression.compress(data, 'gzip')), data)
+        self.assertEqual(zlib.decompress(compression.compress(data, 'deflate')), data)
+        for encoding in compression.ENCODINGS:
+            self.assertEqual(compression.decompress(compression.compress(data, encoding),
+                encoding, len(data)), data)
+        # raw deflate
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        raw = compressor.compress(data) + compressor.flush()
+        self.assertEqual(compression.decompress(raw, 'deflate', len(data)), data)
+
+    def testDecompressErrors(self):
+        data = compression.compress(b'x' * 1000, 'gzip')
+        self.assertRaises(ValueError, compression.decompress, data, 'gzip', 999)
+        self.assertRaises(ValueError, compression.decompress, b'garbage', 'gzip', 1000)
+        self.assertRaises(ValueError, compression.decompress, b'garbage', 'deflate', 1000)
+        self.assertRaises(ValueError, compression.decompress, data, 'br', 1000)
+
+    def testStreamCompressor(self):
+        compressor = compression.StreamCompressor('gzip')
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for part in (b'first', b'second'):
+            # each part can be decoded right away
+            self.assertEqual(decompressor.decompress(compressor.compress(part)), part)
+
+
+class _ServerTests():
+    """
+    Compression tests run against both server classes.
+    """
+    server_class = None
+
+    def setUp(self):
+        self.server = self.server_class(('127.0.0.1', 0), logRequests=False)
+        self.server.heartbeat_interval = 0.2
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _request(self, method, url, body=None, headers=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            conn.request(method, url, body=body, headers=headers or {})
+            response = conn.getresponse()
+            return response, response.read()
+        finally:
+            conn.close()
+
+    def testResponse(self):
+        for i in range(30):
+            p_data = self.server.instance.player_register(
+                    rpc.rpc_encode(Player('Pelaaja %d' % i)))
+        cookie = 'akey=%s' % p_data['akey']
+        response, data = self._request('GET', '/api/player/list',
+                headers={'Accept-Encoding': 'gzip', 'Cookie': cookie})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader('Content-Encoding'), 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(data).decode())), 30)
+
+        response, data = self._request('GET', '/api/player/list',
+                headers={'Accept-Encoding': 'deflate', 'Cookie': cookie})
+        self.assertEqual(response.getheader('Content-Encoding'), 'deflate')
+        self.assertEqual(len(json.loads(zlib.decompress(data).decode())), 30)
+
+        # small responses are not compressed
+        response, data = self._request('GET', '/api/hello',
+                headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.getheader('Content-Encoding'), None)
+        self.assertTrue('version' in json.loads(data.decode()))
+
+    def testRequestBody(self):
+        body = json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': 'echo',
+            'params': ['kaiku']}).encode()
+        for encoding in compression.ENCODINGS:
+            response, data = self._request('POST', '/jsonrpc',
+                    compression.compress(body, encoding), {'Content-Encoding': encoding})
+            self.assertEqual(response.status, 200)
+            self.assertEqual(json.loads(data.decode())['result'], 'kaiku')
+
+        response, data = self._request('POST', '/jsonrpc', b'garbage',
+                {'Content-Encoding': 'gzip'})
+        self.assertEqual(response.status, 400)
+
+    def testEventStream(self):
+        p_data = self.server.instance.player_register(rpc.rpc_encode(Player('Virta')))
+        player = self.server.instance._get_player(p_data['id'])
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            conn.request('GET', '%s?akey=%s' % (sse.STREAM_PATH, p_data['akey']),
+                    headers={'Accept-Encoding': 'gzip'})
+            response = conn.getresponse()
+            self.assertEqual(response.getheader('Content-Encoding'), 'gzip')
+            player.send_message('', 'pakattu')
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data = b''
+            while b'pakattu' not in data:
+                data += decompressor.decompress(response.read1())
+            self.assertTrue(data.startswith(sse.STREAM_START))
+        finally:
+            conn.close()
+
+
+class TestServerThreaded(_ServerTests, unittest.TestCase):
+    server_class = TupeloServer
+
+
+class TestServerAsync(_ServerTests, unittest.TestCase):
+    server_class = AsyncTupeloServer
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import unittest
+import time
+import threading
+from tupelo import rpc
+from tupelo.server import eventqueue
+from tupelo.server.eventqueue import EventQueue
+from tupelo.server import TupeloRPCInterface
+from tupelo.events import Event, MessageEvent, StateChangedEvent, ResyncEvent, EventType
+from tupelo.players import Player
+
+class TestEventQueue(unittest.TestCase):
+
+    def _fill(self, queue, events):
+        for seq, event in enumerate(events, 1):
+            queue.put(seq, event)
+
+    def testGetAll(self):
+        queue = EventQueue()
+        self.assertEqual(queue.get_all(), [])
+        start = time.time()
+        self.assertEqual(queue.get_all(0.1), [])
+        self.assertTrue(time.time() - start >= 0.1)
+        event = MessageEvent('', 'hello')
+        threading.Timer(0.1, queue.put, (1, event)).start()
+        self.assertEqual(queue.get_all(5), [(1, event)])
+        self.assertTrue(queue.empty())
+
+    def testCoalesce(self):
+        queue = EventQueue(5, eventqueue.COALESCE)
+        msg = MessageEvent('', 'viesti')
+        self._fill(queue, [StateChangedEvent(), StateChangedEvent(), msg,
+            StateChangedEvent()])
+        # a state change replaces the one right before it
+        self.assertEqual([seq for seq, _ in queue.get_all()], [2, 3, 4])
+
+        self._fill(queue, [StateChangedEvent(), MessageEvent(), StateChangedEvent(),
+            MessageEvent(), StateChangedEvent(), MessageEvent()])
+        # the full queue dropped the superseded state changes
+        self.assertEqual([seq for seq, _ in queue.get_all()], [2, 4, 5, 6])
+        stats = queue.stats()
+        self.assertEqual(stats['coalesced'], 3)
+        self.assertEqual(stats['dropped'], 0)
+
+        self._fill(queue, [MessageEvent() for _ in range(7)])
+        self.assertEqual([seq for seq, _ in queue.get_all()], [3, 4, 5, 6, 7])
+        self.assertEqual(queue.stats()['dropped'], 2)
+
+    def testDropOldest(self):
+        queue = EventQueue(3, eventqueue.DROP_OLDEST)
+        self._fill(queue, [StateChangedEvent() for _ in range(5)])
+        self.assertEqual([seq for seq, _ in queue.get_all()], [3, 4, 5])
+        stats = queue.stats()
+        self.assertEqual((stats['dropped'], stats['coalesced'], stats['max_depth']), (2, 0, 3))
+
+    def testResync(self):
+        queue = EventQueue(3, eventqueue.RESYNC)
+        self._fill(queue, [MessageEvent() for _ in range(4)])
+        self.assertTrue(queue.lagging)
+        items = queue.get_all()
+        self.assertEqual([seq for seq, _ in items], [3, 4])
+        self.assertTrue(isinstance(items[0][1], ResyncEvent))
+        self.assertFalse(queue.lagging)
+        stats = queue.stats()
+        self.assertEqual((stats['dropped'], stats['resyncs']), (3, 1))
+
+    def testInvalid(self):
+        self.assertRaises(ValueError, EventQueue, 10, 'nosuchpolicy')
+        self.assertRaises(ValueError, EventQueue, 1)
+
+    def testResyncEvent(self):
+        event = rpc.rpc_decode(Event, rpc.rpc_encode(ResyncEvent()))
+        self.assertTrue(isinstance(event, ResyncEvent))
+        self.assertEqual(event.type, EventType.RESYNC)
+
+
+class TestPlayerQueues(unittest.TestCase):
+
+    def testPlayerEvents(self):
+        iface = TupeloRPCInterface()
+        iface.event_queue_size = 2
+        iface.event_queue_policy = eventqueue.DROP_OLDEST
+        p_data = iface.player_register(rpc.rpc_encode(Player('Jono')))
+        player = iface._get_player(p_data['id'])
+        for i in range(5):
+            player.send_message('', str(i))
+        info = iface.player_events_info(p_data['akey'])
+        self.assertEqual(info[p_data['id']]['depth'], 2)
+        self.assertEqual(info[p_data['id']]['dropped'], 3)
+        self.assertEqual([e.message for e in player.pop_events()], ['3', '4'])
+
+    def testReplayGaps(self):
+        from tupelo.server.server import RPCProxyPlayer
+        player = RPCProxyPlayer('Aukko', EventQueue(2, eventqueue.DROP_OLDEST))
+        for i in range(4):
+            player.send_message('', str(i))
+        self.assertEqual([seq for seq, _ in player.pop_sequenced_events()], [3, 4])
+        player.send_message('', '4')
+        player.pop_events()
+        self.assertEqual([seq for seq, _ in player.replay_events(3)], [4, 5])
+        # the dropped events can not be replayed
+        self.assertEqual(player.replay_events(1), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
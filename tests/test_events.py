@@ -80,6 +80,87 @@ class TestEventsRPC(unittest.TestCase):
         for i in range(0, num):
             self.assertEqual(el[i], el2[i])
 
+    def testUnknownEventType(self):
+        self.assertRaises(common.ProtocolError, rpc.rpc_decode, events.Event,
+                {'type': 99})
+        self.assertRaises(common.ProtocolError, rpc.rpc_decode, events.Event, {})
+
+    def testEventTypes(self):
+        self.assertTrue(events.event_types.lookup(events.EventType.TURN) is
+                events.TurnEvent)
+        self.assertTrue(events.event_types.lookup(events.EventType.NONE) is
+                events.Event)
+
+
+class TestStateDeltas(unittest.TestCase):
+
+    def _events(self):
+        plr = players.Player('Seppo')
+        plr.id = 'abc'
+        state = common.GameState()
+        state.status = common.GameState.ONGOING
+        elist = events.EventList()
+        for value in range(2, 6):
+            card = common.PlayedCard(common.Card(common.HEART, value), 'abc')
+            state.table.append(card)
+            state.turn = (state.turn + 1) % 4
+            state.version += 1
+            elist.append(events.CardPlayedEvent(plr, card,
+                common.GameStateSnapshot(state)))
+        elist.append(events.MessageEvent('', 'hello'))
+        state.table.clear()
+        state.tricks[0] += 1
+        state.version += 1
+        elist.append(events.TrickPlayedEvent(plr, common.GameStateSnapshot(state)))
+        return elist
+
+    def testRoundTrip(self):
+        elist = self._events()
+        encoder = events.StateDeltaEncoder()
+        rpcevents = encoder.encode(elist)
+        self.assertTrue('game_state' in rpcevents[0])
+        self.assertEqual(set(rpcevents[1]['state_delta']),
+                set(['table', 'turn', 'version', 'base']))
+        # the shared encoded events are not modified
+        self.assertTrue('game_state' in rpc.rpc_encode(elist[1]))
+
+        decoder = events.StateDeltaDecoder(self.fail)
+        decoded = decoder.decode(rpcevents)
+        self.assertEqual(len(decoded), len(elist))
+        for event, orig in zip(decoded, elist):
+            self.assertEqual(rpc.rpc_encode(getattr(event, 'game_state', None)),
+                    rpc.rpc_encode(getattr(orig, 'game_state', None)))
+
+    def testResync(self):
+        elist = self._events()
+        encoder = events.StateDeltaEncoder()
+        encoder.encode(elist[:2])
+        resyncs = []
+        def _resync():
+            resyncs.append(True)
+            return rpc.rpc_encode(elist[-1].game_state)
+
+        # the decoder missed the first events
+        decoder = events.StateDeltaDecoder(_resync)
+        decoded = decoder.decode(encoder.encode(elist[2:]))
+        self.assertEqual(len(resyncs), 1)
+        self.assertEqual(decoded[-1].game_state.tricks, [1, 0])
+        self.assertEqual(decoder.state['version'], elist[-1].game_state.version)
+
+    def testResetBase(self):
+        state = common.GameState()
+        state.status = common.GameState.ONGOING
+        encoder = events.StateDeltaEncoder()
+        encoder.reset(rpc.rpc_encode(state))
+        # the game changes the score and tricks in place
+        state.score[1] += 8
+        state.tricks[0] += 1
+        state.version += 1
+        rpcevents = encoder.encode([events.StateChangedEvent(common.GameStateSnapshot(state))])
+        delta = rpcevents[0]['state_delta']
+        self.assertEqual(delta['score'], [0, 8])
+        self.assertEqual(delta['tricks'], [1, 0])
+
 
 if __name__ == '__main__':
     unittest.main()
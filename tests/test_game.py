@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import unittest
+import random
+from tupelo.game import GameController, GameResult
+from tupelo.players import DummyBotPlayer, CountingBotPlayer
+from tupelo.common import GameState, GameError
+
+class TestGameController(unittest.TestCase):
+
+    def _headless_game(self, seed):
+        game = GameController(random.Random(seed))
+        for i in range(4):
+            cls = CountingBotPlayer if i % 2 else DummyBotPlayer
+            game.register_player(cls('Robotti %d' % i))
+        return game
+
+    def testHeadlessGame(self):
+        game = self._headless_game(1)
+        result = game.run_headless(max_hands=500)
+        self.assertTrue(isinstance(result, GameResult))
+        self.assertEqual(game.state.status, GameState.STOPPED)
+        self.assertTrue(len(result.hands) > 0)
+        for hand in result.hands:
+            self.assertEqual(sum(hand.tricks), 13)
+        if result.winner is not None:
+            self.assertTrue(result.score[result.winner] > 52)
+        # no player threads were started, and no state copies were made
+        for player in game.players:
+            self.assertFalse(player.is_alive())
+            self.assertTrue(player.game_state is game.state)
+
+    def testHeadlessReproducible(self):
+        result1 = self._headless_game(42).run_headless(max_hands=10)
+        result2 = self._headless_game(42).run_headless(max_hands=10)
+        self.assertEqual([h.tricks for h in result1.hands],
+                [h.tricks for h in result2.hands])
+        self.assertEqual(result1.score, result2.score)
+
+    def testSharedEvents(self):
+        from tupelo.server.server import RPCProxyPlayer
+        game = self._headless_game(3)
+        proxies = [RPCProxyPlayer('Proxy %d' % i) for i in range(2)]
+        for proxy in proxies:
+            game.players.append(proxy)
+        game.state.status = GameState.VOTING
+        game._notify('state_changed')
+        events = [proxy.pop_events() for proxy in proxies]
+        self.assertTrue(events[0][0] is events[1][0])
+        self.assertTrue(events[0][0].game_state is events[1][0].game_state)
+        self.assertEqual(events[0][0].game_state.status, GameState.VOTING)
+
+    def testVersion(self):
+        game = GameController()
+        changed = []
+        game.players_hook = changed.append
+        versions = [game.version]
+        for i in range(3):
+            game.register_player(DummyBotPlayer('Robotti %d' % i))
+            versions.append(game.version)
+        game.player_leave(game.players[0].id)
+        versions.append(game.version)
+        # a reset keeps the version increasing
+        game.state.status = GameState.VOTING
+        game.player_leave(game.players[0].id)
+        versions.append(game.version)
+        self.assertEqual(game.players, [])
+        self.assertEqual(versions, sorted(set(versions)))
+        self.assertEqual(len(changed), 6)
+
+    def testHeadlessNotEnoughPlayers(self):
+        game = GameController()
+        game.register_player(DummyBotPlayer('Robotti'))
+        self.assertRaises(GameError, game.run_headless)
+
+
+if __name__ == '__main__':
+    unittest.main()
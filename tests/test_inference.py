@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import unittest
+import random
+from tupelo.common import Card, PlayedCard, GameState, SPADE, CLUB, HEART, FULL_MASK
+from tupelo.game import GameController
+from tupelo.inference import CardInference, sample_hands
+from tupelo.players import CountingBotPlayer, DummyBotPlayer
+
+class _CheckingBot(CountingBotPlayer):
+    """
+    Bot that checks its inference against the real hands.
+    """
+    checks = 0
+
+    def card_played(self, player, card, game_state):
+        super().card_played(player, card, game_state)
+        for plr in self.controller.players if self.controller else []:
+            hand = plr.hand.mask
+            possible = self.inference.possible_mask(plr.id)
+            assert hand & ~possible == 0, (plr, card)
+            assert self.inference.known_mask(plr.id) & ~hand == 0
+            if game_state.status == GameState.ONGOING:
+                assert self.inference.cards_left(plr.id) == len(plr.hand)
+            _CheckingBot.checks += 1
+
+
+class TestCardInference(unittest.TestCase):
+
+    def _state(self, *table):
+        state = GameState()
+        state.status = GameState.ONGOING
+        for card, player_id in table:
+            state.table.append(PlayedCard(card, player_id))
+        return state
+
+    def testVoid(self):
+        hearts = 0
+        for value in range(2, 15):
+            hearts |= 1 << Card(HEART, value).index
+        inference = CardInference('me', hearts)
+        state = self._state((Card(SPADE, 5), 'a'), (Card(CLUB, 7), 'b'))
+        inference.card_played('a', Card(SPADE, 5), self._state((Card(SPADE, 5), 'a')))
+        inference.card_played('b', Card(CLUB, 7), state)
+        self.assertTrue(inference.is_void('b', SPADE))
+        self.assertFalse(inference.is_void('a', SPADE))
+        self.assertFalse(inference.is_void('b', CLUB))
+        self.assertEqual(inference.cards_left('b'), 12)
+        self.assertEqual(inference.cards_left('c'), 13)
+        self.assertFalse(inference.possible_mask('a') & (1 << Card(SPADE, 5).index))
+        self.assertFalse(inference.possible_mask('c') & hearts)
+        self.assertEqual(inference.unseen, FULL_MASK & ~hearts &
+                ~(1 << Card(SPADE, 5).index) & ~(1 << Card(CLUB, 7).index))
+
+    def testVotingCard(self):
+        inference = CardInference('me', 0)
+        state = GameState()
+        state.status = GameState.VOTING
+        card = Card(HEART, 9)
+        inference.card_played('a', card, state)
+        self.assertEqual(inference.known_mask('a'), 1 << card.index)
+        self.assertFalse(inference.possible_mask('b') & (1 << card.index))
+        self.assertTrue(inference.unseen & (1 << card.index))
+
+    def testSampleHands(self):
+        rng = random.Random(1)
+        spades = (1 << 13) - 1
+        possible = [FULL_MASK & ~spades, FULL_MASK, FULL_MASK & ~(spades << 13)]
+        for _ in range(20):
+            hands = sample_hands(possible, [20, 16, 16], rng)
+            self.assertEqual([bin(h).count('1') for h in hands], [20, 16, 16])
+            self.assertEqual(hands[0] | hands[1] | hands[2], FULL_MASK)
+            for hand, poss in zip(hands, possible):
+                self.assertEqual(hand & ~poss, 0)
+
+    def testHeadlessGame(self):
+        _CheckingBot.checks = 0
+        game = GameController(random.Random(4))
+        for i in range(4):
+            cls = _CheckingBot if i % 2 else DummyBotPlayer
+            game.register_player(cls('Bot %d' % i))
+        game.run_headless(max_hands=5)
+        self.assertTrue(_CheckingBot.checks > 0)
+        for plr in game.players[1::2]:
+            # the counting bot knows the unplayed cards
+            unplayed = 0
+            for other in game.players:
+                unplayed |= other.hand.mask
+            self.assertEqual(plr.cards_left.mask, unplayed & ~plr.hand.mask)
+
+
+if __name__ == '__main__':
+    unittest.main()
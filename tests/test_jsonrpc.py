@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import unittest
+import json
+import threading
+import http.client
+import xmlrpc.client
+from tupelo import rpc
+from tupelo.server import TupeloServer, AsyncTupeloServer
+from tupelo.server import jsonapi
+from tupelo.xmlrpc import XMLRPCProxyController, XMLRPCCliPlayer
+from tupelo.players import Player
+from tupelo.common import GameError, GameState, CardSet
+
+class _BatchTests():
+    """
+    JSON-RPC and multicall tests run against both server classes.
+    """
+    server_class = None
+
+    def setUp(self):
+        self.server = self.server_class(('127.0.0.1', 0), logRequests=False)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.port = self.server.server_address[1]
+        self.uri = 'http://127.0.0.1:%d' % self.port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _post(self, request):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            body = request if isinstance(request, bytes) else json.dumps(request).encode()
+            conn.request('POST', '/jsonrpc', body, {'Content-type': 'application/json'})
+            response = conn.getresponse()
+            data = response.read()
+            return response.status, json.loads(data.decode()) if data else None
+        finally:
+            conn.close()
+
+    def testJSONRPC(self):
+        status, response = self._post({'jsonrpc': '2.0', 'id': 1, 'method': 'hello'})
+        self.assertEqual(status, 200)
+        self.assertEqual(response['id'], 1)
+        self.assertTrue('version' in response['result'])
+
+        p_data = self.iface_call('player_register', rpc.rpc_encode(Player('Erä')))
+        status, responses = self._post([
+            {'jsonrpc': '2.0', 'id': 1, 'method': 'game.create', 'params': [p_data['akey']]},
+            {'jsonrpc': '2.0', 'id': 2, 'method': 'game_list', 'params': {}},
+            {'jsonrpc': '2.0', 'id': 3, 'method': 'game.get_state',
+                'params': {'akey': 'invalid', 'game_id': 1}},
+            {'jsonrpc': '2.0', 'id': 4, 'method': 'nosuchmethod'},
+            {'jsonrpc': '2.0', 'id': 5, 'method': 'echo', 'params': [1, 2]},
+            {'jsonrpc': '2.0', 'method': 'echo', 'params': ['notification']},
+            {'id': 6, 'method': 'echo'},
+            ])
+        self.assertEqual(status, 200)
+        self.assertEqual([r['id'] for r in responses], [1, 2, 3, 4, 5, 6])
+        game_id = responses[0]['result']
+        self.assertTrue(str(game_id) in responses[1]['result'])
+        self.assertEqual(responses[2]['error']['code'], GameError.rpc_code)
+        self.assertEqual(responses[3]['error']['code'], jsonapi.JSONRPC_METHOD_NOT_FOUND)
+        self.assertEqual(responses[4]['error']['code'], jsonapi.JSONRPC_INVALID_PARAMS)
+        self.assertEqual(responses[5]['error']['code'], jsonapi.JSONRPC_INVALID_REQUEST)
+
+    def testJSONRPCErrors(self):
+        status, response = self._post(b'{not json')
+        self.assertEqual(response['error']['code'], jsonapi.JSONRPC_PARSE_ERROR)
+        status, response = self._post([])
+        self.assertEqual(response['error']['code'], jsonapi.JSONRPC_INVALID_REQUEST)
+        status, response = self._post([{'jsonrpc': '2.0', 'method': 'hello'}])
+        self.assertEqual(status, 204)
+        self.assertEqual(response, None)
+
+    def testMulticall(self):
+        server = xmlrpc.client.ServerProxy(self.uri)
+        multicall = xmlrpc.client.MultiCall(server)
+        multicall.hello()
+        multicall.game.get_state('invalid', 1)
+        multicall.echo('kaiku')
+        results = multicall()
+        self.assertTrue('version' in results[0])
+        with self.assertRaises(xmlrpc.client.Fault) as cm:
+            results[1]
+        self.assertEqual(cm.exception.faultCode, GameError.rpc_code)
+        self.assertEqual(results[2], 'kaiku')
+
+    def testEventsAndState(self):
+        client = XMLRPCProxyController(self.uri, use_delta=True)
+        player = Player('Niputtaja')
+        client.register_player(player)
+        self.assertEqual(client.get_events_and_state(player.id)[1], None)
+        client.create_game()
+        client.start_game_with_bots()
+        try:
+            events, state = client.get_events_and_state(player.id, 5)
+            self.assertTrue(len(events) > 0)
+            self.assertTrue(isinstance(state['game_state'], GameState))
+            self.assertTrue(isinstance(state['hand'], CardSet))
+            self.assertEqual(client.state_deltas.state['version'],
+                    state['game_state'].version)
+            client.player_quit(player.id)
+        finally:
+            self.server.shutdown_games()
+
+    def testWaitForTurn(self):
+        client = XMLRPCProxyController(self.uri)
+        player = XMLRPCCliPlayer('Vuorottelija')
+        player.echo = lambda *args, **kwargs: None
+        client.register_player(player)
+        client.create_game()
+        client.start_game_with_bots()
+        fetched = []
+        get_state = client.get_state
+        def counting_get_state(player_id):
+            fetched.append(player_id)
+            return get_state(player_id)
+        client.get_state = counting_get_state
+        batched = []
+        get_events_and_state = client.get_events_and_state
+        def counting_get_events_and_state(player_id, timeout=0):
+            batched.append(player_id)
+            return get_events_and_state(player_id, timeout)
+        client.get_events_and_state = counting_get_events_and_state
+        try:
+            player.wait_for_turn()
+            self.assertEqual(player.game_state.turn_id, player.id)
+            self.assertEqual(len(player.hand), 13)
+            # the hand comes with the events, not in a request of its own
+            self.assertEqual(fetched, [])
+            self.assertTrue(batched)
+            # the hand is known until it has been played
+            del batched[:]
+            while True:
+                voting = player.game_state.status == GameState.VOTING
+                table = player.game_state.table
+                cards = [card for card in player.hand
+                         if not table or card.suit == table[0].suit]
+                card = (cards or player.hand)[0]
+                client.play_card(player, card)
+                player.wait_for_turn()
+                if not voting:
+                    break
+                # the voted card stays in the hand
+                self.assertEqual(len(player.hand), 13)
+            self.assertNotIn(card, player.hand)
+            self.assertEqual(len(player.hand), 12)
+            self.assertEqual(batched, [])
+            self.assertEqual(fetched, [])
+            client.player_quit(player.id)
+        finally:
+            self.server.shutdown_games()
+
+    def iface_call(self, method, *args):
+        with self.server.instance.lock:
+            return getattr(self.server.instance, method)(*args)
+
+
+class TestBatchThreaded(_BatchTests, unittest.TestCase):
+    server_class = TupeloServer
+
+
+class TestBatchAsync(_BatchTests, unittest.TestCase):
+    server_class = AsyncTupeloServer
+
+
+if __name__ == '__main__':
+    unittest.main()
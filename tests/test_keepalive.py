@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import unittest
+import json
+import socket
+import threading
+import http.client
+import xmlrpc.client
+from tupelo.server import TupeloServer, AsyncTupeloServer
+from tupelo.server.server import TupeloRequestHandler
+
+class _KeepAliveTests():
+    """
+    Persistent connection tests run against both server classes.
+    """
+    server_class = None
+
+    def setUp(self):
+        self.server = self.server_class(('127.0.0.1', 0), logRequests=False)
+        self.configure(max_requests=3, timeout=0.5)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def configure(self, max_requests, timeout):
+        raise NotImplementedError()
+
+    def _connect(self):
+        return http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+
+    def _request(self, conn, method, url, body=None, headers=None):
+        conn.request(method, url, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response, response.read()
+
+    def testPersistent(self):
+        conn = self._connect()
+        try:
+            response, data = self._request(conn, 'GET', '/api/hello')
+            self.assertEqual(response.status, 200)
+            self.assertFalse(response.will_close)
+            sock = conn.sock
+            body = xmlrpc.client.dumps((), 'hello')
+            response, data = self._request(conn, 'POST', '/RPC2', body,
+                    {'Content-type': 'text/xml'})
+            self.assertEqual(response.status, 200)
+            self.assertTrue('version' in xmlrpc.client.loads(data)[0][0])
+            self.assertIs(conn.sock, sock)
+            # the last request of the connection
+            response, data = self._request(conn, 'GET', '/api/nosuchmethod')
+            self.assertEqual(response.status, 404)
+            self.assertTrue(response.will_close)
+            self.assertIsNone(conn.sock)
+            # http.client reconnects
+            response, data = self._request(conn, 'GET', '/api/hello')
+            self.assertTrue('version' in json.loads(data.decode()))
+        finally:
+            conn.close()
+
+    def testConnectionClose(self):
+        conn = self._connect()
+        try:
+            response, data = self._request(conn, 'GET', '/api/hello',
+                    headers={'Connection': 'close'})
+            self.assertEqual(response.status, 200)
+            self.assertTrue(response.will_close)
+        finally:
+            conn.close()
+
+    def testIdleTimeout(self):
+        conn = socket.create_connection(('127.0.0.1', self.port), timeout=10)
+        try:
+            conn.sendall(b'GET /api/hello HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            data = b''
+            while b'"version"' not in data:
+                data += conn.recv(4096)
+            # the server closes the connection after the idle timeout
+            self.assertEqual(conn.recv(4096), b'')
+        finally:
+            conn.close()
+
+
+class TestKeepAliveThreaded(_KeepAliveTests, unittest.TestCase):
+    server_class = TupeloServer
+
+    def configure(self, max_requests, timeout):
+        self.server.RequestHandlerClass = type('RequestHandler', (TupeloRequestHandler,),
+                {'max_requests': max_requests, 'timeout': timeout})
+
+
+class TestKeepAliveAsync(_KeepAliveTests, unittest.TestCase):
+    server_class = AsyncTupeloServer
+
+    def configure(self, max_requests, timeout):
+        self.server.max_requests = max_requests
+        self.server.idle_timeout = timeout
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,8 +3,10 @@
 
 import unittest
 import time
+import random
 from tupelo import players
-from tupelo.common import GameState
+from tupelo.common import GameState, NOLO, SUIT_BITS
+from tupelo.game import GameController
 
 class TestPlayers(unittest.TestCase):
 
@@ -45,5 +47,57 @@ class TestPlayers(unittest.TestCase):
         self.assertFalse(plr.is_alive())
 
 
+class TestISMCTSBotPlayer(unittest.TestCase):
+
+    def testSampleDeal(self):
+        rng = random.Random(3)
+        hand = (1 << 13) - 1
+        unseen = ((1 << 52) - 1) & ~hand & ~(1 << 20)
+        # seat 2 is void in the second suit
+        possible = [hand, unseen, unseen & ~(((1 << 13) - 1) << 13), unseen]
+        for _ in range(10):
+            hands = players.sample_deal(0, possible, [13, 12, 13, 13], rng)
+            self.assertEqual(hands[0], hand)
+            self.assertEqual([bin(h).count('1') for h in hands], [13, 12, 13, 13])
+            self.assertEqual(hands[1] | hands[2] | hands[3], unseen)
+            self.assertFalse(hands[1] & hands[2] or hands[2] & hands[3])
+            self.assertFalse(hands[2] & ~possible[2])
+
+    def testSearchLastTrick(self):
+        # one card each, the only move must be returned
+        hands = [1 << 0, 1 << 1, 1 << 2, 1 << 3]
+        unseen = hands[1] | hands[2] | hands[3]
+        info = (0, [hands[0], unseen, unseen, unseen], [1, 1, 1, 1],
+                NOLO, 0, [], [6, 6], None)
+        visits = players.ismcts_search(info, iterations=10, seed=1)
+        self.assertEqual(list(visits), [0])
+        self.assertEqual(visits[0], 10)
+
+    def testSearchAvoidsTrick(self):
+        # in nolo, the player holding the ace and the two of spades should
+        # duck under the king
+        hand = 1 << 0 | 1 << 12 | 1 << SUIT_BITS
+        unseen = 0
+        for card in (1, 2, 14, 15, 16, 26, 27, 28):
+            unseen |= 1 << card
+        info = (1, [unseen, hand, unseen, unseen], [2, 3, 3, 3], NOLO, 0,
+                [11], [5, 5], None)
+        visits = players.ismcts_search(info, iterations=300, seed=2)
+        self.assertEqual(max(visits, key=visits.get), 0)
+
+    def testHeadlessGame(self):
+        game = GameController(random.Random(5))
+        for i in range(4):
+            if i % 2:
+                game.register_player(players.DummyBotPlayer('Dummy %d' % i))
+            else:
+                game.register_player(players.ISMCTSBotPlayer('Search %d' % i,
+                    time_budget=None, iterations=20, seed=i))
+        result = game.run_headless(max_hands=2)
+        self.assertEqual(len(result.hands), 2)
+        for hand in result.hands:
+            self.assertEqual(sum(hand.tricks), 13)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import unittest
+import random
+from tupelo import position
+from tupelo.common import BitCardSet, RAMI
+from tupelo.game import GameController
+from tupelo.players import DummyBotPlayer
+
+def _deal(seed):
+    hands = [BitCardSet() for _ in range(4)]
+    BitCardSet.new_full_deck().deal(hands, random.Random(seed))
+    return [hand.mask for hand in hands]
+
+
+class TestPosition(unittest.TestCase):
+
+    def testApplyUndo(self):
+        rng = random.Random(5)
+        pos = position.Position(_deal(5), RAMI, leader=1)
+        start = (list(pos.hands), list(pos.table), pos.leader, pos.turn, list(pos.tricks))
+        moves = 0
+        while not pos.is_over():
+            legal = pos.legal_moves()
+            self.assertTrue(len(legal) > 0)
+            pos.apply(rng.choice(legal))
+            moves += 1
+        self.assertEqual(moves, 52)
+        self.assertEqual(sum(pos.tricks), 13)
+        self.assertTrue(pos.result()[0] in (0, 1))
+        for _ in range(moves):
+            pos.undo()
+        self.assertEqual((pos.hands, pos.table, pos.leader, pos.turn, pos.tricks), start)
+
+    def testCopy(self):
+        pos = position.Position(_deal(1))
+        pos2 = pos.copy()
+        pos2.apply(pos2.legal_moves()[0])
+        self.assertNotEqual(pos.hands, pos2.hands)
+        self.assertEqual(pos.table, [])
+
+    def testFromGame(self):
+        game = GameController(random.Random(3))
+        for i in range(4):
+            game.register_player(DummyBotPlayer('Robotti %d' % i))
+        game.run_headless(max_hands=1)
+        pos = position.Position.from_game(game)
+        self.assertEqual(pos.cards_left(), 52)
+        self.assertEqual(pos.turn, game.state.turn)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import unittest
+import time
+import threading
+from tupelo import rpc
+from tupelo.server import TupeloRPCInterface
+from tupelo.server.reaper import Reaper
+from tupelo.players import Player, ThreadedPlayer
+from tupelo.events import TurnEvent
+
+class TestReaper(unittest.TestCase):
+
+    def testRunDue(self):
+        checked = []
+        def check(key, now):
+            checked.append(key)
+            # 'b' is checked once more later
+            if key == 'b' and checked.count('b') == 1:
+                return now + 10
+            return None
+
+        reaper = Reaper(check)
+        try:
+            now = time.monotonic() + 1000
+            reaper.schedule('a', now + 2)
+            reaper.schedule('b', now + 1)
+            reaper.schedule('c', now + 5)
+            self.assertEqual(reaper.run_due(now), 0)
+            self.assertEqual(reaper.run_due(now + 3), 2)
+            self.assertEqual(checked, ['b', 'a'])
+            self.assertEqual(len(reaper), 2)
+            self.assertEqual(reaper.run_due(now + 20), 2)
+            self.assertEqual(checked, ['b', 'a', 'c', 'b'])
+            self.assertEqual(len(reaper), 0)
+        finally:
+            reaper.stop()
+
+    def testThread(self):
+        done = threading.Event()
+        reaper = Reaper(lambda key, now: done.set())
+        try:
+            reaper.schedule('a', time.monotonic() + 1000)
+            # an earlier timer wakes up the thread
+            reaper.schedule('b', time.monotonic() + 0.1)
+            self.assertTrue(done.wait(5))
+            self.assertEqual(len(reaper), 1)
+        finally:
+            reaper.stop()
+
+
+class TestExpiry(unittest.TestCase):
+
+    def setUp(self):
+        self.iface = TupeloRPCInterface()
+
+    def tearDown(self):
+        self.iface._reaper.stop()
+
+    def testSessionExpiry(self):
+        self.iface.game_ttl = None
+        idle = self.iface.player_register(rpc.rpc_encode(Player('Laiska')))
+        active = self.iface.player_register(rpc.rpc_encode(Player('Ahkera')))
+        game_id = self.iface.game_create(idle['akey'])
+        ttl = self.iface.session_ttl
+        later = time.monotonic() + ttl / 2
+        self.iface._get_player(active['id']).last_activity = later
+        self.iface._reaper.run_due(later + ttl / 2 + 1)
+        # the idle player quit and left the game, which was removed
+        self.assertFalse(idle['id'] in self.iface.players)
+        self.assertFalse(game_id in self.iface.games)
+        self.assertTrue(active['id'] in self.iface.players)
+        self.iface._reaper.run_due(later + ttl + 1)
+        self.assertFalse(active['id'] in self.iface.players)
+        self.assertEqual(len(self.iface._reaper), 0)
+
+    def testSessionExpiryInGame(self):
+        self.iface.game_ttl = None
+        p_data = self.iface.player_register(rpc.rpc_encode(Player('Karkuri')))
+        game_id = self.iface.game_create(p_data['akey'])
+        game = self.iface._get_game(game_id)
+        self.iface.game_start_with_bots(p_data['akey'], game_id)
+        bots = [bot for bot in game.players if isinstance(bot, ThreadedPlayer)]
+        lock_free = []
+        stop = game.stop
+        def checking_stop():
+            thread = threading.Thread(target=lambda: lock_free.append(
+                self.iface.lock.acquire(timeout=1) and self.iface.lock.release() is None))
+            thread.start()
+            thread.join()
+            stop()
+        game.stop = checking_stop
+
+        self.iface._reaper.run_due(time.monotonic() + self.iface.session_ttl + 1)
+        self.assertFalse(p_data['id'] in self.iface.players)
+        self.assertFalse(game_id in self.iface.games)
+        # the bots were stopped without holding the lock
+        self.assertEqual(lock_free, [True])
+        for bot in bots:
+            self.assertFalse(bot.is_alive())
+
+    def testGameExpiry(self):
+        self.iface.session_ttl = None
+        p_data = self.iface.player_register(rpc.rpc_encode(Player('Hylkääjä')))
+        player = self.iface._get_player(p_data['id'])
+        game_id = self.iface.game_create(p_data['akey'])
+        game = self.iface._get_game(game_id)
+        self.iface.game_start_with_bots(p_data['akey'], game_id)
+        bots = [bot for bot in game.players if isinstance(bot, ThreadedPlayer)]
+        self.assertEqual(len(bots), 3)
+        # the game waits for the player's turn
+        deadline = time.time() + 10
+        while not any(isinstance(event, TurnEvent) for event in player.pop_events(1)):
+            self.assertTrue(time.time() < deadline)
+
+        # the game is stopped without holding the interface lock
+        lock_free = []
+        stop = game.stop
+        def checking_stop():
+            thread = threading.Thread(target=lambda: lock_free.append(
+                self.iface.lock.acquire(timeout=1) and self.iface.lock.release() is None))
+            thread.start()
+            thread.join()
+            stop()
+        game.stop = checking_stop
+
+        ttl = self.iface.game_ttl
+        now = time.monotonic() + ttl + 1
+        # the version has changed since the game was created
+        self.iface._reaper.run_due(now)
+        self.assertTrue(game_id in self.iface.games)
+        self.iface._reaper.run_due(now + ttl)
+        self.assertFalse(game_id in self.iface.games)
+        self.assertEqual(player.game, None)
+        self.assertEqual(lock_free, [True])
+        for bot in bots:
+            self.assertFalse(bot.is_alive())
+        # the player's session is kept
+        self.assertTrue(p_data['id'] in self.iface.players)
+
+
+if __name__ == '__main__':
+    unittest.main()
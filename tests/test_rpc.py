@@ -9,6 +9,14 @@ class _RPCTestClass(rpc.RPCSerializable):
     a = 1
     b = '2'
 
+class _RPCTypedClass(rpc.RPCSerializable):
+    # _RPCLaterClass is defined after this class
+    rpc_attrs = ('a', 'child:_RPCLaterClass', 'missing')
+
+class _RPCLaterClass(rpc.RPCSerializable):
+    rpc_attrs = ('c',)
+    c = None
+
 class _CustomClass(object):
     def rpc_encode(self):
         return 'hilipati'
@@ -72,6 +80,40 @@ class TestRPC(unittest.TestCase):
         decoded = rpc.rpc_decode(_CustomClass, encoded)
         self.assertEqual(decoded, 'joop')
 
+    def testIterRPCAttrs(self):
+        self.assertEqual(list(_RPCTypedClass.iter_rpc_attrs()),
+                [('a', None), ('child', '_RPCLaterClass'), ('missing', None)])
+        self.assertEqual(list(rpc.RPCSerializable.iter_rpc_attrs()), [])
+
+    def testSerializeTyped(self):
+        testobj = _RPCTypedClass()
+        testobj.a = None
+        testobj.child = _RPCLaterClass()
+        testobj.child.c = [1, 2]
+        encoded = rpc.rpc_encode(testobj)
+        # missing attributes and None values are left out
+        self.assertEqual(encoded, {'child': {'c': [1, 2]}})
+        decoded = rpc.rpc_decode(_RPCTypedClass, encoded)
+        self.assertTrue(isinstance(decoded.child, _RPCLaterClass))
+        self.assertEqual(decoded.child.c, [1, 2])
+        self.assertFalse(hasattr(decoded, 'a'))
+
+    def testTypeRegistry(self):
+        self.assertTrue(rpc.rpc_types.lookup('_RPCLaterClass') is _RPCLaterClass)
+        self.assertTrue(rpc.RPCSerializable.get_class_for_type(None) is None)
+        self.assertRaises(rpc.UnknownTypeError, rpc.rpc_types.lookup, 'NoSuchClass')
+
+    def testDuplicateType(self):
+        def define():
+            class _RPCLaterClass(rpc.RPCSerializable):
+                rpc_attrs = ('d',)
+            return _RPCLaterClass
+        self.assertRaises(TypeError, define)
+        # the first class is kept
+        self.assertTrue(rpc.rpc_types.lookup('_RPCLaterClass') is _RPCLaterClass)
+        # registering the same class again is fine
+        rpc.rpc_types.register('_RPCLaterClass', _RPCLaterClass)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import unittest
+from tupelo import rules
+from tupelo.common import Card, BitCardSet, NOLO, RAMI, HEART, SPADE, CLUB
+
+
+class TestRules(unittest.TestCase):
+
+    def testTrickWinner(self):
+        cards = [Card(HEART, 5).index, Card(HEART, 11).index,
+                Card(SPADE, 14).index, Card(HEART, 7).index]
+        self.assertEqual(rules.trick_winner(cards), 1)
+        cards = [Card(CLUB, 2).index, Card(HEART, 11).index,
+                Card(SPADE, 14).index, Card(HEART, 7).index]
+        self.assertEqual(rules.trick_winner(cards), 0)
+
+    def testLegalMask(self):
+        hand = BitCardSet([Card(HEART, 5), Card(SPADE, 3)]).mask
+        self.assertEqual(rules.legal_mask(hand, None), hand)
+        self.assertEqual(rules.legal_mask(hand, HEART.value),
+                BitCardSet([Card(HEART, 5)]).mask)
+        self.assertEqual(rules.legal_mask(hand, CLUB.value), hand)
+
+    def testScoreHand(self):
+        self.assertEqual(rules.score_hand(NOLO, [3, 10], None), (0, 16))
+        self.assertEqual(rules.score_hand(RAMI, [9, 4], 0), (0, 12))
+        self.assertEqual(rules.score_hand(RAMI, [9, 4], 1), (0, 24))
+
+
+if __name__ == '__main__':
+    unittest.main()
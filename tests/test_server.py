@@ -3,10 +3,12 @@
 # vim: set sts=4 sw=4 et:
 
 import unittest
+import threading
 from tupelo import rpc
 from tupelo.server import TupeloRPCInterface as I
 from tupelo.server.jsonapi import TupeloJSONDispatcher as D
 from tupelo.players import Player
+from tupelo.common import GameError
 
 class TestTupeloJSONDispatcher(unittest.TestCase):
 
@@ -83,6 +85,28 @@ class TestTupeloRPCInterface(unittest.TestCase):
         self.assertTrue(me is not None)
         self.assertEqual(me.player_name, encoded['player_name'])
         iface._clear_auth()
+        # quitting removes the player from the indexes
+        iface.player_quit(p_data['akey'])
+        self.assertRaises(GameError, iface._ensure_auth, p_data['akey'])
+        self.assertRaises(GameError, iface._get_player, p_data['id'])
+
+    def testLongPoll(self):
+        iface = I()
+        p_data = iface.player_register(self._encoded_player())
+        player = iface._get_player(p_data['id'])
+        self.assertEqual(iface.get_events(p_data['akey'], False, 0.1), [])
+        timer = threading.Timer(0.1, player.send_message, ('', 'hello'))
+        timer.start()
+        events = iface.get_events(p_data['akey'], False, 10)
+        self.assertEqual(events[0]['message'], 'hello')
+        timer.join()
+        # waiters are called once
+        woken = []
+        self.assertTrue(player.add_event_waiter(lambda: woken.append(True)))
+        player.send_message('', 'one')
+        player.send_message('', 'two')
+        self.assertEqual(woken, [True])
+        self.assertFalse(player.add_event_waiter(lambda: woken.append(True)))
 
     def testHelloEmpty(self):
         iface = I()
@@ -103,6 +127,8 @@ class TestTupeloRPCInterface(unittest.TestCase):
         p_data = iface.player_register(p_encoded)
         # create game
         g_id = iface.game_create(p_data['akey'])
+        # the authenticated player is kept only for the request
+        self.assertTrue(iface.authenticated_player is None)
         # list
         gamelist = iface.game_list()
         self.assertTrue(str(g_id) in gamelist)
@@ -160,6 +186,16 @@ class TestTupeloRPCInterface(unittest.TestCase):
             self.assertTrue('game_state' in state)
             self.assertEqual(state['game_state']['status'], 1)
             self.assertTrue('hand' in state)
+            # the game moved in the status index
+            self.assertTrue(g_id in iface.game_list(1))
+            self.assertFalse(g_id in iface.game_list(0))
+
+            # state deltas are based on the state just sent
+            events = iface.get_events(p_datas[0]['akey'], True)
+            deltas = [event['state_delta'] for event in events if 'state_delta' in event]
+            self.assertTrue(len(deltas) > 0)
+            self.assertEqual(deltas[0]['base'], state['game_state']['version'])
+            self.assertFalse(any('game_state' in event for event in events))
 
             ret = iface.game_leave(p_datas[0]['akey'], g_id)
             self.assertEqual(ret, True)
@@ -169,7 +205,7 @@ class TestTupeloRPCInterface(unittest.TestCase):
                 self.assertEqual(ret, True)
 
         finally:
-            for game in iface.games:
+            for game in list(iface.games.values()):
                 game._reset()
 
 
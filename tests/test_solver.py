@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import unittest
+import random
+from tupelo.common import NOLO, RAMI
+from tupelo.position import Position
+from tupelo.solver import Solver, solve, reduce_moves
+
+def _deal(rng, tricks):
+    hands = [0, 0, 0, 0]
+    for i, card in enumerate(rng.sample(range(52), 4 * tricks)):
+        hands[i % 4] |= 1 << card
+    return hands
+
+def _brute_force(pos):
+    """
+    Get the final tricks of both teams with a full minimax search.
+    """
+    if pos.is_over():
+        return list(pos.tricks)
+    score_team = 0 if pos.mode == RAMI else 1
+    results = []
+    for move in pos.legal_moves():
+        pos.apply(move)
+        results.append(_brute_force(pos))
+        pos.undo()
+    choose = max if pos.turn % 2 == 0 else min
+    return choose(results, key=lambda tricks: tricks[score_team])
+
+
+class TestSolver(unittest.TestCase):
+
+    def testReduceMoves(self):
+        # 2, 3 and 5 of spades in hand, 4 played: all equivalent
+        self.assertEqual(reduce_moves(0b10011, 0b10011), 0b1)
+        # 4 still in play
+        self.assertEqual(reduce_moves(0b10011, 0b11011), 0b10001)
+
+    def testLastTrick(self):
+        hands = [1 << 12, 1 << 11, 1 << 10, 1 << 9]
+        result = solve(hands, RAMI, 0, tricks=(6, 6))
+        self.assertEqual(result.tricks, [7, 6])
+        self.assertEqual(result.move, 12)
+
+    def testAgainstBruteForce(self):
+        rng = random.Random(7)
+        solver = Solver()
+        for _ in range(30):
+            tricks = rng.randint(1, 4)
+            mode = rng.choice([NOLO, RAMI])
+            leader = rng.randrange(4)
+            hands = _deal(rng, tricks)
+            result = solver.solve(hands, mode, leader)
+            expected = _brute_force(Position(hands, mode, leader))
+            self.assertEqual(result.tricks, expected)
+
+            # the best move keeps the value
+            pos = Position(hands, mode, leader)
+            self.assertTrue(result.move in pos.legal_moves())
+            pos.apply(result.move)
+            self.assertEqual(_brute_force(pos), expected)
+
+    def testCurrentTrick(self):
+        rng = random.Random(8)
+        for _ in range(10):
+            mode = rng.choice([NOLO, RAMI])
+            pos = Position(_deal(rng, 4), mode, rng.randrange(4))
+            for _ in range(rng.randint(1, 3)):
+                pos.apply(rng.choice(pos.legal_moves()))
+            result = solve(pos.hands, mode, pos.leader, pos.table, pos.tricks)
+            self.assertEqual(result.tricks, _brute_force(pos))
+            self.assertTrue(result.move in pos.legal_moves())
+
+    def testTableSize(self):
+        solver = Solver(tt_size=10)
+        rng = random.Random(9)
+        hands = _deal(rng, 5)
+        result = solver.solve(hands, RAMI)
+        self.assertTrue(len(solver.table) <= 10)
+        self.assertEqual(result.tricks, Solver().solve(hands, RAMI).tricks)
+
+    def testBothModes(self):
+        # the table of a solver is shared by the modes
+        hands = [16809984, 17179869185, 8256, 68786585600]
+        solver = Solver()
+        for mode in (NOLO, RAMI, NOLO):
+            self.assertEqual(solver.solve(hands, mode).tricks, solve(hands, mode).tricks)
+        self.assertEqual(solver.solve(hands, RAMI).tricks, [2, 0])
+
+    def testEndgameNodes(self):
+        # the pruning keeps a 7-trick endgame far from a full search
+        rng = random.Random(10)
+        for mode, nodes in ((NOLO, 20000), (RAMI, 5000)):
+            solver = Solver()
+            solver.solve(_deal(rng, 7), mode)
+            self.assertTrue(solver.nodes < nodes)
+
+    def testUnknownMode(self):
+        self.assertRaises(ValueError, solve, [0, 0, 0, 0], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
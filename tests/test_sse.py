@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import unittest
+import json
+import threading
+import http.client
+from tupelo import rpc
+from tupelo.server import TupeloServer, AsyncTupeloServer
+from tupelo.server import sse
+from tupelo.players import Player
+
+class _StreamTests():
+    """
+    Event stream tests run against both server classes.
+    """
+    server_class = None
+
+    def setUp(self):
+        self.server = self.server_class(('127.0.0.1', 0), logRequests=False)
+        self.server.heartbeat_interval = 0.2
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.iface = self.server.instance
+        self.p_data = self.iface.player_register(rpc.rpc_encode(Player('Virta')))
+        self.player = self.iface._get_player(self.p_data['id'])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _open(self, headers=None, akey=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1],
+                timeout=10)
+        conn.request('GET', '%s?akey=%s' % (sse.STREAM_PATH, akey or self.p_data['akey']),
+                headers=headers or {})
+        return conn, conn.getresponse()
+
+    def _read_message(self, response) -> dict:
+        """
+        Read the fields of the next message, skipping heartbeats.
+        """
+        fields = {}
+        while True:
+            line = response.readline().decode().rstrip('\n')
+            if line == '':
+                if fields:
+                    return fields
+            elif not line.startswith(':'):
+                key, _, value = line.partition(': ')
+                fields[key] = value
+
+    def testStream(self):
+        conn, response = self._open()
+        try:
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.getheader('Content-type'), sse.CONTENT_TYPE)
+            self.assertEqual(self._read_message(response), {'retry': '2000'})
+            self.player.send_message('', 'one')
+            self.player.send_message('', 'two')
+            msg = self._read_message(response)
+            self.assertEqual(msg['id'], '1')
+            self.assertEqual(json.loads(msg['data'])['message'], 'one')
+            self.assertEqual(self._read_message(response)['id'], '2')
+            # heartbeats keep the connection alive
+            self.assertEqual(response.readline(), b': heartbeat\n')
+        finally:
+            conn.close()
+
+        # resume after the first event
+        self.player.send_message('', 'three')
+        conn, response = self._open({'Last-Event-ID': '1'})
+        try:
+            self._read_message(response)
+            self.assertEqual([self._read_message(response)['id'] for _ in range(2)],
+                    ['2', '3'])
+        finally:
+            conn.close()
+
+    def testResync(self):
+        for i in range(3):
+            self.player.send_message('', str(i))
+        self.player.pop_events()
+        conn, response = self._open({'Last-Event-ID': '99'})
+        try:
+            self._read_message(response)
+            self.assertEqual(self._read_message(response)['event'], 'resync')
+        finally:
+            conn.close()
+
+    def testInvalidAkey(self):
+        conn, response = self._open(akey='invalid')
+        try:
+            self.assertEqual(response.status, 403)
+        finally:
+            conn.close()
+
+    def testPlayerQuit(self):
+        conn, response = self._open()
+        try:
+            self._read_message(response)
+            self.iface.player_quit(self.p_data['akey'])
+            # the stream ends after the next heartbeat
+            response.read()
+        finally:
+            conn.close()
+
+
+class TestStreamThreaded(_StreamTests, unittest.TestCase):
+    server_class = TupeloServer
+
+
+class TestStreamAsync(_StreamTests, unittest.TestCase):
+    server_class = AsyncTupeloServer
+
+
+class TestReplay(unittest.TestCase):
+
+    def testReplayEvents(self):
+        from tupelo.server.server import RPCProxyPlayer, EVENT_REPLAY_SIZE
+        player = RPCProxyPlayer('Toisto')
+        self.assertEqual(player.replay_events(0), [])
+        for i in range(EVENT_REPLAY_SIZE + 10):
+            player.send_message('', str(i))
+        self.assertEqual(player.replay_events(0), [])
+        self.assertEqual(len(player.pop_events()), EVENT_REPLAY_SIZE + 10)
+        self.assertEqual(player.replay_events(EVENT_REPLAY_SIZE + 10), [])
+        replayed = player.replay_events(EVENT_REPLAY_SIZE)
+        self.assertEqual([seq for seq, _ in replayed], list(range(EVENT_REPLAY_SIZE + 1,
+            EVENT_REPLAY_SIZE + 11)))
+        self.assertEqual(player.replay_events(5), None)
+        self.assertEqual(player.replay_events(1000), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
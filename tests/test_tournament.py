@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import unittest
+from tupelo import tournament
+
+class TestTournament(unittest.TestCase):
+
+    def testGetBotClass(self):
+        cls = tournament.get_bot_class('DummyBotPlayer')
+        self.assertEqual(cls.__name__, 'DummyBotPlayer')
+        self.assertRaises(ValueError, tournament.get_bot_class, 'CliPlayer')
+        self.assertRaises(ValueError, tournament.get_bot_class, 'NoSuchPlayer')
+
+    def testRunTournament(self):
+        names = ['DummyBotPlayer', 'CountingBotPlayer']
+        result = tournament.run_tournament(names, 4, processes=1, seed=3)
+        self.assertEqual(result.games, 4)
+        self.assertEqual(result.stats[0].games, 4)
+        self.assertEqual(result.stats[0].wins + result.stats[1].wins +
+                result.unfinished, 4)
+        low, high = result.stats[0].win_rate_interval()
+        self.assertTrue(0.0 <= low <= result.stats[0].win_rate <= high <= 1.0)
+        # same seed, same games
+        result2 = tournament.run_tournament(names, 4, processes=2, seed=3)
+        self.assertEqual(result.hands, result2.hands)
+        self.assertEqual(result.stats[0].score_sum, result2.stats[0].score_sum)
+
+
+if __name__ == '__main__':
+    unittest.main()
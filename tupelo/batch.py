@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+"""
+Vectorized engine that plays many games in lockstep using NumPy.
+
+Cards are indexed like Card.index (suit.value * 13 + value - 2), hands are
+K x 4 x 52 boolean masks and every step of the game is done for all K games
+at once. The rules are the same as in tupelo.game.GameController.
+
+NumPy is an optional dependency of tupelo, needed only by this module.
+"""
+
+import numpy as np
+
+from .common import NOLO, RAMI
+
+# value rank (0..12) and suit of each card index
+_RANK = np.arange(52) % 13
+_SUIT = np.arange(52) // 13
+_RED = (_SUIT == 1) | (_SUIT == 3)
+_RANKS = np.arange(13)
+
+WIN_SCORE = 52
+
+def _limit(ranks, floor=None, roof=None):
+    if floor is not None:
+        ranks = ranks & (_RANKS[None, :] >= floor[:, None])
+    if roof is not None:
+        ranks = ranks & (_RANKS[None, :] <= roof[:, None])
+    return ranks
+
+def highest_rank(ranks, floor=None, roof=None):
+    """
+    Get the highest rank set in each row of a K x 13 rank mask, optionally
+    limited to ranks between floor and roof (arrays of ranks 0..12).
+
+    Return a tuple of (ranks, found).
+    """
+    ranks = _limit(ranks, floor, roof)
+    top = 12 - ranks[:, ::-1].argmax(axis=1)
+    return top, ranks[np.arange(len(ranks)), top]
+
+def lowest_rank(ranks, floor=None, roof=None):
+    """
+    Get the lowest rank set in each row of a K x 13 rank mask, see
+    highest_rank().
+    """
+    ranks = _limit(ranks, floor, roof)
+    bottom = ranks.argmax(axis=1)
+    return bottom, ranks[np.arange(len(ranks)), bottom]
+
+def _hand_card(hands, rank):
+    """
+    Get the card of given rank with the lowest suit, like CardSet does.
+    """
+    rows = np.arange(len(hands))
+    suit = hands.reshape(-1, 4, 13)[rows, :, rank].argmax(axis=1)
+    return suit * 13 + rank
+
+def hand_highest(hands):
+    """
+    Get the highest card in each of the K x 52 hands.
+    """
+    rank, _ = highest_rank(hands.reshape(-1, 4, 13).any(axis=1))
+    return _hand_card(hands, rank)
+
+def hand_lowest(hands):
+    """
+    Get the lowest card in each of the K x 52 hands.
+    """
+    rank, _ = lowest_rank(hands.reshape(-1, 4, 13).any(axis=1))
+    return _hand_card(hands, rank)
+
+
+class RandomPolicy():
+    """
+    Vote and play uniformly random legal cards.
+    """
+    def __init__(self, rng=None):
+        self.rng = rng or np.random.default_rng()
+
+    def vote(self, batch, rows, hands):
+        return self.play(batch, rows, hands, None)
+
+    def play(self, batch, rows, legal, position):
+        keys = np.where(legal, self.rng.random(legal.shape), -1.0)
+        return keys.argmax(axis=1)
+
+
+class DummyPolicy():
+    """
+    The heuristics of DummyBotPlayer as vectorized functions.
+    """
+    def vote(self, batch, rows, hands):
+        # only the color of the voted card matters
+        score = (np.maximum(_RANK + 2 - 10, 0)[None, :] * hands).sum(axis=1)
+        red = hands & _RED[None, :]
+        black = hands & ~_RED[None, :]
+        want_red = (score > 16) & red.any(axis=1)
+        want_red |= ~black.any(axis=1)
+        choices = np.where(want_red[:, None], red, black)
+        keys = np.where(choices, -np.abs(_RANK + 2 - 6)[None, :], -100)
+        return keys.argmax(axis=1)
+
+    def play(self, batch, rows, legal, position):
+        hands = batch.hands[rows, batch.turn[rows]]
+        nolo = batch.mode[rows] == NOLO
+        if position == 0:
+            return np.where(nolo, hand_lowest(hands), hand_highest(hands))
+
+        # all candidates are in the led suit, so work with its ranks only
+        led = batch.table[rows, 0] // 13
+        ranks = hands.reshape(-1, 4, 13)[np.arange(len(rows)), led]
+        void = ~ranks.any(axis=1)
+        high_rank = batch.high_rank[rows]
+        own_high = (batch.high_seat[rows] % 2) == (batch.turn[rows] % 2)
+        last = position == 3
+
+        hi, _ = highest_rank(ranks)
+        lo, _ = lowest_rank(ranks)
+        hi_under, under = highest_rank(ranks, roof=high_rank)
+        lo_over, over_low = lowest_rank(ranks, floor=high_rank)
+        hi_over, over = highest_rank(ranks, floor=high_rank)
+
+        # nolo
+        if last:
+            own_rank = hi
+            opp_rank = np.where(under, hi_under, hi)
+        else:
+            own_rank = np.where(under, hi_under, hi)
+            opp_rank = np.where(under, hi_under, lo)
+        nolo_rank = np.where(own_high, own_rank, opp_rank)
+
+        # rami
+        if last:
+            opp_rank = np.where(over_low, lo_over, lo)
+        else:
+            opp_rank = np.where(over, hi_over, lo)
+        rami_rank = np.where(own_high, lo, opp_rank)
+
+        cards = led * 13 + np.where(nolo, nolo_rank, rami_rank)
+        if void.any():
+            # "sakaus"
+            cards[void] = np.where(nolo[void], hand_highest(hands[void]),
+                    hand_lowest(hands[void]))
+        return cards
+
+
+class BatchGame():
+    """
+    K games of tuppi played in lockstep.
+
+    policies is a list of four policy objects, one per seat, each having
+    vote(batch, rows, hands) and play(batch, rows, legal, position) methods
+    returning a card index for each given row.
+    """
+    def __init__(self, games: int, policies, seed=None):
+        self.games = games
+        self.policies = policies
+        self.rng = np.random.default_rng(seed)
+        self.rows = np.arange(games)
+        self.hands = np.zeros((games, 4, 52), dtype=bool)
+        self.score = np.zeros((games, 2), dtype=np.int64)
+        self.dealer = np.zeros(games, dtype=np.int64)
+        self.done = np.zeros(games, dtype=bool)
+        self.winner = np.full(games, -1, dtype=np.int64)
+        self.hands_played = np.zeros(games, dtype=np.int64)
+        # original index of each game, play_games() drops finished games
+        self.game_ids = np.arange(games)
+        self.final_winner = np.full(games, -1, dtype=np.int64)
+        self.final_score = np.zeros((games, 2), dtype=np.int64)
+        self.final_hands = np.zeros(games, dtype=np.int64)
+        self._reset_hand()
+
+    def _reset_hand(self):
+        games = self.games
+        self.mode = np.full(games, NOLO, dtype=np.int64)
+        self.rami_team = np.full(games, -1, dtype=np.int64)
+        self.tricks = np.zeros((games, 2), dtype=np.int64)
+        self.turn = np.zeros(games, dtype=np.int64)
+        self.leader = np.zeros(games, dtype=np.int64)
+        self.table = np.full((games, 4), -1, dtype=np.int64)
+        self.high_rank = np.zeros(games, dtype=np.int64)
+        self.high_seat = np.zeros(games, dtype=np.int64)
+
+    def deal(self, hands=None):
+        """
+        Deal new hands, or use the given K x 4 x 52 masks.
+        """
+        self._reset_hand()
+        if hands is not None:
+            self.hands = np.array(hands, dtype=bool)
+            return
+
+        order = self.rng.random((self.games, 52)).argsort(axis=1)
+        self.hands[:] = False
+        seats = np.arange(52) % 4
+        self.hands[self.rows[:, None], seats[None, :], order] = True
+
+    def _for_seats(self, func):
+        """
+        Call func(policy, rows) for the rows of each seat in turn and
+        collect the card indices it returns.
+        """
+        cards = np.zeros(self.games, dtype=np.int64)
+        for seat in range(4):
+            rows = np.flatnonzero(self.turn == seat)
+            if len(rows):
+                cards[rows] = func(self.policies[seat], rows)
+        return cards
+
+    def _vote(self):
+        voting = np.ones(self.games, dtype=bool)
+        for i in range(4):
+            self.turn = (self.dealer + 1 + i) % 4
+            cards = self._for_seats(lambda policy, rows: policy.vote(self,
+                rows, self.hands[rows, self.turn[rows]]))
+            rami = voting & _RED[cards]
+            self.mode[rami] = RAMI
+            self.rami_team[rami] = self.turn[rami] % 2
+            # the player before the one who chose rami begins
+            self.leader[rami] = (self.turn[rami] - 1) % 4
+            voting &= ~rami
+
+        self.leader[voting] = (self.dealer[voting] + 1) % 4
+
+    def _play_card(self, position: int):
+        self.turn = (self.leader + position) % 4
+        hands = self.hands[self.rows, self.turn]
+        if position == 0:
+            legal = hands
+        else:
+            led = (self.table[:, 0] // 13)
+            follow = hands & (_SUIT[None, :] == led[:, None])
+            legal = np.where(follow.any(axis=1)[:, None], follow, hands)
+
+        cards = self._for_seats(lambda policy, rows: policy.play(self, rows,
+            legal[rows], position))
+        if not legal[self.rows, cards].all():
+            raise ValueError('Policy played an illegal card')
+
+        self.hands[self.rows, self.turn, cards] = False
+        self.table[:, position] = cards
+        if position == 0:
+            self.high_rank = _RANK[cards]
+            self.high_seat = self.turn.copy()
+        else:
+            takes = (_SUIT[cards] == self.table[:, 0] // 13) & \
+                    (_RANK[cards] > self.high_rank)
+            self.high_rank = np.where(takes, _RANK[cards], self.high_rank)
+            self.high_seat = np.where(takes, self.turn, self.high_seat)
+
+    def play_hand(self) -> dict:
+        """
+        Deal (unless already dealt), vote and play one hand in every game
+        and update the scores of unfinished games.
+
+        Return a dict of arrays: mode, rami_team, tricks, winner, score
+        (points of the winning team), fell_down and plays (K x 13 x 4 card
+        indices in play order, starting with the leader of each trick).
+        """
+        if not self.hands.any():
+            self.deal()
+
+        self._vote()
+        plays = np.zeros((self.games, 13, 4), dtype=np.int64)
+        for trick in range(13):
+            for position in range(4):
+                self._play_card(position)
+            plays[:, trick] = self.table
+            team = self.high_seat % 2
+            self.tricks[self.rows, team] += 1
+            self.leader = self.high_seat.copy()
+            self.table[:] = -1
+
+        result = self._score_hand()
+        result['plays'] = plays
+        return result
+
+    def _score_hand(self) -> dict:
+        """
+        Apply the scoring rules of GameController._hand_played.
+        """
+        tricks = self.tricks
+        nolo = self.mode == NOLO
+        winner = np.where(nolo, (tricks[:, 0] >= tricks[:, 1]).astype(np.int64),
+                (tricks[:, 0] <= tricks[:, 1]).astype(np.int64))
+        loser = 1 - winner
+        won_tricks = tricks[self.rows, winner]
+        double = ~nolo & (self.rami_team >= 0) & (self.rami_team != winner)
+        score = np.where(nolo, (7 - won_tricks) * 4,
+                (won_tricks - 6) * np.where(double, 8, 4))
+
+        active = ~self.done
+        fell_down = active & (self.score[self.rows, loser] > 0)
+        gains = active & ~fell_down
+        self.score[fell_down] = 0
+        self.score[self.rows[gains], winner[gains]] += score[gains]
+        won = gains & (self.score[self.rows, winner] > WIN_SCORE)
+        self.winner[won] = winner[won]
+        self.done |= won
+        self.hands_played += active
+        self.dealer = (self.dealer + 1) % 4
+
+        return {'mode': self.mode.copy(), 'rami_team': self.rami_team.copy(),
+                'tricks': tricks.copy(), 'winner': winner, 'score': score,
+                'fell_down': fell_down}
+
+    def _store_results(self, rows):
+        ids = self.game_ids[rows]
+        self.final_winner[ids] = self.winner[rows]
+        self.final_score[ids] = self.score[rows]
+        self.final_hands[ids] = self.hands_played[rows]
+
+    def _compact(self):
+        """
+        Store the results of finished games and drop them from the state
+        arrays. Must be called between hands.
+        """
+        self._store_results(np.flatnonzero(self.done))
+        keep = ~self.done
+        for attr in ('hands', 'score', 'dealer', 'done', 'winner',
+                'hands_played', 'game_ids'):
+            setattr(self, attr, getattr(self, attr)[keep])
+        self.games = len(self.game_ids)
+        self.rows = np.arange(self.games)
+        self._reset_hand()
+
+    def play_games(self, max_hands: int = 1000):
+        """
+        Play hands until all the games have a winner or max_hands hands have
+        been played.
+
+        Finished games are dropped from the state arrays as they finish, use
+        game_ids to map the remaining rows to the original games. Return the
+        winner of each original game (-1 if unfinished); see also
+        final_score and final_hands.
+        """
+        for _ in range(max_hands):
+            if self.done.any():
+                self._compact()
+            if self.games == 0:
+                break
+            self.play_hand()
+
+        self._store_results(self.rows)
+        return self.final_winner
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+"""
+Compact binary encoding of events and game state.
+
+The encoding works on the RPC-form objects (see tupelo.rpc) and decodes
+back to the same RPC-form objects, so it can be used in place of JSON for
+the get_events and game_get_state API calls. All integers are big-endian.
+
+The ids, player names and messages of a response are sent once, in an id
+table, and the records refer to them by a 16-bit index into the table, 0
+meaning None. This keeps the records at fixed sizes, so that each is read
+with one precompiled struct.
+
+- id table: a 16-bit count, and for each id a tag byte (1 = string,
+  2 = integer, 3 = big integer) and the value; strings are a 16-bit length
+  and UTF-8 data, integers are 32-bit signed and big integers a 16-bit
+  length and signed big-endian bytes
+- card: one byte, Card.index (0-51), and played_by (as id)
+- hand: a 64-bit card mask
+- player: id, player_name (as id), team byte, game_id (as id)
+- game state: status, mode, score (2 x 16-bit), tricks (2 bytes), turn
+  (signed byte), dealer, version (32-bit), turn_id (as id), number of
+  table cards, and the table cards
+- event: a 16-bit record length, the event type byte, a byte of flags
+  telling which optional fields follow, and the fields; sender and message
+  are ids
+
+A get_events response is a version byte, the id table and the event
+records; a game_get_state response is a version byte, the id table, the
+game state and the hand.
+"""
+
+import struct
+import functools
+from typing import List
+
+from .common import ProtocolError
+from .events import EventType
+
+CONTENT_TYPE = 'application/x-tupelo-binary'
+
+VERSION = 3
+
+_ID_STR = 1
+_ID_INT = 2
+_ID_BIGINT = 3
+
+# optional event fields, in record order
+_FIELD_PLAYER = 0x01
+_FIELD_CARD = 0x02
+_FIELD_STATE = 0x04
+_FIELD_SENDER = 0x08
+_FIELD_MESSAGE = 0x10
+
+_EVENT_HEAD = struct.Struct('>HBB')
+_PLAYER = struct.Struct('>HHBH')
+_CARD = struct.Struct('>BH')
+_STATE_HEAD = struct.Struct('>BBhhBBbBIHB')
+_UINT16 = struct.Struct('>H')
+_INT32 = struct.Struct('>i')
+_INT32_MIN = -2**31
+_INT32_MAX = 2**31 - 1
+_UINT64 = struct.Struct('>Q')
+
+# the suit and value of each card index
+_CARDS = tuple((index // 13, index % 13 + 2) for index in range(52))
+
+
+def _card_index(rpccard: dict) -> int:
+    return rpccard['suit'] * 13 + rpccard['value'] - 2
+
+
+@functools.lru_cache(maxsize=1024)
+def _pack_id(value) -> bytes:
+    if isinstance(value, int):
+        if _INT32_MIN <= value <= _INT32_MAX:
+            return bytes((_ID_INT,)) + _INT32.pack(value)
+        data = value.to_bytes(value.bit_length() // 8 + 1, 'big', signed=True)
+        return bytes((_ID_BIGINT,)) + _UINT16.pack(len(data)) + data
+    data = str(value).encode('utf-8')
+    return bytes((_ID_STR,)) + _UINT16.pack(len(data)) + data
+
+def _id_ref(ids: dict, value) -> int:
+    """
+    Get the id table index of value, adding it to the table if needed.
+    """
+    if value is None:
+        return 0
+    ref = ids.get(value)
+    if ref is None:
+        # an event queue holds far fewer than 65535 different ids
+        ref = ids[value] = len(ids) + 1
+    return ref
+
+def _pack_response(ids: dict, body: bytearray) -> bytes:
+    out = bytearray((VERSION,))
+    out += _UINT16.pack(len(ids))
+    for value in ids:
+        out += _pack_id(value)
+    out += body
+    return bytes(out)
+
+def _write_player(out: bytearray, ids: dict, rpcplayer: dict):
+    out += _PLAYER.pack(_id_ref(ids, rpcplayer.get('id')),
+            _id_ref(ids, rpcplayer.get('player_name')),
+            rpcplayer.get('team', 0), _id_ref(ids, rpcplayer.get('game_id')))
+
+def _write_card(out: bytearray, ids: dict, rpccard: dict):
+    out += _CARD.pack(_card_index(rpccard), _id_ref(ids, rpccard.get('played_by')))
+
+def _write_game_state(out: bytearray, ids: dict, rpcstate: dict):
+    table = rpcstate.get('table', ())
+    score = rpcstate.get('score', (0, 0))
+    tricks = rpcstate.get('tricks', (0, 0))
+    out += _STATE_HEAD.pack(rpcstate.get('status', 0), rpcstate.get('mode', 0),
+            score[0], score[1], tricks[0], tricks[1],
+            rpcstate.get('turn', 0), rpcstate.get('dealer', 0),
+            rpcstate.get('version', 0), _id_ref(ids, rpcstate.get('turn_id')),
+            len(table))
+    for card in table:
+        _write_card(out, ids, card)
+
+def _write_event(out: bytearray, ids: dict, rpcevent: dict):
+    start = len(out)
+    # the record length is filled in at the end
+    out += b'\0\0'
+    player = rpcevent.get('player')
+    card = rpcevent.get('card')
+    state = rpcevent.get('game_state')
+    sender = rpcevent.get('sender')
+    message = rpcevent.get('message')
+    flags = (player is not None and _FIELD_PLAYER) | (card is not None and _FIELD_CARD) | \
+            (state is not None and _FIELD_STATE) | \
+            (sender is not None and _FIELD_SENDER) | \
+            (message is not None and _FIELD_MESSAGE)
+    out.append(rpcevent.get('type', EventType.NONE))
+    out.append(flags)
+    if player is not None:
+        _write_player(out, ids, player)
+    if card is not None:
+        _write_card(out, ids, card)
+    if state is not None:
+        _write_game_state(out, ids, state)
+    if sender is not None:
+        out += _UINT16.pack(_id_ref(ids, sender))
+    if message is not None:
+        out += _UINT16.pack(_id_ref(ids, message))
+    _UINT16.pack_into(out, start, len(out) - start - 2)
+
+
+# The readers take the data, the position to read at and the id table, and
+# return the value and the position after it. An id index outside the
+# table or running out of data raises IndexError or struct.error, which
+# the decode functions turn into a ProtocolError.
+
+def _read_ids(data: bytes) -> tuple:
+    if not data:
+        raise ProtocolError('Truncated binary data')
+    if data[0] != VERSION:
+        raise ProtocolError('Unsupported binary format version %d' % data[0])
+    count = _UINT16.unpack_from(data, 1)[0]
+    pos = 3
+    # index 0 is None
+    ids = [None]
+    for _ in range(count):
+        tag = data[pos]
+        if tag == _ID_STR or tag == _ID_BIGINT:
+            end = pos + 3 + (data[pos + 1] << 8 | data[pos + 2])
+            if end > len(data):
+                raise ProtocolError('Truncated binary data')
+            value = data[pos + 3:end]
+            if tag == _ID_STR:
+                ids.append(value.decode('utf-8'))
+            else:
+                ids.append(int.from_bytes(value, 'big', signed=True))
+            pos = end
+        elif tag == _ID_INT:
+            ids.append(_INT32.unpack_from(data, pos + 1)[0])
+            pos += 5
+        else:
+            raise ProtocolError('Invalid id tag %d' % tag)
+    return (ids, pos)
+
+def _card_dict(ids: list, index: int, played_by: int) -> dict:
+    if index > 51:
+        raise ProtocolError('Invalid card %d' % index)
+    suit, value = _CARDS[index]
+    if played_by:
+        return {'suit': suit, 'value': value, 'played_by': ids[played_by]}
+    return {'suit': suit, 'value': value}
+
+def _read_player(data: bytes, pos: int, ids: list) -> tuple:
+    player_id, name, team, game_id = _PLAYER.unpack_from(data, pos)
+    rpcplayer = {'team': team}
+    if player_id:
+        rpcplayer['id'] = ids[player_id]
+    if name:
+        rpcplayer['player_name'] = ids[name]
+    if game_id:
+        rpcplayer['game_id'] = ids[game_id]
+    return (rpcplayer, pos + _PLAYER.size)
+
+def _read_game_state(data: bytes, pos: int, ids: list) -> tuple:
+    status, mode, score0, score1, tricks0, tricks1, turn, dealer, version, \
+            turn_id, count = _STATE_HEAD.unpack_from(data, pos)
+    pos += _STATE_HEAD.size
+    end = pos + count * _CARD.size
+    rpcstate = {'status': status, 'mode': mode, 'score': [score0, score1],
+            'tricks': [tricks0, tricks1], 'turn': turn, 'dealer': dealer,
+            'version': version,
+            'table': [_card_dict(ids, index, played_by)
+                      for index, played_by in _CARD.iter_unpack(data[pos:end])]}
+    if turn_id:
+        rpcstate['turn_id'] = ids[turn_id]
+    return (rpcstate, end)
+
+def _read_hand(data: bytes, pos: int) -> list:
+    mask = _UINT64.unpack_from(data, pos)[0]
+    cards = []
+    while mask:
+        low = mask & -mask
+        suit, value = _CARDS[low.bit_length() - 1]
+        cards.append({'suit': suit, 'value': value})
+        mask ^= low
+    return cards
+
+
+def encode_events(rpcevents: List[dict]) -> bytes:
+    """
+    Encode a list of RPC-form events.
+    """
+    ids = {}
+    body = bytearray()
+    for rpcevent in rpcevents:
+        _write_event(body, ids, rpcevent)
+    return _pack_response(ids, body)
+
+def decode_events(data: bytes) -> List[dict]:
+    """
+    Decode a list of RPC-form events.
+    """
+    try:
+        ids, pos = _read_ids(data)
+        rpcevents = []
+        size = len(data)
+        while pos < size:
+            length, event_type, flags = _EVENT_HEAD.unpack_from(data, pos)
+            end = pos + 2 + length
+            pos += _EVENT_HEAD.size
+            rpcevent = {'type': event_type}
+            if flags & _FIELD_PLAYER:
+                rpcevent['player'], pos = _read_player(data, pos, ids)
+            if flags & _FIELD_CARD:
+                index, played_by = _CARD.unpack_from(data, pos)
+                rpcevent['card'] = _card_dict(ids, index, played_by)
+                pos += _CARD.size
+            if flags & _FIELD_STATE:
+                rpcevent['game_state'], pos = _read_game_state(data, pos, ids)
+            if flags & _FIELD_SENDER:
+                rpcevent['sender'] = ids[_UINT16.unpack_from(data, pos)[0]]
+                pos += _UINT16.size
+            if flags & _FIELD_MESSAGE:
+                rpcevent['message'] = ids[_UINT16.unpack_from(data, pos)[0]]
+                pos += _UINT16.size
+            if pos > end or end > size:
+                raise ProtocolError('Invalid event record')
+            # skip anything a newer encoder may have added
+            pos = end
+            rpcevents.append(rpcevent)
+    except (IndexError, struct.error, UnicodeDecodeError):
+        raise ProtocolError('Truncated or invalid binary data')
+    return rpcevents
+
+def encode_state(response: dict) -> bytes:
+    """
+    Encode a game_get_state response dict.
+    """
+    ids = {}
+    body = bytearray()
+    _write_game_state(body, ids, response['game_state'])
+    mask = 0
+    for card in response['hand']:
+        mask |= 1 << _card_index(card)
+    body += _UINT64.pack(mask)
+    return _pack_response(ids, body)
+
+def decode_state(data: bytes) -> dict:
+    """
+    Decode a game_get_state response dict.
+    """
+    try:
+        ids, pos = _read_ids(data)
+        rpcstate, pos = _read_game_state(data, pos, ids)
+        hand = _read_hand(data, pos)
+    except (IndexError, struct.error, UnicodeDecodeError):
+        raise ProtocolError('Truncated or invalid binary data')
+    return {'game_state': rpcstate, 'hand': hand}
+
+# encoders for the API methods that support the binary format
+ENCODERS = {
+    'get_events': encode_events,
+    'game_get_state': encode_state,
+}
@@ -168,42 +168,80 @@ def _get_suit(value: int) -> Suit:
 class Card(rpc.RPCSerializable):
     """
     Class that represents a single card.
+
+    Cards are immutable flyweights: Card(suit, value) always returns the same
+    instance from ALL_CARDS, so comparing and hashing cards are integer
+    operations. Information about who played the card is kept in PlayedCard.
     """
+    __slots__ = ('suit', 'value', 'index')
     _chars = {11:'J', 12:'Q', 13:'K', 14:'A'}
-    rpc_attrs = ('suit', 'value', 'played_by')
+    rpc_attrs = ('suit', 'value')
+
+    def __new__(cls, suit: Suit, value: int):
+        if not 2 <= value <= 14:
+            raise ValueError('Invalid card value %s' % value)
+        return ALL_CARDS[suit.value * 13 + value - 2]
 
     def __init__(self, suit: Suit, value: int):
-        super().__init__()
-        self.suit = suit
-        self.value = value
-        self.potential_owners = list(range(0, 4))
-        self.played_by = None
+        pass
+
+    @classmethod
+    def _create(cls, suit: Suit, value: int) -> 'Card':
+        """
+        Create a canonical card instance.
+        """
+        card = object.__new__(cls)
+        object.__setattr__(card, 'suit', suit)
+        object.__setattr__(card, 'value', value)
+        # index is also the integer value for comparing and sorting cards
+        object.__setattr__(card, 'index', suit.value * 13 + value - 2)
+        return card
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Card objects are immutable')
+
+    def __reduce__(self):
+        return (Card, (self.suit, self.value))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     @classmethod
     def rpc_decode(cls, rpcobj) -> 'Card':
         card = Card(Suit.rpc_decode(rpcobj['suit']), rpcobj['value'])
-        if 'played_by' in rpcobj:
-            card.played_by = rpcobj['played_by']
+        if rpcobj.get('played_by') is not None:
+            return PlayedCard(card, rpcobj['played_by'])
 
         return card
 
+    def __hash__(self):
+        return self.index
+
     def __eq__(self, other):
-        return self.suit == other.suit and self.value == other.value
+        if self is other:
+            return True
+        try:
+            return self.index == other.index
+        except AttributeError:
+            return False
 
     def __ne__(self, other):
-        return self.suit != other.suit or self.value != other.value
+        return not self.__eq__(other)
 
     def __lt__(self, other):
-        return self._cmp_value < other._cmp_value
+        return self.index < other.index
 
     def __le__(self, other):
-        return self._cmp_value <= other._cmp_value
+        return self.index <= other.index
 
     def __gt__(self, other):
-        return self._cmp_value > other._cmp_value
+        return self.index > other.index
 
     def __ge__(self, other):
-        return self._cmp_value >= other._cmp_value
+        return self.index >= other.index
 
     def __repr__(self):
         """
@@ -211,11 +249,6 @@ class Card(rpc.RPCSerializable):
         """
         return f'<Card: {self.value} of {self.suit.name}>'
 
-    @property
-    def _cmp_value(self) -> int:
-        """Get the integer value that can be used for comparing and sorting cards."""
-        return self.suit.value * 13 + self.value
-
     def __str__(self):
         return '%s%s' % (self.char, self.suit.char)
 
@@ -229,6 +262,37 @@ class Card(rpc.RPCSerializable):
         return str(self.value)
 
 
+ALL_CARDS = tuple(Card._create(suit, value) for suit in ALL_SUITS
+        for value in range(2, 15))
+
+
+class PlayedCard(Card):
+    """
+    A card on the table, together with the ID of the player who played it.
+
+    Compares and hashes equal to the plain Card.
+    """
+    __slots__ = ('card', 'played_by')
+    rpc_attrs = ('suit', 'value', 'played_by')
+
+    def __new__(cls, card: Card, played_by):
+        played = object.__new__(cls)
+        for attr in ('suit', 'value', 'index'):
+            object.__setattr__(played, attr, getattr(card, attr))
+        object.__setattr__(played, 'card', ALL_CARDS[card.index])
+        object.__setattr__(played, 'played_by', played_by)
+        return played
+
+    def __init__(self, card: Card, played_by):
+        pass
+
+    def __reduce__(self):
+        return (PlayedCard, (self.card, self.played_by))
+
+    def __repr__(self):
+        return f'<PlayedCard: {self.value} of {self.suit.name} by {self.played_by}>'
+
+
 class CardSet(list, rpc.RPCSerializable):
     """
     A set of cards.
@@ -238,12 +302,7 @@ class CardSet(list, rpc.RPCSerializable):
         """
         Create a full deck of cards.
         """
-        deck = CardSet()
-        for suit in ALL_SUITS:
-            for val in range(2, 15):
-                deck.append(Card(suit, val))
-
-        return deck
+        return CardSet(ALL_CARDS)
 
     def __sub__(self, other):
         """
@@ -363,12 +422,249 @@ class CardSet(list, rpc.RPCSerializable):
 
         return lowest
 
+
+# bit layout of BitCardSet: one bit per card, 13 bits per suit,
+# bit index = card.index = suit.value * 13 + (card.value - 2)
+SUIT_BITS = 13
+_SUIT_MASK = (1 << SUIT_BITS) - 1
+_RANK_REPEAT = 1 | (1 << 13) | (1 << 26) | (1 << 39)
+FULL_MASK = (1 << 52) - 1
+
+def _popcount(mask: int) -> int:
+    return bin(mask).count('1')
+
+def _iter_bits(mask: int):
+    """
+    Iterate the set bit indices of mask in ascending order.
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def _value_range_mask(floor=None, roof=None) -> int:
+    """
+    Get a mask of all cards (of any suit) with floor <= value <= roof.
+    """
+    low = 0 if floor is None else max(floor - 2, 0)
+    high = SUIT_BITS - 1 if roof is None else min(roof - 2, SUIT_BITS - 1)
+    if low > high:
+        return 0
+    return (((1 << (high + 1)) - 1) ^ ((1 << low) - 1)) * _RANK_REPEAT
+
+
+class BitCardSet(rpc.RPCSerializable):
+    """
+    A set of cards stored as a 52-bit integer mask.
+
+    This is an alternative to CardSet for unordered collections of cards, such
+    as player hands. It supports the same public methods and RPC encoding, but
+    cards are always iterated in sorted order and all the queries are bit
+    operations.
+    """
+    __slots__ = ('mask',)
+
+    def __init__(self, cards=None, mask: int = 0):
+        super().__init__()
+        self.mask = mask
+        if cards is not None:
+            self.extend(cards)
+
+    @staticmethod
+    def new_full_deck():
+        """
+        Create a full deck of cards.
+        """
+        return BitCardSet(mask=FULL_MASK)
+
+    def __len__(self):
+        return _popcount(self.mask)
+
+    def __bool__(self):
+        return self.mask != 0
+
+    def __iter__(self):
+        for index in _iter_bits(self.mask):
+            yield ALL_CARDS[index]
+
+    def __getitem__(self, index):
+        return list(self)[index]
+
+    def __contains__(self, card):
+        try:
+            return bool(self.mask >> card.index & 1)
+        except AttributeError:
+            return False
+
+    def __eq__(self, other):
+        if isinstance(other, BitCardSet):
+            return self.mask == other.mask
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __sub__(self, other):
+        if isinstance(other, BitCardSet):
+            return BitCardSet(mask=self.mask & ~other.mask)
+        return BitCardSet(mask=self.mask & ~BitCardSet(other).mask)
+
+    def __copy__(self):
+        return BitCardSet(mask=self.mask)
+
+    def __deepcopy__(self, memo):
+        return BitCardSet(mask=self.mask)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def rpc_encode(self):
+        return [rpc.rpc_encode(card) for card in self]
+
+    @classmethod
+    def rpc_decode(cls, rpcobj):
+        cset = cls()
+        for card in rpcobj:
+            cset.append(rpc.rpc_decode(Card, card))
+        return cset
+
+    def append(self, card):
+        """
+        Add a card to the set.
+        """
+        self.mask |= 1 << card.index
+
+    def extend(self, cards):
+        """
+        Add several cards to the set.
+        """
+        if isinstance(cards, BitCardSet):
+            self.mask |= cards.mask
+        else:
+            for card in cards:
+                self.mask |= 1 << card.index
+
+    def remove(self, card):
+        """
+        Remove a card from the set.
+
+        Raises ValueError if the card is not in the set.
+        """
+        bit = 1 << card.index
+        if not self.mask & bit:
+            raise ValueError('Card not in set')
+        self.mask ^= bit
+
+    def get_cards(self, **kwargs):
+        """
+        Get cards from the set.
+
+        Supported keyword args:
+            - suit: get cards having the given suit
+            - value: get cards having the given value
+        """
+        mask = self.mask
+        if 'suit' in kwargs:
+            mask &= _SUIT_MASK << (kwargs['suit'].value * SUIT_BITS)
+
+        if 'value' in kwargs:
+            mask &= _value_range_mask(kwargs['value'], kwargs['value'])
+
+        return BitCardSet(mask=mask)
+
+    def shuffle(self):
+        """
+        Bit sets have no order, deal() always deals the cards randomly.
+        """
+        pass
+
+    def sort(self):
+        """
+        Bit sets are always iterated in sorted order.
+        """
+        pass
+
+    def take(self, card):
+        """
+        Take a selected card from the set.
+        """
+        self.remove(card)
+        return card
+
+    def clear(self):
+        """
+        Clear this set.
+        """
+        self.mask = 0
+
+    def deal(self, cardsets, rng=random):
+        """
+        Deal this set randomly and evenly into cardsets.
+        """
+        indices = list(_iter_bits(self.mask))
+        rng.shuffle(indices)
+        count = len(cardsets)
+        for i, cset in enumerate(cardsets):
+            mask = 0
+            for index in indices[i::count]:
+                mask |= 1 << index
+
+            if isinstance(cset, BitCardSet):
+                cset.mask |= mask
+            else:
+                cset.extend(BitCardSet(mask=mask))
+
+        self.mask = 0
+
+    def _get_value_mask(self, kwargs):
+        """
+        Collapse the cards allowed by floor/roof into a 13-bit value mask.
+
+        Return a tuple of (value_mask, card_mask).
+        """
+        mask = self.mask
+        if 'floor' in kwargs or 'roof' in kwargs:
+            mask &= _value_range_mask(kwargs.get('floor'), kwargs.get('roof'))
+
+        return (mask | mask >> 13 | mask >> 26 | mask >> 39) & _SUIT_MASK, mask
+
+    def _get_card_by_value(self, mask: int, vbit: int) -> Card:
+        """
+        Get the card with the lowest suit among cards having the value vbit.
+        """
+        mask &= _RANK_REPEAT << vbit
+        return ALL_CARDS[(mask & -mask).bit_length() - 1]
+
+    def get_highest(self, **kwargs):
+        """
+        Get the card with the highest value.
+        """
+        values, mask = self._get_value_mask(kwargs)
+        if not values:
+            return None
+        return self._get_card_by_value(mask, values.bit_length() - 1)
+
+    def get_lowest(self, **kwargs):
+        """
+        Get the card with the lowest value.
+        """
+        values, mask = self._get_value_mask(kwargs)
+        if not values:
+            return None
+        return self._get_card_by_value(mask, (values & -values).bit_length() - 1)
+
+
 class GameState(rpc.RPCSerializable):
     """
     State of a single game.
     """
     rpc_attrs = ('status', 'mode', 'table:CardSet', 'score', 'tricks', 'turn',
-            'turn_id', 'dealer')
+            'turn_id', 'dealer', 'version')
 
     # statuses
     OPEN = 0
@@ -387,6 +683,8 @@ class GameState(rpc.RPCSerializable):
         self.turn = 0
         self.turn_id = 0
         self.dealer = 0
+        # incremented by the controller when the state changes
+        self.version = 0
 
     def update(self, new_state):
         """
@@ -396,6 +694,17 @@ class GameState(rpc.RPCSerializable):
             if hasattr(new_state, attr):
                 setattr(self, attr, getattr(new_state, attr))
 
+    def rpc_encode(self) -> dict:
+        """
+        Encode the state. The score and tricks lists are copied, as the game
+        changes them in place.
+        """
+        rpcobj = super().rpc_encode()
+        for attr in ('score', 'tricks'):
+            if attr in rpcobj:
+                rpcobj[attr] = list(rpcobj[attr])
+        return rpcobj
+
     def next_in_turn(self, thenext=None):
         """
         Set the next player in turn.
@@ -413,3 +722,69 @@ class GameState(rpc.RPCSerializable):
                 (statusstr[self.status], modestr[self.mode], str(self.score),
                         str(self.tricks), self.dealer)
 
+
+
+class GameStateSnapshot(rpc.RPCSerializable):
+    """
+    Immutable copy of a GameState, taken when the players are notified of
+    a game event. The same snapshot is passed to all the players, so its
+    RPC form and the events made of it are created only once.
+    """
+    __slots__ = ('status', 'mode', 'table', 'score', 'tricks', 'rami_chosen_by',
+            'turn', 'turn_id', 'dealer', 'version', '_rpcobj', '_events')
+    rpc_attrs = GameState.rpc_attrs
+
+    def __init__(self, state: GameState):
+        init = super().__setattr__
+        init('status', state.status)
+        init('mode', state.mode)
+        init('table', tuple(state.table))
+        init('score', tuple(state.score))
+        init('tricks', tuple(state.tricks))
+        init('rami_chosen_by', state.rami_chosen_by)
+        init('turn', state.turn)
+        init('turn_id', state.turn_id)
+        init('dealer', state.dealer)
+        init('version', state.version)
+        init('_rpcobj', None)
+        init('_events', {})
+
+    def __setattr__(self, attr, value):
+        raise AttributeError('GameStateSnapshot is immutable')
+
+    def __delattr__(self, attr):
+        raise AttributeError('GameStateSnapshot is immutable')
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def rpc_encode(self) -> dict:
+        """
+        Encode the snapshot like a GameState. The encoded dict is cached
+        and shared, it must not be modified.
+        """
+        if self._rpcobj is None:
+            rpcobj = {'status': self.status, 'mode': self.mode,
+                    'table': [rpc.rpc_encode(card) for card in self.table],
+                    'score': list(self.score), 'tricks': list(self.tricks),
+                    'turn': self.turn, 'turn_id': rpc.rpc_encode(self.turn_id),
+                    'dealer': self.dealer, 'version': self.version}
+            for attr in [attr for attr, value in rpcobj.items() if value is None]:
+                del rpcobj[attr]
+            super().__setattr__('_rpcobj', rpcobj)
+        return self._rpcobj
+
+    def shared_event(self, event_cls, *args):
+        """
+        Get the event event_cls(*args, self). The event is created once for
+        the same arguments and shared by all the callers.
+        """
+        key = (event_cls,) + tuple(id(arg) for arg in args)
+        try:
+            return self._events[key]
+        except KeyError:
+            event = self._events[key] = event_cls(*args, self)
+            return event
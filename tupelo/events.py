@@ -3,7 +3,8 @@
 
 from typing import Optional
 from enum import IntEnum
-from .rpc import RPCSerializable, rpc_encode, rpc_decode
+from .rpc import RPCSerializable, TypeRegistry, UnknownTypeError, rpc_encode, rpc_decode
+from .common import ProtocolError
 
 class EventType(IntEnum):
     NONE = 0
@@ -12,11 +13,15 @@ class EventType(IntEnum):
     TRICK_PLAYED = 3
     TURN = 4
     STATE_CHANGED = 5
+    RESYNC = 6
 
     def rpc_encode(self):
         return int(self)
 
 
+# Event classes by EventType
+event_types = TypeRegistry('event type')
+
 class Event(RPCSerializable):
     """
     Class for events.
@@ -24,16 +29,34 @@ class Event(RPCSerializable):
     type = EventType.NONE
     rpc_attrs = ('type',)
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'type' in cls.__dict__:
+            event_types.register(cls.type, cls)
+
+    def rpc_encode(self):
+        """
+        Encode the event. Events are not modified once created, so the
+        encoded dict is cached and shared by all the recipients.
+        """
+        rpcobj = self.__dict__.get('_rpcobj')
+        if rpcobj is None:
+            rpcobj = self._rpcobj = super().rpc_encode()
+        return rpcobj
+
     @classmethod
     def rpc_decode(cls, rpcobj):
         """
         Decode an rpc object into an Event instance.
         """
-        for subcls in cls.__subclasses__():
-            if getattr(subcls, 'type') == rpcobj['type']:
-                return rpc_decode(subcls, rpcobj)
+        try:
+            subcls = event_types.lookup(rpcobj.get('type'))
+        except UnknownTypeError as error:
+            raise ProtocolError(str(error))
+
+        return subcls.rpc_decode_simple(rpcobj)
 
-        return cls.rpc_decode_simple(rpcobj)
+event_types.register(Event.type, Event)
 
 
 class CardPlayedEvent(Event):
@@ -95,6 +118,13 @@ class StateChangedEvent(Event):
         self.game_state = game_state
 
 
+class ResyncEvent(Event):
+    """
+    Events have been dropped, the full game state must be fetched.
+    """
+    type = EventType.RESYNC
+
+
 class EventList(list, RPCSerializable):
     """
     Class for event lists.
@@ -109,3 +139,91 @@ class EventList(list, RPCSerializable):
             elist.append(rpc_decode(Event, event))
         return elist
 
+
+def state_delta(base: dict, rpcstate: dict) -> dict:
+    """
+    Get the delta from an RPC-form game state to another: the changed
+    fields, the version of both states and the fields that were removed.
+    """
+    delta = {}
+    for key, value in rpcstate.items():
+        if base.get(key) != value:
+            delta[key] = value
+    delta['base'] = base.get('version')
+    delta['version'] = rpcstate.get('version')
+    removed = [key for key in base if key not in rpcstate]
+    if removed:
+        delta['removed'] = removed
+    return delta
+
+def apply_state_delta(base: dict, delta: dict) -> dict:
+    """
+    Apply a delta to an RPC-form game state, returning the new state.
+    """
+    rpcstate = dict(base)
+    for key, value in delta.items():
+        if key != 'base' and key != 'removed':
+            rpcstate[key] = value
+    for key in delta.get('removed', ()):
+        rpcstate.pop(key, None)
+    return rpcstate
+
+
+class StateDeltaEncoder():
+    """
+    Server side encoder of the events of one client, replacing the game
+    state of an event with a 'state_delta' to the previous state sent.
+    The first state is sent in full.
+    """
+    def __init__(self):
+        self.base = None
+
+    def reset(self, rpcstate: Optional[dict] = None):
+        """
+        Set the state the client has, after sending it a full state.
+        """
+        self.base = rpcstate
+
+    def encode(self, events) -> list:
+        rpcevents = []
+        for event in events:
+            rpcevent = rpc_encode(event)
+            rpcstate = rpcevent.get('game_state')
+            if rpcstate is not None:
+                if self.base is not None:
+                    # the encoded event may be shared, don't modify it
+                    rpcevent = dict(rpcevent)
+                    del rpcevent['game_state']
+                    rpcevent['state_delta'] = state_delta(self.base, rpcstate)
+                self.base = rpcstate
+            rpcevents.append(rpcevent)
+        return rpcevents
+
+
+class StateDeltaDecoder():
+    """
+    Client side decoder of events with state deltas. If a delta is not
+    based on the last known state, the full state is fetched by calling
+    resync(), which must return the current RPC-form game state.
+    """
+    def __init__(self, resync):
+        self.resync = resync
+        self.state = None
+
+    def decode(self, rpcevents: list) -> EventList:
+        resynced = False
+        for rpcevent in rpcevents:
+            delta = rpcevent.pop('state_delta', None)
+            # after a resync, the fetched state is newer than anything left
+            if delta is not None:
+                if resynced:
+                    pass
+                elif self.state is not None and delta.get('base') == self.state.get('version'):
+                    self.state = apply_state_delta(self.state, delta)
+                else:
+                    self.state = self.resync()
+                    resynced = True
+                rpcevent['game_state'] = self.state
+            elif rpcevent.get('game_state') is not None and not resynced:
+                self.state = rpcevent['game_state']
+        return rpc_decode(EventList, rpcevents)
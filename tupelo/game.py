@@ -4,31 +4,83 @@
 
 import threading
 import sys
-import copy
+import random
 import logging
 from typing import Optional, List
 
-from .common import CardSet, Card
+from .common import BitCardSet, Card, PlayedCard
 from .common import NOLO, RAMI, DIAMOND, HEART
 from .common import TURN_NONE
-from .common import RuleError, GameError, GameState
+from .common import RuleError, GameError, GameState, GameStateSnapshot
 from .common import synchronized_method
 from .players import Player, ThreadedPlayer
+from .rules import SUIT_MASKS, trick_winner, score_hand
 
 logger = logging.getLogger()
 
+
+class HandResult():
+    """
+    Result of a single played hand.
+    """
+    def __init__(self, mode: int, tricks: List[int], winner: int, score: int,
+            rami_team: Optional[int] = None, fell_down: bool = False):
+        self.mode = mode
+        self.tricks = tricks
+        self.winner = winner
+        self.score = score
+        self.rami_team = rami_team
+        self.fell_down = fell_down
+
+    def __repr__(self):
+        return '<HandResult: team %d won %d with tricks %s>' % (self.winner,
+                self.score, self.tricks)
+
+
+class GameResult():
+    """
+    Result of a game played with GameController.run_headless().
+    """
+    def __init__(self):
+        self.winner = None
+        self.score = [0, 0]
+        self.hands = []
+
+    def __repr__(self):
+        return '<GameResult: winner %s, score %s, %d hands>' % (self.winner,
+                self.score, len(self.hands))
+
+
 class GameController():
     """
     The controller class that runs everything.
     """
 
-    def __init__(self):
+    def __init__(self, rng=None):
         super().__init__()
         self.players = []
         self.state = GameState()
         self.shutdown_event = threading.Event()
         self.id = None
         self.lock_start = threading.Lock()
+        self.rng = rng or random
+        # headless games are driven by run_headless() instead of threads
+        self.headless = False
+        self.result = None
+        # the players of a headless game to call for each callback
+        self._listeners = None
+        # called with the controller and the old status after a status change
+        self.status_hook = None
+        # called with the controller after players have joined or left
+        self.players_hook = None
+
+    @property
+    def version(self) -> int:
+        """
+        Version of the game, increased whenever the state or the players
+        change.
+        """
+        return self.state.version
 
     def register_player(self, player: Player):
         """
@@ -46,6 +98,7 @@ class GameController():
             player.id = str(self.players.index(player))
 
         player.team = self.players.index(player) % 2
+        self._players_changed()
 
     def player_leave(self, player_id: int):
         """
@@ -57,6 +110,7 @@ class GameController():
             self.players.remove(plr)
             plr.hand.clear()
             plr.stop() # stops the thread in case of ThreadedPlayer
+            self._players_changed()
 
         # reset the game unless we are still in OPEN state
         if self.state.status != GameState.OPEN:
@@ -99,9 +153,38 @@ class GameController():
         """
         Change the game state.
         """
+        old_status = self.state.status
         self.state.status = new_status
+        self._status_changed(old_status)
+        self._notify('state_changed')
+
+    def _players_changed(self):
+        self.state.version += 1
+        if self.players_hook is not None:
+            self.players_hook(self)
+
+    def _status_changed(self, old_status: int):
+        if self.status_hook is not None and self.state.status != old_status:
+            self.status_hook(self, old_status)
+
+    def _notify(self, callback: str, *args):
+        """
+        Call a callback of all the players with args and a snapshot of the
+        game state. All the players get the same snapshot.
+
+        In a headless game the bots are called synchronously and get the
+        game state itself, and only the bots that implement the callback are
+        called.
+        """
+        if self.headless:
+            for player in self._listeners[callback]:
+                getattr(player, callback)(*args, self.state)
+            return
+
+        self.state.version += 1
+        snapshot = GameStateSnapshot(self.state)
         for player in self.players:
-            player.state_changed(self.state)
+            getattr(player, callback)(*args, snapshot)
 
     def _stop_players(self):
         """
@@ -124,7 +207,14 @@ class GameController():
         logger.info('Resetting')
         self._stop_players()
         self.players = []
+        old_status = self.state.status
+        version = self.state.version
         self.state = GameState()
+        # the version keeps increasing over resets
+        self.state.version = version + 1
+        self._status_changed(old_status)
+        if self.players_hook is not None:
+            self.players_hook(self)
 
     def _get_team_players(self, team: int) -> List[Player]:
         """
@@ -143,6 +233,10 @@ class GameController():
         """
         Send a message to all players.
         """
+        if self.headless:
+            # bots do not read messages
+            return
+
         logger.debug(msg)
         for player in self.players:
             player.send_message('', msg)
@@ -170,10 +264,60 @@ class GameController():
         self.shutdown_event.wait()
         self.shutdown()
 
+    def run_headless(self, max_hands: Optional[int] = None) -> GameResult:
+        """
+        Play a complete game synchronously in the calling thread.
+
+        No player threads are started: the player in turn is asked to vote or
+        play directly, so all players must be bots. The players share the
+        game state of the controller instead of getting copies of it, and
+        get no messages. The game ends when a team wins or after max_hands
+        hands. Return a GameResult.
+
+        A game takes about 45 hands. With four DummyBotPlayers about 30
+        games (1400 hands) are played per second on one core, with two of
+        them replaced by CountingBotPlayers about 20 games (850 hands).
+        """
+        if self.state.status != GameState.OPEN:
+            raise GameError('Game already started')
+
+        if len(self.players) < 4:
+            raise GameError('Not enough players')
+
+        self.headless = True
+        self.result = GameResult()
+        self._listeners = {}
+        for callback in ('card_played', 'trick_played', 'state_changed'):
+            self._listeners[callback] = [player for player in self.players
+                    if getattr(type(player), callback) is not getattr(Player, callback)]
+        for player in self.players:
+            player.controller = self
+            player.game_state = self.state
+
+        self._start_new_hand()
+        while not self.shutdown_event.is_set():
+            if max_hands is not None and len(self.result.hands) >= max_hands:
+                break
+
+            player = self._get_player_in_turn(self.state.turn)
+            if self.state.status == GameState.VOTING:
+                player.vote()
+            else:
+                player.play_card()
+
+        self.state.status = GameState.STOPPED
+        self.result.score = list(self.state.score)
+        return self.result
+
     def _signal_act(self):
         """
         Tell the player who is in turn to act.
         """
+        if self.headless:
+            return
+
+        # the table or turn may have changed since the last notification
+        self.state.version += 1
         self._get_player_in_turn(self.state.turn).act(self, self.state)
 
     def _start_new_hand(self):
@@ -183,19 +327,12 @@ class GameController():
         logger.info('New hand')
         self.state.tricks = [0, 0]
 
-        # create a full deck
-        deck = CardSet.new_full_deck()
-
-        logger.debug('deck is %s', str(deck))
-        deck.shuffle()
-        logger.debug('shuffled deck %s', str(deck))
-
-        deck.deal([player.hand for player in self.players])
+        # create a full deck and deal it randomly
+        deck = BitCardSet.new_full_deck()
+        deck.deal([player.hand for player in self.players], self.rng)
 
         for player in self.players:
-            player.hand.sort()
-            logger.debug("%s's hand: %s", player.player_name,
-                str(player.hand))
+            logger.debug("%s's hand: %s", player.player_name, player.hand)
 
         # voting
         self.state.mode = NOLO
@@ -213,17 +350,19 @@ class GameController():
         A trick (4 cards) has been played.
         """
         table = self.state.table
-        high = table.get_cards(suit=table[0].suit).get_highest()
+        high = table[trick_winner([card.index for card in table])]
         high_played_by = self.get_player(high.played_by)
         team = high_played_by.team
-        self._send_msg('Team %s takes this trick' % (self._get_team_str(team)))
         self.state.tricks[team] += 1
-        self._send_msg('Tricks: %s' % self.state.tricks)
+        if not self.headless:
+            self._send_msg('Team %s takes this trick' % (self._get_team_str(team)))
+            self._send_msg('Tricks: %s' % self.state.tricks)
         # send signals
-        for plr in self.players:
-            plr.trick_played(high_played_by, self.state)
+        self._notify('trick_played', high_played_by)
 
         self.state.table.clear()
+        # the trick was sent with the cards still on the table
+        self.state.version += 1
 
         # do we have a winner?
         if self.state.tricks[0] + self.state.tricks[1] == 13:
@@ -236,32 +375,24 @@ class GameController():
         """
         A hand has been played.
         """
+        rami_team = None
+        if self.state.mode == RAMI and self.state.rami_chosen_by:
+            rami_team = self.state.rami_chosen_by.team
 
-        if self.state.mode == NOLO:
-            if self.state.tricks[0] < self.state.tricks[1]:
-                winner = 0
-                loser = 1
-            else:
-                winner = 1
-                loser = 0
-            score = (7 - self.state.tricks[winner]) * 4
-        else:
-            if self.state.tricks[0] > self.state.tricks[1]:
-                winner = 0
-                loser = 1
-            else:
-                winner = 1
-                loser = 0
-            if self.state.rami_chosen_by and self.state.rami_chosen_by.team != winner:
-                self._send_msg("Double points for taking opponent's rami!")
-                score = (self.state.tricks[winner] - 6) * 8
-            else:
-                score = (self.state.tricks[winner] - 6) * 4
+        winner, score = score_hand(self.state.mode, self.state.tricks, rami_team)
+        loser = 1 - winner
+        if rami_team is not None and rami_team != winner:
+            self._send_msg("Double points for taking opponent's rami!")
 
         self._send_msg('Team %s won this hand with %d tricks' %
                 (self._get_team_str(winner), self.state.tricks[winner]))
 
-        if self.state.score[loser] > 0:
+        fell_down = self.state.score[loser] > 0
+        if self.result is not None:
+            self.result.hands.append(HandResult(self.state.mode,
+                list(self.state.tricks), winner, score, rami_team, fell_down))
+
+        if fell_down:
             self._send_msg('Team %s fell down' % (self._get_team_str(loser)))
             self.state.score = [0, 0]
         else:
@@ -269,6 +400,10 @@ class GameController():
             if self.state.score[winner] > 52:
                 self._send_msg('Team %s won with score %d!' %
                         (self._get_team_str(winner), self.state.score[winner]))
+                if self.result is not None:
+                    self.result.winner = winner
+                # let the players see the final score
+                self._notify('state_changed')
                 self.shutdown_event.set()
                 return
             else:
@@ -278,6 +413,14 @@ class GameController():
         self.state.dealer = (self.state.dealer + 1) % 4
         self._start_new_hand()
 
+    def stop(self):
+        """
+        Stop the game and its players, and remove the players. Unlike
+        shutdown(), returns to the caller.
+        """
+        self._reset()
+        self.shutdown_event.set()
+
     def shutdown(self):
         """
         Shutdown the game.
@@ -291,12 +434,10 @@ class GameController():
         """
         table = self.state.table
 
-        card = copy.copy(card)
-        card.played_by = player.id
+        card = PlayedCard(card, player.id)
         table.append(card)
         # fire signals
-        for plr in self.players:
-            plr.card_played(player, card, self.state)
+        self._notify('card_played', player, card)
 
         if card.suit == DIAMOND or card.suit == HEART:
             self.state.mode = RAMI
@@ -338,16 +479,17 @@ class GameController():
         elif self.state.status == GameState.ONGOING:
             # make sure that suit is followed
             if len(table) > 0 and card.suit != table[0].suit:
-                if len(player.hand.get_cards(suit=table[0].suit)) > 0:
+                if player.hand.mask & SUIT_MASKS[table[0].suit.value]:
                     raise RuleError('Suit must be followed')
 
             # make sure that the player actually has the card
             try:
-                table.append(player.hand.take(card))
-                card.played_by = player.id
+                card = PlayedCard(player.hand.take(card), player.id)
             except ValueError:
                 raise RuleError('Invalid card')
 
+            table.append(card)
+
             if len(table) == 4:
                 # TODO: there must be a better way for this
                 turn_backup = self.state.turn
@@ -355,15 +497,13 @@ class GameController():
                 # fire signals with temporary state
                 # this is to let clients know that all four cards have been played
                 # and it's nobody's turn yet
-                for plr in self.players:
-                    plr.card_played(player, card, self.state)
+                self._notify('card_played', player, card)
 
                 self.state.turn = turn_backup
                 self._trick_played()
             else:
                 self._next_in_turn()
                 # fire signals
-                for plr in self.players:
-                    plr.card_played(player, card, self.state)
+                self._notify('card_played', player, card)
                 self._signal_act()
 
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+"""
+Inference of where the unseen cards of a hand are.
+
+A CardInference follows the card_played callbacks of one player and keeps,
+for every other player, the mask of the cards that the player may still
+hold. Played cards are removed, cards shown when voting are known to stay
+in the voter's hand, and a player who does not follow suit is void in the
+led suit. Every event is handled with a few bit operations.
+"""
+
+import random
+from typing import Dict, List, Optional, Sequence
+
+from .common import FULL_MASK, Card, GameState
+from .rules import SUIT_MASKS
+
+# how many times sample_hands() tries to satisfy the constraints
+SAMPLE_ATTEMPTS = 20
+
+def sample_hands(possible: Sequence[int], counts: Sequence[int], rng=random) -> List[int]:
+    """
+    Deal cards randomly so that hand i gets counts[i] cards, all from
+    possible[i]. Every card in some possible mask is dealt once.
+
+    Cards that fewer hands can hold are dealt first. If the constraints
+    cannot be met after a few attempts, they are relaxed to dealing the
+    cards evenly by counts.
+    """
+    cards = []
+    mask = 0
+    for poss in possible:
+        mask |= poss
+    while mask:
+        low = mask & -mask
+        candidates = [i for i, poss in enumerate(possible) if poss & low]
+        cards.append((len(candidates), low, candidates))
+        mask ^= low
+
+    for _ in range(SAMPLE_ATTEMPTS):
+        rng.shuffle(cards)
+        cards.sort(key=lambda item: item[0])
+        hands = [0] * len(possible)
+        left = list(counts)
+        for _, bit, candidates in cards:
+            total = 0
+            for i in candidates:
+                total += left[i]
+            if total == 0:
+                break
+            # the more room a hand has, the more likely it gets the card
+            pick = rng.randrange(total)
+            for i in candidates:
+                pick -= left[i]
+                if pick < 0:
+                    break
+            hands[i] |= bit
+            left[i] -= 1
+        else:
+            return hands
+
+    # give up on the constraints
+    bits = [bit for _, bit, _ in cards]
+    rng.shuffle(bits)
+    hands = [0] * len(possible)
+    pos = 0
+    for i, count in enumerate(counts):
+        for bit in bits[pos:pos + count]:
+            hands[i] |= bit
+        pos += count
+    return hands
+
+
+class CardInference():
+    """
+    Track the possible locations of unseen cards from the point of view
+    of one player. Call reset() when a new hand has been dealt and
+    card_played() for every card played.
+    """
+
+    def __init__(self, player_id=None, hand: int = 0):
+        self.reset(player_id, hand)
+
+    def reset(self, player_id, hand: int):
+        """
+        Start a new hand. hand is the mask of the player's own cards.
+        """
+        self.player_id = player_id
+        self.hand_size = bin(hand).count('1')
+        self.played = 0
+        # cards known to be in a hand (shown when voting)
+        self.shown = 0
+        self.possible = {player_id: hand}
+        self.known = {}
+        self.counts = {player_id: self.hand_size}
+
+    def _add_player(self, player_id):
+        self.possible[player_id] = FULL_MASK & ~self.played & ~self.shown & \
+                ~self.possible[self.player_id]
+        self.known[player_id] = 0
+        self.counts[player_id] = self.hand_size
+
+    @property
+    def unseen(self) -> int:
+        """
+        Mask of the cards not played and not in the player's own hand.
+        """
+        return FULL_MASK & ~self.played & ~self.possible[self.player_id]
+
+    def possible_mask(self, player_id) -> int:
+        """
+        Get the mask of the cards the given player may hold.
+        """
+        if player_id not in self.possible:
+            self._add_player(player_id)
+        return self.possible[player_id]
+
+    def known_mask(self, player_id) -> int:
+        """
+        Get the mask of the cards the given player is known to hold.
+        """
+        if player_id == self.player_id:
+            return self.possible[player_id]
+        return self.known.get(player_id, 0) & ~self.played
+
+    def cards_left(self, player_id) -> int:
+        """
+        Get the number of cards in the given player's hand.
+        """
+        return self.counts.get(player_id, self.hand_size)
+
+    def is_void(self, player_id, suit) -> bool:
+        """
+        Return True if the player cannot have cards of the suit.
+        """
+        return not self.possible_mask(player_id) & SUIT_MASKS[suit.value]
+
+    def card_played(self, player_id, card: Card, game_state: GameState):
+        """
+        Update the inference with a card played by the given player. The
+        game state is the one passed to Player.card_played().
+        """
+        bit = 1 << card.index
+        if player_id not in self.possible:
+            self._add_player(player_id)
+
+        if game_state.status == GameState.VOTING:
+            # the voting card stays in the voter's hand
+            if player_id != self.player_id:
+                self.shown |= bit
+                self.known[player_id] |= bit
+                for other in self.possible:
+                    if other != player_id:
+                        self.possible[other] &= ~bit
+            return
+
+        self.played |= bit
+        for other in self.possible:
+            self.possible[other] &= ~bit
+        self.counts[player_id] -= 1
+        if player_id == self.player_id:
+            return
+
+        table = game_state.table
+        if len(table) > 1 and card.suit != table[0].suit:
+            # did not follow suit
+            self.possible[player_id] &= ~SUIT_MASKS[table[0].suit.value]
+        if self.counts[player_id] == 0:
+            self.possible[player_id] = 0
+
+    def sample(self, player_ids: Sequence, rng=random) -> Dict[object, int]:
+        """
+        Sample a deal of the unseen cards to the other players, consistent
+        with the inference. Return a dict of player id -> hand mask,
+        including the player's own hand.
+        """
+        others = [pid for pid in player_ids if pid != self.player_id]
+        hands = sample_hands([self.possible_mask(pid) for pid in others],
+                [self.cards_left(pid) for pid in others], rng)
+        deal = dict(zip(others, hands))
+        deal[self.player_id] = self.possible[self.player_id]
+        return deal
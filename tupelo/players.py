@@ -2,9 +2,16 @@
 # vim: set sts=4 sw=4 et:
 
 import threading
-from .common import Card, CardSet, SPADE, CLUB, HEART, DIAMOND
-from .common import NOLO, RAMI
+import math
+import time
+import random
+import concurrent.futures
+import multiprocessing
+from .common import Card, CardSet, BitCardSet, SPADE, CLUB, HEART, DIAMOND
+from .common import NOLO, RAMI, ALL_CARDS
 from .common import RuleError, UserQuit, GameState
+from .inference import CardInference, sample_hands
+from .position import Position
 from .rpc import RPCSerializable
 
 class Player(RPCSerializable):
@@ -17,7 +24,7 @@ class Player(RPCSerializable):
         super().__init__()
         self.id = None
         self.player_name = name
-        self.hand = CardSet()
+        self.hand = BitCardSet()
         self.team: int = 0
         self.controller = None
         self.game_state = GameState()
@@ -30,7 +37,7 @@ class Player(RPCSerializable):
         Make Player classes safe for pickling and deepcopying.
         """
         state = {}
-        for key, _ in self.iter_rpc_attrs():
+        for key, _ in self._rpc_fields:
             state[key] = getattr(self, key)
 
         return state
@@ -41,11 +48,7 @@ class Player(RPCSerializable):
         Decode an RPC-form object into an instance of cls.
         """
         player = cls(rpcobj['player_name'])
-        for attr, atype in cls.iter_rpc_attrs():
-            if attr != 'player_name':
-                player.rpc_decode_attr(rpcobj, attr, atype)
-
-        return player
+        return cls._rpc_decode_fields(player, rpcobj)
 
     def start(self):
         """
@@ -136,7 +139,7 @@ class ThreadedPlayer(Player):
         Return true if the player thread is alive.
         """
         if self.thread is not None:
-            return self.thread.isAlive()
+            return self.thread.is_alive()
 
         return False
 
@@ -362,31 +365,230 @@ class CountingBotPlayer(DummyBotPlayer):
 
     def __init__(self, name):
         super().__init__(name)
-        self.cards_left = CardSet()
+        self.inference = CardInference()
 
-    def vote(self):
+    @property
+    def cards_left(self) -> BitCardSet:
         """
-        Vote for rami or nolo.
+        The cards not played and not in this player's hand.
+        """
+        return BitCardSet(mask=self.inference.unseen)
+
+    def state_changed(self, game_state: GameState):
+        """
+        Start counting again when a new hand has been dealt.
         """
-        self.cards_left = CardSet.new_full_deck() - self.hand
-        super(CountingBotPlayer, self).vote()
+        if game_state.status == GameState.VOTING:
+            self.inference.reset(self.id, self.hand.mask)
 
     def card_played(self, player: Player, card: Card, game_state: GameState):
         """
         Signal that a card has been played by the given player.
         """
-        if player == self:
-            return
+        self.inference.card_played(player.id, card, game_state)
+
+
+def sample_deal(seat: int, possible, counts, rng) -> list:
+    """
+    Sample the hands of the other players.
+
+    possible has the masks of the cards each seat may hold, the player's
+    own hand in seat, and counts the number of cards in each seat. Return
+    a list of four hand masks.
+    """
+    others = [other for other in range(4) if other != seat]
+    dealt = sample_hands([possible[other] for other in others],
+            [counts[other] for other in others], rng)
+    hands = list(possible)
+    for other, hand in zip(others, dealt):
+        hands[other] = hand
+    return hands
+
+
+class _ISMCTSNode():
+    __slots__ = ('children', 'visits', 'reward', 'avail')
+
+    def __init__(self):
+        self.children = {}
+        self.visits = 0
+        self.reward = 0.0
+        self.avail = 1
+
+
+def _reward(pos: Position, team: int) -> float:
+    """
+    Get the reward (0..1) of a finished hand for a team.
+    """
+    winner, points = pos.result()
+    if winner != team:
+        points = -points
+    # rami points can be at most 7 * 8
+    return 0.5 + points / 112.0
+
+def ismcts_search(info: tuple, time_budget: float = None, iterations: int = None,
+        seed=None, exploration: float = 0.7) -> dict:
+    """
+    Run an information set Monte Carlo tree search for one move.
+
+    info is a tuple of (seat, possible, counts, mode, leader, table,
+    tricks, rami_team) describing what the player in seat knows, see
+    sample_deal(). Each
+    iteration samples a deal of the unseen cards, descends the tree using
+    the moves that are legal in that deal and finishes the hand with a
+    random playout. Return a dict of root move -> visit count.
+    """
+    seat, possible, counts, mode, leader, table, tricks, rami_team = info
+    rng = random.Random(seed)
+    root = _ISMCTSNode()
+    if time_budget is None and iterations is None:
+        iterations = 1000
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    done = 0
+    while True:
+        if iterations is not None and done >= iterations:
+            break
+        # checking the clock is relatively expensive
+        if deadline is not None and done % 16 == 0 and time.monotonic() > deadline:
+            break
+        done += 1
+
+        pos = Position(sample_deal(seat, possible, counts, rng), mode,
+                leader, table, tricks, rami_team)
+        node = root
+        path = []
+        # selection and expansion
+        while not pos.is_over():
+            legal = pos.legal_moves()
+            untried = [move for move in legal if move not in node.children]
+            if untried:
+                move = rng.choice(untried)
+                child = node.children[move] = _ISMCTSNode()
+            else:
+                best = None
+                for move in legal:
+                    cand = node.children[move]
+                    value = cand.reward / cand.visits + exploration * \
+                            math.sqrt(math.log(cand.avail) / cand.visits)
+                    if best is None or value > best:
+                        best = value
+                        child = cand
+                        chosen = move
+                    cand.avail += 1
+                move = chosen
+            path.append((child, pos.turn % 2))
+            pos.apply(move)
+            node = child
+            if untried:
+                break
+
+        # playout
+        while not pos.is_over():
+            pos.apply(rng.choice(pos.legal_moves()))
+
+        rewards = (_reward(pos, 0), _reward(pos, 1))
+        for child, team in path:
+            child.visits += 1
+            child.reward += rewards[team]
+
+    return {move: child.visits for move, child in root.children.items()}
 
+
+class ISMCTSBotPlayer(DummyBotPlayer):
+    """
+    Robot player that picks cards with information set Monte Carlo tree
+    search. Voting is done like DummyBotPlayer does.
+
+    The search runs for time_budget seconds or the given number of
+    iterations per move. With processes > 1 independent searches are run
+    in a process pool and their root visit counts are summed (root
+    parallelization).
+    """
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, name, time_budget: float = 0.2, iterations: int = None,
+            processes: int = 1, seed=None):
+        super().__init__(name)
+        self.time_budget = time_budget
+        self.iterations = iterations
+        self.processes = processes
+        self.rng = random.Random(seed)
+        self.inference = CardInference()
+
+    @classmethod
+    def _get_pool(cls, processes: int):
+        """
+        Get a shared process pool. Spawned processes are used since the
+        server runs other threads.
+        """
+        with cls._pools_lock:
+            if processes not in cls._pools:
+                cls._pools[processes] = concurrent.futures.ProcessPoolExecutor(
+                        processes, mp_context=multiprocessing.get_context('spawn'))
+            return cls._pools[processes]
+
+    def state_changed(self, game_state: GameState):
         if game_state.status == GameState.VOTING:
-            pass
-        elif game_state.status == GameState.ONGOING:
-            #print "removing %s  from %s" %(card, self.cards_left)
-            try:
-                self.cards_left.remove(card)
-            except ValueError:
-                print("Oops: removing card %s failed" % card)
-                # TODO: we sometimes get this with CountingBotPlayer
+            # a new hand has been dealt
+            self.inference.reset(self.id, self.hand.mask)
+
+    def card_played(self, player: Player, card: Card, game_state: GameState):
+        self.inference.card_played(player.id, card, game_state)
+
+    def _search_info(self) -> tuple:
+        """
+        Collect what this player knows about the hand for ismcts_search().
+        """
+        state = self.game_state
+        players = self.controller.players
+        seats = {plr.id: seat for seat, plr in enumerate(players)}
+        seat = seats[self.id]
+        table = [card.index for card in state.table]
+        leader = seats[state.table[0].played_by] if table else seat
+        played_tricks = state.tricks[0] + state.tricks[1]
+        counts = [13 - played_tricks] * 4
+        for i in range(len(table)):
+            counts[(leader + i) % 4] -= 1
+        possible = [self.inference.possible_mask(plr.id) for plr in players]
+        possible[seat] = self.hand.mask
+        rami_team = None
+        if state.mode == RAMI and state.rami_chosen_by is not None:
+            rami_team = state.rami_chosen_by.team
+        return (seat, possible, counts, state.mode, leader, table,
+                list(state.tricks), rami_team)
+
+    def choose_card(self) -> Card:
+        """
+        Search for the best card to play.
+        """
+        info = self._search_info()
+        seat, possible, _, mode, leader, table = info[:6]
+        legal = Position([possible[seat]] * 4, mode, leader, table).legal_moves()
+        if len(legal) == 1:
+            return ALL_CARDS[legal[0]]
+
+        if self.processes > 1:
+            pool = self._get_pool(self.processes)
+            futures = [pool.submit(ismcts_search, info, self.time_budget,
+                self.iterations, self.rng.random()) for _ in range(self.processes)]
+            results = [future.result() for future in futures]
+        else:
+            results = [ismcts_search(info, self.time_budget, self.iterations,
+                self.rng.random())]
+
+        visits = {}
+        for result in results:
+            for move, count in result.items():
+                visits[move] = visits.get(move, 0) + count
+        return ALL_CARDS[max(legal, key=lambda move: visits.get(move, 0))]
+
+    def play_card(self):
+        card = self.choose_card()
+        try:
+            self.controller.play_card(self, card)
+        except RuleError as error:
+            print('Oops', error)
+            raise
 
 
 class CliPlayer(ThreadedPlayer):
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+from typing import List, Optional, Sequence, Tuple
+
+from .common import NOLO, RAMI, ALL_CARDS, SUIT_BITS
+from .rules import legal_mask, trick_winner, score_hand
+
+
+class Position():
+    """
+    A compact, copyable position of one hand being played.
+
+    hands are card masks by seat, table is the list of card indices in the
+    current trick and seat % 2 is the team of a seat. apply() and undo()
+    play and take back moves (card indices) without any I/O or callbacks,
+    which makes the class suitable for search-based bots.
+    """
+    __slots__ = ('hands', 'table', 'leader', 'turn', 'tricks', 'mode',
+            'rami_team', '_history')
+
+    def __init__(self, hands: Sequence[int], mode: int = NOLO, leader: int = 0,
+            table: Sequence[int] = (), tricks: Sequence[int] = (0, 0),
+            rami_team: Optional[int] = None):
+        self.hands = list(hands)
+        self.mode = mode
+        self.leader = leader
+        self.table = list(table)
+        self.turn = (leader + len(self.table)) % 4
+        self.tricks = list(tricks)
+        self.rami_team = rami_team
+        self._history = []
+
+    @classmethod
+    def from_game(cls, controller) -> 'Position':
+        """
+        Create a position from the current state of a GameController.
+        """
+        state = controller.state
+        seats = {player.id: seat for seat, player in enumerate(controller.players)}
+        table = [card.index for card in state.table]
+        if table:
+            leader = seats[state.table[0].played_by]
+        else:
+            leader = state.turn
+        rami_team = None
+        if state.mode == RAMI and state.rami_chosen_by is not None:
+            rami_team = state.rami_chosen_by.team
+        return cls([player.hand.mask for player in controller.players],
+                state.mode, leader, table, state.tricks, rami_team)
+
+    def copy(self) -> 'Position':
+        """
+        Copy the position, without the move history.
+        """
+        return Position(self.hands, self.mode, self.leader, self.table,
+                self.tricks, self.rami_team)
+
+    def __repr__(self):
+        return '<Position: turn %d, table %s, tricks %s>' % (self.turn,
+                [ALL_CARDS[card] for card in self.table], self.tricks)
+
+    def legal_mask(self) -> int:
+        """
+        Get the mask of cards the player in turn may play.
+        """
+        if self.table:
+            return legal_mask(self.hands[self.turn], self.table[0] // SUIT_BITS)
+        return self.hands[self.turn]
+
+    def legal_moves(self) -> List[int]:
+        """
+        Get the card indices the player in turn may play, in ascending order.
+        """
+        mask = self.legal_mask()
+        moves = []
+        while mask:
+            low = mask & -mask
+            moves.append(low.bit_length() - 1)
+            mask ^= low
+        return moves
+
+    def apply(self, move: int):
+        """
+        Play a card. The move is not validated, see legal_moves().
+        """
+        seat = self.turn
+        self.hands[seat] ^= 1 << move
+        table = self.table
+        table.append(move)
+        if len(table) == 4:
+            winner = (self.leader + trick_winner(table)) % 4
+            self._history.append((move, seat, table, self.leader))
+            self.tricks[winner % 2] += 1
+            self.table = []
+            self.leader = self.turn = winner
+        else:
+            self._history.append((move, seat, None, self.leader))
+            self.turn = (seat + 1) % 4
+
+    def undo(self):
+        """
+        Take back the last applied move.
+        """
+        move, seat, trick, leader = self._history.pop()
+        if trick is not None:
+            self.tricks[self.leader % 2] -= 1
+            trick.pop()
+            self.table = trick
+            self.leader = leader
+        else:
+            self.table.pop()
+        self.hands[seat] |= 1 << move
+        self.turn = seat
+
+    def is_over(self) -> bool:
+        """
+        Return True if all the cards have been played.
+        """
+        return not self.table and not any(self.hands)
+
+    def cards_left(self) -> int:
+        """
+        Get the number of cards still in the hands.
+        """
+        return sum(bin(hand).count('1') for hand in self.hands)
+
+    def result(self) -> Tuple[int, int]:
+        """
+        Get the winning team and its points, see score_hand().
+        """
+        return score_hand(self.mode, self.tricks, self.rami_team)
@@ -3,10 +3,15 @@
 
 from typing import Union
 
+# types that are already in RPC-safe form
+_PLAIN_TYPES = frozenset((int, float, str, bool, type(None)))
+
 def rpc_encode(obj):
     """
     Encode an object into RPC-safe form.
     """
+    if obj.__class__ in _PLAIN_TYPES:
+        return obj
     try:
         return obj.rpc_encode()
     except AttributeError:
@@ -21,43 +26,130 @@ def rpc_decode(cls, rpcobj):
     except AttributeError:
         return rpcobj
 
-def _memoize(func, cache={}):
-    def decf(*args, **kwargs):
-        key = (func, tuple(args), frozenset(list(kwargs.items())))
-        if key not in cache:
-            cache[key] = func(*args, **kwargs)
-        return cache[key]
-    return decf
+def _parse_rpc_attrs(rpc_attrs) -> tuple:
+    """
+    Split 'name:Type' strings into (name, type name or None) pairs.
+    """
+    fields = []
+    for spec in rpc_attrs or ():
+        attr, _, atype = spec.partition(':')
+        fields.append((attr, atype or None))
+    return tuple(fields)
 
-def _itersubclasses(cls, _seen=None):
+def _compile_codec(cls, fields: tuple):
     """
-    itersubclasses(cls)
+    Compile the encoder and the decoder for the fields of a class.
 
-    Generator over all subclasses of a given class, in depth first order.
+    The encoder returns the dict of the RPC-form attributes of an object,
+    leaving out missing attributes and None values. The decoder sets the
+    attributes found in an RPC-form dict on an instance. Attribute types
+    are resolved on the first decode, as they may not exist yet when the
+    class is created.
     """
-    if not isinstance(cls, type):
-        raise TypeError('itersubclasses must be called with '
-                        'new-style classes, not %.100r' % cls)
-    if _seen is None:
-        _seen = set()
-    try:
-        subs = cls.__subclasses__()
-    except TypeError: # fails only when cls is type
-        subs = cls.__subclasses__(cls)
-    for sub in subs:
-        if sub not in _seen:
-            _seen.add(sub)
-            yield sub
-            for subsub in _itersubclasses(sub, _seen):
-                yield subsub
+    types = []
+    namespace = {'rpc_encode': rpc_encode, 'rpc_decode': rpc_decode,
+            '_PLAIN_TYPES': _PLAIN_TYPES, 'types': types, 'cls': cls}
+    enc = ['def encode(self):', '    rpcobj = {}']
+    dec = ['def decode(instance, rpcobj):',
+            '    if not types and cls._rpc_typed:',
+            '        types.extend(cls._resolve_rpc_types())']
+    for i, (attr, atype) in enumerate(fields):
+        enc += ['    try:',
+                '        value = self.%s' % attr,
+                '    except AttributeError:',
+                '        pass',
+                '    else:',
+                '        if value.__class__ not in _PLAIN_TYPES:',
+                '            value = rpc_encode(value)',
+                '        if value is not None:',
+                '            rpcobj[%r] = value' % attr]
+        dec += ['    if %r in rpcobj:' % attr]
+        if atype is None:
+            dec += ['        instance.%s = rpcobj[%r]' % (attr, attr)]
+        else:
+            dec += ['        instance.%s = rpc_decode(types[%d], rpcobj[%r])' %
+                    (attr, i, attr)]
+    enc.append('    return rpcobj')
+    dec.append('    return instance')
+    exec('\n'.join(enc + dec), namespace)
+    return namespace['encode'], namespace['decode']
+
+class UnknownTypeError(LookupError):
+    """
+    Error for looking up a type that has not been registered.
+    """
+    pass
+
+
+class TypeRegistry():
+    """
+    Mapping of type keys to classes, filled in when the classes are
+    created.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._classes = {}
+
+    def register(self, key, cls: type):
+        """
+        Register cls for key. Raises TypeError if another class already has
+        the key, so that classes with the same name do not silently replace
+        each other.
+        """
+        registered = self._classes.get(key)
+        if registered is not None and registered is not cls:
+            raise TypeError('Duplicate %s %r: %s.%s and %s.%s' % (self.name, key,
+                registered.__module__, registered.__qualname__,
+                cls.__module__, cls.__qualname__))
+        self._classes[key] = cls
+
+    def lookup(self, key) -> type:
+        """
+        Get the class registered for key.
+        """
+        try:
+            return self._classes[key]
+        except KeyError:
+            raise UnknownTypeError('Unknown %s %r' % (self.name, key)) from None
+
+    def __contains__(self, key):
+        return key in self._classes
+
+
+# RPCSerializable subclasses by rpc_type and by class name
+rpc_types = TypeRegistry('RPC type')
 
 class RPCSerializable():
     """
     Base class for objects that are serializable into
     an RPC-safe form.
     """
+    __slots__ = ()
     rpc_attrs = None
     rpc_type = None
+    # set by __init_subclass__
+    _rpc_fields = ()
+    _rpc_typed = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._rpc_fields = _parse_rpc_attrs(cls.rpc_attrs)
+        cls._rpc_typed = any(atype for _, atype in cls._rpc_fields)
+        cls._rpc_encode_fields, cls._rpc_decode_fields = \
+                _compile_codec(cls, cls._rpc_fields)
+        if cls.__dict__.get('rpc_type'):
+            rpc_types.register(cls.rpc_type, cls)
+        # a type name given in rpc_type takes precedence over class names
+        if cls.__name__ not in rpc_types or \
+                rpc_types.lookup(cls.__name__).__dict__.get('rpc_type') != cls.__name__:
+            rpc_types.register(cls.__name__, cls)
+
+    @classmethod
+    def _resolve_rpc_types(cls) -> list:
+        """
+        Get the classes of the attribute types, None for untyped attributes.
+        """
+        return [cls.get_class_for_type(atype) for _, atype in cls._rpc_fields]
 
     def __eq__(self, other):
         if not self.rpc_attrs:
@@ -70,7 +162,7 @@ class RPCSerializable():
             except AttributeError:
                 return False
 
-        for attr, _ in self.iter_rpc_attrs():
+        for attr, _ in self._rpc_fields:
             try:
                 if getattr(self, attr) != getattr(other, attr):
                     return False
@@ -87,37 +179,14 @@ class RPCSerializable():
         """
         Generator for iterating rpc_attrs with attr and type separated.
         """
-        if not cls.rpc_attrs:
-            return
-
-        iterator = iter(cls.rpc_attrs or tuple())
-        while 1:
-            try:
-                data = next(iterator).split(':')
-            except StopIteration:
-                return
-
-            if len(data) == 1:
-                data.append(None)
-            yield (data[0], data[1])
+        return iter(cls._rpc_fields)
 
     def rpc_encode(self) -> Union[dict, 'RPCSerializable']:
         """
         Encode an instance of RPCSerializable into an rpc object.
         """
         if self.rpc_attrs:
-            rpcobj = {}
-            for attr, _ in self.iter_rpc_attrs():
-                rpcform = None
-                try:
-                    rpcform = rpc_encode(getattr(self, attr))
-                except AttributeError:
-                    pass
-
-                if rpcform is not None:
-                    rpcobj[attr] = rpcform
-
-            return rpcobj
+            return self._rpc_encode_fields()
         # default behaviour
         return self
 
@@ -127,11 +196,7 @@ class RPCSerializable():
         Default decode method.
         """
         if cls.rpc_attrs:
-            instance = cls()
-            for attr, atype in cls.iter_rpc_attrs():
-                instance.rpc_decode_attr(rpcobj, attr, atype)
-
-            return instance
+            return cls._rpc_decode_fields(cls(), rpcobj)
         else:
             return rpcobj
 
@@ -147,27 +212,19 @@ class RPCSerializable():
         Decode one attribute.
         """
         if attr in rpcobj:
-            attr_cls = self.get_class_for_type(atype)
-            if attr_cls:
+            if atype:
+                attr_cls = self.get_class_for_type(atype)
                 setattr(self, attr,
                         rpc_decode(attr_cls, rpcobj[attr]))
             else:
                 setattr(self, attr, rpcobj[attr])
 
     @classmethod
-    @_memoize
     def get_class_for_type(cls, atype):
+        """
+        Get the class for an attribute type name, see rpc_types.
+        """
         if atype is None:
             return None
 
-        # try first if some class has a overridden type
-        for sub in _itersubclasses(RPCSerializable):
-            if sub.rpc_type == atype:
-                return sub
-        # then try with class name
-        for sub in _itersubclasses(RPCSerializable):
-            if sub.__name__ == atype:
-                return sub
-
-        return None
-
+        return rpc_types.lookup(atype)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+"""
+The rules of the game on card indices and hand masks, shared by the game
+controller and the search-based bots.
+"""
+
+from typing import Optional, Sequence, Tuple
+
+from .common import NOLO, SUIT_BITS
+
+# cards are referred to by Card.index and hands are BitCardSet masks
+SUIT_MASKS = tuple(((1 << SUIT_BITS) - 1) << (suit * SUIT_BITS) for suit in range(4))
+
+def legal_mask(hand: int, led_suit: Optional[int]) -> int:
+    """
+    Get the mask of cards in hand that may be played, given the suit value
+    of the first card of the trick (None when leading).
+    """
+    if led_suit is None:
+        return hand
+    return hand & SUIT_MASKS[led_suit] or hand
+
+def trick_winner(cards: Sequence[int]) -> int:
+    """
+    Get the position (0-3) of the winning card in a trick, given the card
+    indices in play order.
+    """
+    led = cards[0] // SUIT_BITS
+    best = 0
+    for i in range(1, len(cards)):
+        # within a suit, the card index order is the value order
+        if cards[i] // SUIT_BITS == led and cards[i] > cards[best]:
+            best = i
+    return best
+
+def score_hand(mode: int, tricks: Sequence[int], rami_team: Optional[int]) -> Tuple[int, int]:
+    """
+    Get the winning team and the points it gets from a played hand.
+    """
+    if mode == NOLO:
+        winner = 0 if tricks[0] < tricks[1] else 1
+        return (winner, (7 - tricks[winner]) * 4)
+
+    winner = 0 if tricks[0] > tricks[1] else 1
+    if rami_team is not None and rami_team != winner:
+        # double points for taking the opponent's rami
+        return (winner, (tricks[winner] - 6) * 8)
+    return (winner, (tricks[winner] - 6) * 4)
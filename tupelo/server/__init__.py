@@ -1,2 +1,3 @@
 
-from .server import *
\ No newline at end of file
+from .server import *
+from .aio import AsyncTupeloServer
@@ -0,0 +1,410 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+"""
+Asyncio HTTP server for the XML-RPC (/RPC2) and JSON (/api/) interfaces.
+
+Every connection is served by its own task, so a slow client only delays
+its own requests. Connections are kept open between requests as in
+HTTP/1.1. The interface methods are called in a pool of threads, as they
+may wait for the interface lock or for the threads of a game to stop, and
+the authenticated player is kept per request (see server.authenticated).
+A get_events call with a timeout first waits for the player's events in
+its task, without blocking the event loop or a thread.
+"""
+
+import io
+import json
+import socket
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+import concurrent.futures
+import http.client
+import urllib.parse
+import xmlrpc.client
+import xmlrpc.server
+from http import HTTPStatus
+from typing import List, Optional, Tuple
+
+from tupelo.common import GameError, RuleError, ProtocolError
+from .jsonapi import TupeloJSONDispatcher, NotModified
+from . import sse
+from . import compression
+from .server import TupeloRequestHandler, TupeloRPCInterface, MAX_EVENTS_TIMEOUT, \
+        KEEPALIVE_TIMEOUT, KEEPALIVE_MAX_REQUESTS, blocking_calls
+
+logger = logging.getLogger(__name__)
+
+# (status, [(header, value)], body)
+Response = Tuple[int, List[Tuple[str, str]], bytes]
+
+
+class AsyncTupeloServer(xmlrpc.server.SimpleXMLRPCDispatcher, TupeloJSONDispatcher):
+    """
+    Server class that combines XML-RPC and JSON servers on asyncio.
+
+    The listening socket is bound when the server is created. Run the server
+    with serve_forever(), which returns after shutdown() has been called
+    from another thread, or by awaiting serve() in a running event loop.
+    """
+    rpc_paths = TupeloRequestHandler.rpc_paths
+    json_paths = TupeloRequestHandler.json_paths
+    jsonrpc_paths = TupeloRequestHandler.jsonrpc_paths
+    # size limits of requests
+    max_header_size = 64 * 1024
+    max_body_size = 10 * 1024 * 1024
+    # the size from which responses are compressed, None to never compress
+    encode_threshold = compression.THRESHOLD
+    # persistent connections, closed after an idle timeout or max_requests
+    idle_timeout = KEEPALIVE_TIMEOUT
+    max_requests = KEEPALIVE_MAX_REQUESTS
+    # the threads calling the interface methods
+    dispatch_threads = 16
+
+    def __init__(self, server_address, logRequests=True):
+        xmlrpc.server.SimpleXMLRPCDispatcher.__init__(self)
+        TupeloJSONDispatcher.__init__(self)
+        self.logRequests = logRequests
+        self.socket = socket.create_server(server_address)
+        self.server_address = self.socket.getsockname()[:2]
+        self.register_instance(TupeloRPCInterface())
+        self.register_multicall_functions()
+        self._loop = None
+        self._stop = None
+        self._shutdown_request = threading.Event()
+        self._stopped = threading.Event()
+        # the tasks serving connections
+        self._tasks = set()
+        self._executor = concurrent.futures.ThreadPoolExecutor(self.dispatch_threads,
+                thread_name_prefix='dispatch')
+
+    async def serve(self):
+        """
+        Serve requests until shutdown() is called.
+        """
+        self._stop = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        try:
+            if self._shutdown_request.is_set():
+                return
+            server = await asyncio.start_server(self._handle_connection,
+                    sock=self.socket, limit=self.max_header_size)
+            try:
+                await self._stop.wait()
+            finally:
+                server.close()
+                # don't wait for the long polls to finish
+                for task in list(self._tasks):
+                    task.cancel()
+        finally:
+            self._loop = None
+            self._stopped.set()
+
+    def serve_forever(self):
+        """
+        Run the server in a new event loop until shutdown() is called.
+        """
+        asyncio.run(self.serve())
+
+    def shutdown(self):
+        """
+        Stop serving and wait until the server has stopped. Must not be
+        called from the event loop thread.
+        """
+        self._shutdown_request.set()
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._stop.set)
+            self._stopped.wait()
+
+    def server_close(self):
+        self.socket.close()
+        self.instance._reaper.stop()
+        self._executor.shutdown()
+
+    def shutdown_games(self):
+        """
+        Shut down all the games running on this instance.
+        """
+        for game in list(self.instance.games.values()):
+            game.shutdown()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter):
+        """
+        Serve the requests of a connection, until the client closes it, it
+        has been idle for idle_timeout seconds or max_requests have been
+        served.
+        """
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        # the task has a context of its own
+        blocking_calls.set(False)
+        try:
+            for served in range(1, self.max_requests + 1):
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader),
+                            self.idle_timeout)
+                except asyncio.TimeoutError:
+                    return
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        http.client.HTTPException, ValueError):
+                    response = (HTTPStatus.BAD_REQUEST, [], b'')
+                    request = None
+                    keep_alive = False
+                else:
+                    if request is None:
+                        return
+                    if request[0] == 'GET' and \
+                            urllib.parse.urlsplit(request[1]).path == sse.STREAM_PATH:
+                        await self._serve_event_stream(writer, request[1], request[2])
+                        return
+                    keep_alive = self._keep_alive(*request) and served < self.max_requests
+                    response = self._encode_response(request[2],
+                            await self._handle_request(*request[:4]))
+
+                status, headers, body = response
+                if self.logRequests and request is not None:
+                    logger.info('%s "%s %s" %d', writer.get_extra_info('peername'),
+                            request[0], request[1], status)
+                writer.write(self._format_response(status, headers, body, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        except asyncio.CancelledError:
+            # the server is stopping; finish the task quietly, as its
+            # cancellation would be logged as an error of the connection
+            pass
+        finally:
+            writer.close()
+            self._tasks.discard(task)
+
+    @staticmethod
+    def _keep_alive(method: str, path: str, headers, body, version: str) -> bool:
+        """
+        Whether the client wants to keep the connection open after a request.
+        """
+        connection = headers.get('Connection', '').lower()
+        if version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> \
+            Optional[Tuple[str, str, http.client.HTTPMessage, bytes, str]]:
+        """
+        Read a request. Return None if the client closed the connection.
+        """
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as err:
+            if not err.partial:
+                return None
+            raise
+
+        request_line, _, header_data = head.partition(b'\r\n')
+        method, path, version = request_line.decode('latin-1').split()
+        headers = http.client.parse_headers(io.BytesIO(header_data))
+        length = int(headers.get('Content-Length') or 0)
+        if length > self.max_body_size:
+            raise ValueError('Request body too large')
+        body = await reader.readexactly(length) if length else None
+        encoding = headers.get('Content-Encoding', 'identity').lower()
+        if body and encoding != 'identity':
+            body = compression.decompress(body, encoding, self.max_body_size)
+        return (method, path, headers, body, version)
+
+    async def _in_thread(self, func, *args, **kwargs):
+        """
+        Call a dispatcher function in the thread pool, in the context of
+        the connection task.
+        """
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    async def _handle_request(self, method: str, path: str, headers, body) -> Response:
+        for prefix in self.json_paths:
+            if path.startswith(prefix) and method in ('GET', 'POST'):
+                await self._wait_api_events(path, headers, body)
+                return await self._in_thread(self._api_response, path, headers, body)
+
+        if method == 'POST' and path in self.rpc_paths:
+            await self._wait_rpc_events(body)
+            response = await self._in_thread(self._marshaled_dispatch, body or b'', path=path)
+            return (HTTPStatus.OK, [('Content-type', 'text/xml')], response)
+
+        if method == 'POST' and path in self.jsonrpc_paths:
+            await self._wait_jsonrpc_events(body)
+            response = await self._in_thread(self.jsonrpc_dispatch, body or b'')
+            if response is None:
+                return (HTTPStatus.NO_CONTENT, [], b'')
+            return (HTTPStatus.OK, [('Content-type', 'application/json'),
+                ('Vary', 'Accept-Encoding')], response)
+
+        return (HTTPStatus.NOT_FOUND, [('Content-type', 'text/plain')], b'No such page')
+
+    async def _wait_events(self, akey, timeout):
+        """
+        Wait for at most timeout seconds until the player with the given akey
+        has events. Errors are left for the get_events call to report.
+        """
+        try:
+            timeout = min(float(timeout or 0), MAX_EVENTS_TIMEOUT)
+            player = self.instance._get_auth_player(akey)
+        except (TypeError, ValueError, GameError):
+            return
+        if timeout > 0:
+            await self._wait_player_events(player, timeout)
+
+    async def _wait_player_events(self, player, timeout: float) -> bool:
+        """
+        Wait for at most timeout seconds until the player has events.
+        Return False if there were none.
+        """
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+        def _wake():
+            loop.call_soon_threadsafe(_set_done, woken)
+
+        if not player.add_event_waiter(_wake):
+            return True
+        try:
+            await asyncio.wait_for(woken, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            player.remove_event_waiter(_wake)
+        return True
+
+    async def _serve_event_stream(self, writer: asyncio.StreamWriter, path: str, headers):
+        """
+        Send the events of a player as a Server-Sent Events stream until the
+        player quits or the client disconnects.
+        """
+        try:
+            player, last_event_id = self.event_stream_player(path, headers)
+        except GameError as err:
+            writer.write(self._format_response(HTTPStatus.FORBIDDEN,
+                [('Content-type', 'text/plain')], str(err).encode()))
+            await writer.drain()
+            return
+
+        if self.logRequests:
+            logger.info('%s "GET %s" stream', writer.get_extra_info('peername'), path)
+        head = b'HTTP/1.1 200 OK\r\nContent-type: %s\r\n' \
+                b'Cache-Control: no-cache\r\nConnection: close\r\n' % sse.CONTENT_TYPE.encode()
+        write = writer.write
+        encoding = compression.accepted_encoding(headers.get('Accept-Encoding'))
+        if encoding:
+            head += b'Content-Encoding: %s\r\n' % encoding.encode()
+            compressor = compression.StreamCompressor(encoding)
+            write = lambda data: writer.write(compressor.compress(data))
+        writer.write(head + b'\r\n')
+        for data in sse.replay(player, last_event_id):
+            write(data)
+        await writer.drain()
+        while self.event_stream_alive(player):
+            events = player.pop_sequenced_events()
+            if events:
+                write(sse.format_events(events))
+            elif not await self._wait_player_events(player, self.heartbeat_interval):
+                write(sse.HEARTBEAT)
+            await writer.drain()
+
+    async def _wait_api_events(self, path: str, headers, body):
+        try:
+            method, params = self._api_params(path, headers, body)
+        except ProtocolError:
+            return
+        if method == 'get_events':
+            await self._wait_events(params.get('akey'), params.get('timeout'))
+
+    async def _wait_rpc_events(self, body):
+        if not body or b'get_events' not in body:
+            return
+        try:
+            params, method = xmlrpc.client.loads(body)
+        except Exception:
+            # the dispatcher reports the error
+            return
+        if method == 'system.multicall' and params and isinstance(params[0], list):
+            # wait for the first get_events call of the batch
+            for call in params[0]:
+                if isinstance(call, dict) and call.get('methodName') == 'get_events':
+                    method, params = 'get_events', call.get('params') or ()
+                    break
+        if method == 'get_events' and len(params) > 2:
+            await self._wait_events(params[0], params[2])
+
+    async def _wait_jsonrpc_events(self, body):
+        if not body or b'get_events' not in body:
+            return
+        try:
+            calls = json.loads(body.decode('utf-8'))
+        except ValueError:
+            return
+        for call in calls if isinstance(calls, list) else [calls]:
+            if isinstance(call, dict) and call.get('method') == 'get_events':
+                params = call.get('params')
+                if isinstance(params, dict):
+                    await self._wait_events(params.get('akey'), params.get('timeout'))
+                elif isinstance(params, list) and len(params) > 2:
+                    await self._wait_events(params[0], params[2])
+                return
+
+    def _api_response(self, path: str, headers, body) -> Response:
+        """
+        Call an /api/ method, like TupeloRequestHandler.handle_json_request().
+        """
+        try:
+            content_type, response, etag = self.api_dispatch(path, headers, body=body)
+        except NotModified as err:
+            return (HTTPStatus.NOT_MODIFIED, [('ETag', err.etag),
+                ('Cache-Control', 'no-cache')], b'')
+        except ProtocolError:
+            return (HTTPStatus.NOT_FOUND, [('Content-type', 'text/plain')], b'No such page')
+        except (GameError, RuleError) as err:
+            logger.exception(err)
+            response = json.dumps({'code': err.rpc_code, 'message': str(err)}).encode()
+            return (HTTPStatus.FORBIDDEN, [('Content-type', 'application/json'),
+                ('X-Error-Code', str(err.rpc_code)), ('X-Error-Message', str(err))],
+                response)
+        except Exception as err:
+            logger.exception(err)
+            return (HTTPStatus.INTERNAL_SERVER_ERROR, [], b'')
+
+        headers = [('Content-type', content_type), ('Vary', 'Accept, Accept-Encoding'),
+            ('Cache-Control', 'no-cache'), ('Pragma', 'no-cache')]
+        if etag is not None:
+            headers.append(('ETag', etag))
+        return (HTTPStatus.OK, headers, response)
+
+    def _encode_response(self, request_headers, response: Response) -> Response:
+        """
+        Compress a response if the client accepts it and it is large enough.
+        """
+        status, headers, body = response
+        encoding = compression.response_encoding(request_headers.get('Accept-Encoding'),
+                len(body), self.encode_threshold)
+        if encoding:
+            body = compression.compress(body, encoding)
+            headers = headers + [('Content-Encoding', encoding)]
+        return (status, headers, body)
+
+    @staticmethod
+    def _format_response(status: int, headers, body: bytes, keep_alive: bool = False) -> bytes:
+        lines = ['HTTP/1.1 %d %s' % (status, HTTPStatus(status).phrase)]
+        lines += ['%s: %s' % header for header in headers]
+        # these responses never have a body
+        if status not in (HTTPStatus.NO_CONTENT, HTTPStatus.NOT_MODIFIED):
+            lines.append('Content-length: %d' % len(body))
+        lines += ['Connection: %s' % ('keep-alive' if keep_alive else 'close'), '', '']
+        return '\r\n'.join(lines).encode('latin-1') + body
+
+
+def _set_done(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
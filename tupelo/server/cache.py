@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+"""
+Cache of encoded API responses.
+
+A response is cached under a key for one version of the data it was made
+from, and a request for a newer version replaces it. Concurrent requests
+for the same key and version wait for one computation of the response.
+Each response version also has an ETag, so that a client that already
+has it can be answered with 304 Not Modified.
+"""
+
+import hashlib
+import threading
+import collections
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from tupelo.common import short_uuid
+
+# the number of responses kept
+CACHE_SIZE = 1024
+
+
+class _Computation():
+    """
+    A response being computed, waited for by the concurrent requests.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache():
+    """
+    LRU cache of responses by key and version.
+    """
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        # key => (version, value)
+        self._entries = collections.OrderedDict()
+        # (key, version) => _Computation
+        self._computations = {}
+        # ETags of a previous server instance must not match
+        self._salt = short_uuid()
+
+    def etag(self, key: Hashable, version: Hashable) -> str:
+        digest = hashlib.sha1(repr((self._salt, key, version)).encode()).hexdigest()
+        return '"%s"' % digest[:20]
+
+    def get(self, key: Hashable, version: Hashable, compute: Callable[[], Any]) -> \
+            Tuple[Any, bool]:
+        """
+        Get the cached value of a key for a version, calling compute() to
+        make it if it is not cached yet.
+
+        Return a tuple of (value, computed), computed being True if the value
+        was made by this call.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return (entry[1], False)
+            computation = self._computations.get((key, version))
+            computing = computation is None
+            if computing:
+                computation = self._computations[(key, version)] = _Computation()
+
+        if not computing:
+            computation.done.wait()
+            if computation.error is not None:
+                raise computation.error
+            return (computation.value, False)
+
+        try:
+            computation.value = compute()
+        except BaseException as err:
+            computation.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._computations[(key, version)]
+                if computation.error is None:
+                    self._entries[key] = (version, computation.value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.size:
+                        self._entries.popitem(last=False)
+            computation.done.set()
+        return (computation.value, True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check if an If-None-Match header value matches an ETag, using the weak
+    comparison.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
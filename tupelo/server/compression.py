@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+"""
+HTTP content coding of the server responses and request bodies.
+
+Responses of at least a threshold size are compressed with gzip or
+deflate when the client's Accept-Encoding allows it. Event streams are
+compressed as a stream, flushing after each message so that the client
+gets it right away. Request bodies may be sent gzip or deflate encoded.
+"""
+
+import zlib
+from typing import Optional
+
+# the supported codings in order of preference, with their zlib wbits;
+# deflate is the zlib format (RFC 9110)
+ENCODINGS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+# the default size in bytes from which responses are compressed
+THRESHOLD = 1400
+
+COMPRESS_LEVEL = 6
+
+
+def accepted_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Choose the coding of a response from an Accept-Encoding header value.
+
+    Return 'gzip', 'deflate' or None for no compression.
+    """
+    if not accept_encoding:
+        return None
+    qvalues = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        qvalue = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        qvalues[coding.strip().lower()] = qvalue
+
+    best, best_qvalue = None, 0.0
+    for coding in ENCODINGS:
+        qvalue = qvalues.get(coding, qvalues.get('*', 0.0))
+        if qvalue > best_qvalue:
+            best, best_qvalue = coding, qvalue
+    return best
+
+def response_encoding(accept_encoding: Optional[str], size: int,
+        threshold: Optional[int] = THRESHOLD) -> Optional[str]:
+    """
+    Choose the coding of a response of the given size, compressing only
+    responses of at least threshold bytes. A threshold of None disables
+    compression.
+    """
+    if threshold is None or size < threshold:
+        return None
+    return accepted_encoding(accept_encoding)
+
+def compress(data: bytes, encoding: str) -> bytes:
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, ENCODINGS[encoding])
+    return compressor.compress(data) + compressor.flush()
+
+def decompress(data: bytes, encoding: str, max_size: int) -> bytes:
+    """
+    Decode a request body of at most max_size bytes when decoded.
+
+    Raises ValueError if the body is not valid or is too large.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError('Unsupported content coding %s' % encoding)
+    decompressor = zlib.decompressobj(ENCODINGS[encoding])
+    try:
+        decoded = decompressor.decompress(data, max_size)
+    except zlib.error as err:
+        if encoding != 'deflate':
+            raise ValueError('Invalid %s body: %s' % (encoding, err)) from None
+        # some clients send raw deflate data without the zlib wrapper
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        try:
+            decoded = decompressor.decompress(data, max_size)
+        except zlib.error as err:
+            raise ValueError('Invalid deflate body: %s' % err) from None
+    if decompressor.unconsumed_tail:
+        raise ValueError('Decoded body too large')
+    return decoded
+
+
+class StreamCompressor():
+    """
+    Compressor of a response sent in parts, like an event stream. Each
+    part is flushed so that it can be decoded as soon as it arrives.
+    """
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self._compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED,
+                ENCODINGS[encoding])
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
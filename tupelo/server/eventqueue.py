@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+"""
+Bounded event queues of the remote players.
+
+A queue holds the (sequence number, event) pairs sent to a player until
+the client gets them. When a queue is full, what happens depends on its
+policy:
+
+coalesce
+    A state change right after another one replaces it anyway, and a full
+    queue first drops all but the latest state change; if it is still
+    full, the oldest event is dropped.
+drop_oldest
+    The oldest event is dropped.
+resync
+    The queued events are replaced with a ResyncEvent, after which the
+    client must fetch the full game state, and the player is marked
+    lagging until the client gets it.
+"""
+
+import threading
+import collections
+from typing import Optional
+
+from tupelo.events import StateChangedEvent, ResyncEvent
+
+COALESCE = 'coalesce'
+DROP_OLDEST = 'drop_oldest'
+RESYNC = 'resync'
+POLICIES = (COALESCE, DROP_OLDEST, RESYNC)
+
+# the default number of events a queue holds
+EVENT_QUEUE_SIZE = 1000
+
+
+class EventQueue():
+    """
+    Bounded queue of (sequence number, event) pairs.
+    """
+    def __init__(self, maxsize: int = EVENT_QUEUE_SIZE, policy: str = COALESCE):
+        if policy not in POLICIES:
+            raise ValueError('Unknown event queue policy %s' % policy)
+        if maxsize < 2:
+            raise ValueError('Event queue size must be at least 2')
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = collections.deque()
+        self._not_empty = threading.Condition()
+        # True from an overflow of a resync queue until the client gets the
+        # ResyncEvent
+        self.lagging = False
+        # the most events queued at a time, and the events dropped
+        self.max_depth = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.resyncs = 0
+
+    def put(self, seq: int, event):
+        with self._not_empty:
+            if self.policy == COALESCE and isinstance(event, StateChangedEvent) and \
+                    self._items and isinstance(self._items[-1][1], StateChangedEvent):
+                self._items.pop()
+                self.coalesced += 1
+            if len(self._items) >= self.maxsize:
+                self._overflow()
+            self._items.append((seq, event))
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._not_empty.notify()
+
+    def _overflow(self):
+        """
+        Make room for an event in a full queue.
+        """
+        if self.policy == RESYNC:
+            # the resync takes the place of the last dropped event
+            seq = self._items[-1][0]
+            self.dropped += len(self._items)
+            self._items.clear()
+            self._items.append((seq, ResyncEvent()))
+            self.lagging = True
+            self.resyncs += 1
+            return
+
+        if self.policy == COALESCE:
+            latest = None
+            for item in reversed(self._items):
+                if isinstance(item[1], StateChangedEvent):
+                    latest = item
+                    break
+            if latest is not None:
+                items = [item for item in self._items
+                        if item is latest or not isinstance(item[1], StateChangedEvent)]
+                self.coalesced += len(self._items) - len(items)
+                self._items = collections.deque(items)
+        if len(self._items) >= self.maxsize:
+            self._items.popleft()
+            self.dropped += 1
+
+    def get_all(self, timeout: Optional[float] = None) -> list:
+        """
+        Remove and return all the queued items. If timeout is given, wait
+        for at most timeout seconds for the first one.
+        """
+        with self._not_empty:
+            if timeout and not self._items:
+                self._not_empty.wait_for(lambda: self._items, timeout)
+            items = list(self._items)
+            self._items.clear()
+            if any(isinstance(event, ResyncEvent) for _, event in items):
+                self.lagging = False
+            return items
+
+    def empty(self) -> bool:
+        return not self._items
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> dict:
+        """
+        Get the depth and the counters of the queue.
+        """
+        with self._not_empty:
+            return {'depth': len(self._items), 'max_depth': self.max_depth,
+                    'maxsize': self.maxsize, 'policy': self.policy,
+                    'dropped': self.dropped, 'coalesced': self.coalesced,
+                    'resyncs': self.resyncs, 'lagging': self.lagging}
@@ -1,12 +1,38 @@
-from typing import Optional
+from typing import Optional, Tuple
+import time
 import json
+import logging
 import http.cookies
 import urllib.parse
 try:
     from urllib.parse import parse_qs
 except:
     from cgi import parse_qs
-from tupelo.common import ProtocolError
+from tupelo.common import GameError, RuleError, ProtocolError
+from tupelo import binary
+from . import sse
+from .cache import ResponseCache, etag_matches
+
+logger = logging.getLogger(__name__)
+
+# JSON-RPC 2.0 error codes; the game errors keep their own rpc_code
+JSONRPC_PARSE_ERROR = -32700
+JSONRPC_INVALID_REQUEST = -32600
+JSONRPC_METHOD_NOT_FOUND = -32601
+JSONRPC_INVALID_PARAMS = -32602
+JSONRPC_INTERNAL_ERROR = -32603
+
+def _jsonrpc_error(req_id, code: int, message: str) -> dict:
+    return {'jsonrpc': '2.0', 'id': req_id, 'error': {'code': code, 'message': message}}
+
+
+class NotModified(Exception):
+    """
+    The client already has the current version of a response.
+    """
+    def __init__(self, etag: str):
+        super().__init__(etag)
+        self.etag = etag
 
 
 class TupeloJSONDispatcher():
@@ -15,9 +41,15 @@ class TupeloJSONDispatcher():
     """
 
     json_path_prefix = '/api/'
+    # JSON-RPC 2.0 requests are POSTed here
+    jsonrpc_path = '/jsonrpc'
+    # seconds between the heartbeats of event streams
+    heartbeat_interval = sse.HEARTBEAT_INTERVAL
 
     def __init__(self):
         self.instance = None
+        # encoded responses of the methods the instance versions
+        self.response_cache = ResponseCache()
 
     def _json_parse_headers(self, headers) -> dict:
         """
@@ -68,9 +100,11 @@ class TupeloJSONDispatcher():
         """
         self.instance = instance
 
-    def json_dispatch(self, qstring: str, headers, body=None) -> str:
+    def _api_params(self, qstring: str, headers, body=None):
         """
-        Dispatch a JSON method call to the interface instance.
+        Get the method name and the parameters of an API request.
+
+        Return a tuple of (method_name, params).
         """
         method, qs_params = self._json_parse_qstring(qstring)
         if not method:
@@ -82,5 +116,164 @@ class TupeloJSONDispatcher():
         # the querystring params override header params
         params = self._json_parse_headers(headers)
         params.update(qs_params)
+        return (method, params)
+
+    def _api_call(self, qstring: str, headers, body=None):
+        """
+        Call the interface method of an API request.
 
-        return json.dumps(self.instance._json_dispatch(method, params))
+        Return a tuple of (method_name, params, result).
+        """
+        method, params = self._api_params(qstring, headers, body)
+        return (method, params, self.instance._json_dispatch(method, dict(params)))
+
+    def event_stream_player(self, qstring: str, headers):
+        """
+        Get the player and the last event id of an event stream request
+        (see tupelo.server.sse).
+
+        Raises GameError if the akey is not valid.
+        """
+        _, params = self._json_parse_qstring(qstring)
+        akey = params.get('akey', self._json_parse_headers(headers).get('akey'))
+        last_event_id = headers.get('Last-Event-ID', params.get('last_event_id'))
+        try:
+            last_event_id = int(last_event_id) if last_event_id is not None else None
+        except ValueError:
+            last_event_id = None
+        return (self.instance._get_auth_player(str(akey)), last_event_id)
+
+    def player_registered(self, player) -> bool:
+        """
+        Return True if the player is still registered on the server.
+        """
+        try:
+            return self.instance._get_auth_player(player.akey) is player
+        except GameError:
+            return False
+
+    def event_stream_alive(self, player) -> bool:
+        """
+        Return True if the event stream of a player should go on. An open
+        stream counts as activity of the player.
+        """
+        if not self.player_registered(player):
+            return False
+        player.last_activity = time.monotonic()
+        return True
+
+    def json_dispatch(self, qstring: str, headers, body=None) -> str:
+        """
+        Dispatch a JSON method call to the interface instance.
+        """
+        return json.dumps(self._api_call(qstring, headers, body)[2])
+
+    def api_dispatch(self, qstring: str, headers, body=None) -> Tuple[str, bytes, Optional[str]]:
+        """
+        Dispatch an API call, encoding the result in the binary format if
+        the client accepts it and the method supports it, in JSON otherwise.
+        Event lists with state deltas are always sent in JSON.
+
+        The encoded results of the calls the instance gives a version for
+        (see _result_version) are cached until the version changes, and
+        have an ETag. Raises NotModified if the client sent the current ETag
+        in If-None-Match.
+
+        Return a tuple of (content_type, response, etag).
+        """
+        method, params = self._api_params(qstring, headers, body)
+        if binary.CONTENT_TYPE in (headers.get('Accept') or '') and \
+                method in binary.ENCODERS and not params.get('delta'):
+            content_type = binary.CONTENT_TYPE
+        else:
+            content_type = 'application/json'
+
+        def _call():
+            result = self.instance._json_dispatch(method, dict(params))
+            if content_type == binary.CONTENT_TYPE:
+                return (result, binary.ENCODERS[method](result))
+            return (result, json.dumps(result).encode())
+
+        with self.instance.lock:
+            versioned = self.instance._result_version(method, params)
+        if versioned is None:
+            return (content_type, _call()[1], None)
+
+        key, version = versioned
+        key = (key, content_type)
+        (result, response), computed = self.response_cache.get(key, version, _call)
+        if not computed:
+            with self.instance.lock:
+                self.instance._result_reused(method, params, result)
+        etag = self.response_cache.etag(key, version)
+        if etag_matches(headers.get('If-None-Match'), etag):
+            raise NotModified(etag)
+        return (content_type, response, etag)
+
+    def jsonrpc_dispatch(self, body: bytes) -> Optional[bytes]:
+        """
+        Dispatch a JSON-RPC 2.0 request or a batch of them. Method names are
+        those of XML-RPC ("game.get_state") and params are either positional
+        or named.
+
+        Return the JSON response, or None if there is nothing to respond
+        (only notifications).
+        """
+        try:
+            request = json.loads(body.decode('utf-8'))
+        except (AttributeError, ValueError):
+            return json.dumps(_jsonrpc_error(None, JSONRPC_PARSE_ERROR,
+                'Parse error')).encode()
+
+        if isinstance(request, list):
+            if not request:
+                return json.dumps(_jsonrpc_error(None, JSONRPC_INVALID_REQUEST,
+                    'Invalid request')).encode()
+            responses = [response for response in map(self._jsonrpc_call, request)
+                    if response is not None]
+            return json.dumps(responses).encode() if responses else None
+
+        response = self._jsonrpc_call(request)
+        return json.dumps(response).encode() if response is not None else None
+
+    def _jsonrpc_call(self, request) -> Optional[dict]:
+        """
+        Call the interface method of one JSON-RPC request.
+
+        Return the response object, or None for a notification.
+        """
+        if not isinstance(request, dict) or request.get('jsonrpc') != '2.0' or \
+                not isinstance(request.get('method'), str):
+            req_id = request.get('id') if isinstance(request, dict) else None
+            return _jsonrpc_error(req_id, JSONRPC_INVALID_REQUEST, 'Invalid request')
+
+        req_id = request.get('id')
+        method = request['method'].replace('.', '_')
+        params = request.get('params', [])
+        try:
+            if method not in self.instance.methods:
+                response = _jsonrpc_error(req_id, JSONRPC_METHOD_NOT_FOUND,
+                        'Method "%s" is not supported' % request['method'])
+            elif isinstance(params, (list, dict)):
+                func = getattr(self.instance, method)
+                try:
+                    if isinstance(params, list):
+                        result = self.instance._call(func, *params)
+                    else:
+                        result = self.instance._call(func, **params)
+                except TypeError as err:
+                    response = _jsonrpc_error(req_id, JSONRPC_INVALID_PARAMS, str(err))
+                else:
+                    response = {'jsonrpc': '2.0', 'id': req_id, 'result': result}
+            else:
+                response = _jsonrpc_error(req_id, JSONRPC_INVALID_REQUEST, 'Invalid params')
+        except (GameError, RuleError, ProtocolError) as err:
+            response = _jsonrpc_error(req_id, err.rpc_code, str(err))
+        except Exception as err:
+            logger.exception(err)
+            response = _jsonrpc_error(req_id, JSONRPC_INTERNAL_ERROR, str(err))
+
+        # notifications get no response
+        if 'id' not in request:
+            return None
+        return response
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+"""
+Background expiry of idle sessions and abandoned games.
+
+The reaper keeps a heap of (deadline, key) timers and calls a check
+function for each key when its deadline passes. Activity is not reported
+to the reaper: the check function compares the key's last activity with
+the time and returns a later deadline if it has been active since, so
+that recording activity costs nothing but a time stamp.
+"""
+
+import time
+import heapq
+import logging
+import itertools
+import threading
+from typing import Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Reaper():
+    """
+    Timer heap served by a daemon thread, started by the first schedule().
+
+    check(key, now) is called in the reaper thread when the deadline of key
+    has passed, and returns the next deadline of the key or None to forget
+    it. Deadlines are time.monotonic() values.
+    """
+    def __init__(self, check: Callable[[Hashable, float], Optional[float]]):
+        self.check = check
+        self._timers = []
+        # orders the timers with the same deadline
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def schedule(self, key: Hashable, deadline: float):
+        with self._cond:
+            heapq.heappush(self._timers, (deadline, next(self._counter), key))
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run, name='reaper')
+                self._thread.daemon = True
+                self._thread.start()
+            else:
+                # the new timer may be the first one
+                self._cond.notify()
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def run_due(self, now: Optional[float] = None) -> int:
+        """
+        Check the keys whose deadlines have passed. Return the number of
+        keys checked.
+        """
+        if now is None:
+            now = time.monotonic()
+        due = []
+        with self._cond:
+            while self._timers and self._timers[0][0] <= now:
+                due.append(heapq.heappop(self._timers)[2])
+
+        for key in due:
+            try:
+                deadline = self.check(key, now)
+            except Exception as err:
+                logger.exception(err)
+                continue
+            if deadline is not None:
+                self.schedule(key, deadline)
+        return len(due)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                if self._timers:
+                    self._cond.wait(self._timers[0][0] - time.monotonic())
+                else:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+            self.run_due()
+
+    def stop(self):
+        """
+        Stop the reaper thread.
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
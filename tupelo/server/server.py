@@ -1,20 +1,32 @@
 #!/usr/bin/env python
 # vim: set sts=4 sw=4 et:
 
-import copy
+import time
 import logging
-import queue
+import threading
+import collections
+import contextvars
+import socketserver
 import xmlrpc.server
 import inspect
 import json
+import urllib.parse
+from typing import Optional
 
 from tupelo.xmlrpc import error2fault
 from tupelo.rpc import rpc_encode, rpc_decode
-from tupelo.common import Card, GameError, RuleError, ProtocolError, traced, short_uuid, simple_decorator, GameState
+from tupelo.common import Card, GameError, RuleError, ProtocolError, traced, short_uuid, simple_decorator, GameState, \
+        GameStateSnapshot
 from tupelo.game import GameController
-from tupelo.events import EventList, CardPlayedEvent, MessageEvent, TrickPlayedEvent, TurnEvent, StateChangedEvent
+from tupelo.events import EventList, CardPlayedEvent, MessageEvent, TrickPlayedEvent, TurnEvent, StateChangedEvent, \
+        StateDeltaEncoder
 from tupelo.players import Player, DummyBotPlayer
-from .jsonapi import TupeloJSONDispatcher
+from .jsonapi import TupeloJSONDispatcher, NotModified
+from .eventqueue import EventQueue
+from .reaper import Reaper
+from . import eventqueue
+from . import sse
+from . import compression
 
 DEFAULT_PORT = 8052
 
@@ -22,8 +34,35 @@ VERSION_MAJOR = 0
 VERSION_MINOR = 1
 VERSION_STRING = "%d.%d" % (VERSION_MAJOR, VERSION_MINOR)
 
+# the longest time in seconds that get_events waits for events
+MAX_EVENTS_TIMEOUT = 60.0
+
+# how many popped events a player keeps for resuming event streams
+EVENT_REPLAY_SIZE = 256
+
+# seconds after which a player that has not made authenticated calls is
+# removed from the server
+SESSION_TTL = 600.0
+
+# seconds after which a game whose state has not changed is stopped
+GAME_TTL = 1800.0
+
+# seconds an idle persistent connection is kept open
+KEEPALIVE_TIMEOUT = 15.0
+
+# the most requests served on one persistent connection
+KEEPALIVE_MAX_REQUESTS = 100
+
 logger = logging.getLogger(__name__)
 
+# the player authenticated for the current request, kept per thread and per
+# asyncio task so that concurrent requests do not see each other's player
+_authenticated_player = contextvars.ContextVar('authenticated_player', default=None)
+
+# whether get_events may block waiting for events; the asyncio server waits
+# for the events itself before the call and turns this off
+blocking_calls = contextvars.ContextVar('blocking_calls', default=True)
+
 @simple_decorator
 def authenticated(fn):
     """
@@ -31,11 +70,14 @@ def authenticated(fn):
     key.
     """
     def wrapper(self, akey, *args, **kwargs):
-        self._ensure_auth(akey)
+        player = self._get_auth_player(akey)
+        player.last_activity = time.monotonic()
+        # authenticated methods may call each other
+        token = _authenticated_player.set(player)
         try:
             retval = fn(self, *args, **kwargs)
         finally:
-            self._clear_auth()
+            _authenticated_player.reset(token)
 
         return retval
 
@@ -45,6 +87,14 @@ def authenticated(fn):
     wrapper.argspec.args.insert(0, 'akey')
     return wrapper
 
+def unlocked(fn):
+    """
+    Mark an interface method that the dispatchers call without holding the
+    interface lock, for methods that block.
+    """
+    fn.unlocked = True
+    return fn
+
 def _game_get_rpc_info(game):
     """
     Get RPC info for a GameController instance.
@@ -61,9 +111,38 @@ class TupeloRequestHandler(xmlrpc.server.SimpleXMLRPCRequestHandler):
 
     rpc_paths = ('/RPC2',)
     json_paths = (TupeloJSONDispatcher.json_path_prefix,) # /api
+    jsonrpc_paths = (TupeloJSONDispatcher.jsonrpc_path,) # /jsonrpc
+    # persistent connections, closed after an idle timeout or max_requests
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT
+    max_requests = KEEPALIVE_MAX_REQUESTS
+    # the largest request body accepted, also when decoded
+    max_body_size = 10 * 1024 * 1024
+
+    def handle(self):
+        """
+        Handle the requests of a connection.
+        """
+        self.requests_handled = 0
+        super().handle()
+
+    def handle_one_request(self):
+        super().handle_one_request()
+        self.requests_handled += 1
+        if self.requests_handled >= self.max_requests:
+            self.close_connection = True
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        # tell the client when this is the last request of the connection
+        if self.close_connection or self.requests_handled + 1 >= self.max_requests:
+            self.send_header("Connection", "close")
 
     @traced
     def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path == sse.STREAM_PATH:
+            return self.handle_event_stream()
+
         for path in self.json_paths:
             if self.path.startswith(path):
                 return self.handle_json_request()
@@ -75,7 +154,17 @@ class TupeloRequestHandler(xmlrpc.server.SimpleXMLRPCRequestHandler):
     def do_POST(self):
         for path in self.json_paths:
             if self.path.startswith(path):
-                return self.handle_json_request(self.get_body())
+                body = self.get_body()
+                if body is None:
+                    # an error response has been sent
+                    return
+                return self.handle_json_request(body)
+
+        if self.path in self.jsonrpc_paths:
+            body = self.get_body()
+            if body is not None:
+                self.handle_jsonrpc_request(body)
+            return
 
         return super().do_POST()
 
@@ -102,11 +191,50 @@ class TupeloRequestHandler(xmlrpc.server.SimpleXMLRPCRequestHandler):
         except Exception as e: # This should only happen if the module is buggy
             # internal error, report as HTTP server error
             self.send_response(500)
+            self.send_header("Content-length", "0")
+            self.end_headers()
+            # the rest of the body may be left unread
+            self.close_connection = True
+
+    def decode_request_content(self, data):
+        """
+        Decode a gzip or deflate encoded request body.
+        """
+        encoding = self.headers.get("content-encoding", "identity").lower()
+        if encoding not in compression.ENCODINGS:
+            return super().decode_request_content(data)
+        try:
+            return compression.decompress(data, encoding, self.max_body_size)
+        except ValueError:
+            self.send_response(400, "error decoding %s body" % encoding)
+            self.send_header("Content-length", "0")
+            self.end_headers()
+            self.close_connection = True
+
+    def send_content(self, body: bytes):
+        """
+        End the headers and send the body of a response, compressed if the
+        client accepts it and the body is at least encode_threshold bytes.
+        """
+        encoding = compression.response_encoding(self.headers.get("Accept-Encoding"),
+                len(body), self.encode_threshold)
+        if encoding:
+            body = compression.compress(body, encoding)
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
     @traced
     def handle_json_request(self, body=None):
         try:
-            response = self.server.json_dispatch(self.path, self.headers, body=body).encode()
+            content_type, response, etag = self.server.api_dispatch(self.path, self.headers,
+                    body=body)
+        except NotModified as err:
+            self.send_response(304)
+            self.send_header("ETag", err.etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
         except ProtocolError as err:
             self.report_404()
             return
@@ -121,33 +249,85 @@ class TupeloRequestHandler(xmlrpc.server.SimpleXMLRPCRequestHandler):
             self.send_header("X-Error-Code", str(err.rpc_code))
             self.send_header("X-Error-Message", str(err))
             self.end_headers()
-
             self.wfile.write(response)
-            # shut down the connection
-            self.wfile.flush()
-            self.connection.shutdown(1)
         except Exception as err:
             logger.exception(err)
             self.send_response(500)
+            self.send_header("Content-length", "0")
             self.end_headers()
         else:
             self.send_response(200)
-            self.send_header("Content-type", "application/json")
-            self.send_header("Content-length", str(len(response)))
+            self.send_header("Content-type", content_type)
+            self.send_header("Vary", "Accept, Accept-Encoding")
             self.send_header("Cache-Control", "no-cache")
             self.send_header("Pragma", "no-cache")
+            if etag is not None:
+                self.send_header("ETag", etag)
+            self.send_content(response)
 
+    @traced
+    def handle_jsonrpc_request(self, body):
+        try:
+            response = self.server.jsonrpc_dispatch(body)
+        except Exception as err:
+            logger.exception(err)
+            self.send_response(500)
+            self.send_header("Content-length", "0")
             self.end_headers()
-            self.wfile.write(response)
+            return
+
+        if response is None:
+            # only notifications
+            self.send_response(204)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_content(response)
+
+    def handle_event_stream(self):
+        """
+        Send the events of a player as a Server-Sent Events stream until the
+        player quits or the client disconnects.
+        """
+        try:
+            player, last_event_id = self.server.event_stream_player(self.path, self.headers)
+        except GameError as err:
+            self.send_error(403, str(err))
+            return
 
-            # shut down the connection
-            self.wfile.flush()
-            self.connection.shutdown(1)
+        self.send_response(200)
+        self.send_header("Content-type", sse.CONTENT_TYPE)
+        self.send_header("Cache-Control", "no-cache")
+        # the stream ends when the connection is closed
+        self.send_header("Connection", "close")
+        compressor = None
+        encoding = compression.accepted_encoding(self.headers.get("Accept-Encoding"))
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+            compressor = compression.StreamCompressor(encoding)
+        self.end_headers()
+        try:
+            for data in sse.stream(player, last_event_id,
+                    lambda: self.server.event_stream_alive(player),
+                    self.server.heartbeat_interval):
+                self.wfile.write(compressor.compress(data) if compressor else data)
+                self.wfile.flush()
+        except OSError:
+            # the client went away
+            pass
 
-class TupeloServer(xmlrpc.server.SimpleXMLRPCServer, TupeloJSONDispatcher):
+class TupeloServer(socketserver.ThreadingMixIn, xmlrpc.server.SimpleXMLRPCServer,
+        TupeloJSONDispatcher):
     """
     Custom server class that combines XML-RPC and JSON servers.
+
+    Each request is handled in its own thread, so that long polling
+    get_events calls do not block the other clients.
     """
+    daemon_threads = True
 
     def __init__(self, *args, **kwargs):
         nargs = (args[0:1] or (None,)) +  (TupeloRequestHandler,) +  args[2:]
@@ -155,14 +335,20 @@ class TupeloServer(xmlrpc.server.SimpleXMLRPCServer, TupeloJSONDispatcher):
         TupeloJSONDispatcher.__init__(self)
         rpciface = TupeloRPCInterface()
         self.register_instance(rpciface)
+        # system.multicall for batching XML-RPC calls
+        self.register_multicall_functions()
 
     def shutdown_games(self):
         """
         Shut down all the games running on this instance.
         """
-        for game in self.instance.games:
+        for game in list(self.instance.games.values()):
             game.shutdown()
 
+    def server_close(self):
+        super().server_close()
+        self.instance._reaper.stop()
+
 
 class TupeloRPCInterface():
     """
@@ -171,10 +357,31 @@ class TupeloRPCInterface():
 
     def __init__(self):
         super().__init__()
-        self.players = []
-        self.games = []
+        # players by id and by akey, games by id and by status
+        self.players = {}
+        self.akeys = {}
+        self.games = {}
+        self.games_by_status = {}
+        # increased whenever games are added or removed, or their status or
+        # players change
+        self.games_version = 0
+        # the status index is also updated by the game threads
+        self._games_lock = threading.Lock()
+        # held by the dispatchers while calling a method
+        self.lock = threading.RLock()
         self.methods = self._get_methods()
-        self.authenticated_player = None
+        # factory for the bots added by game_start_with_bots, called with a name
+        self.bot_factory = DummyBotPlayer
+        # size and overflow policy of the event queues of new players
+        self.event_queue_size = eventqueue.EVENT_QUEUE_SIZE
+        self.event_queue_policy = eventqueue.COALESCE
+        # idle players and games are removed after these many seconds,
+        # None to keep them
+        self.session_ttl = SESSION_TTL
+        self.game_ttl = GAME_TTL
+        self._reaper = Reaper(self._expire)
+        # the last version seen of each game and when it was seen
+        self._game_activity = {}
 
     def _get_methods(self):
         """
@@ -203,11 +410,10 @@ class TupeloRPCInterface():
         """
         Get player by id.
         """
-        for plr in self.players:
-            if plr.id == player_id:
-                return plr
-
-        raise GameError('Player (ID %s) does not exist' % player_id)
+        try:
+            return self.players[player_id]
+        except KeyError:
+            raise GameError('Player (ID %s) does not exist' % player_id) from None
 
     def _register_player(self, player: 'RPCProxyPlayer'):
         """
@@ -216,37 +422,202 @@ class TupeloRPCInterface():
         # generate a (public) ID and (private) access token
         player.id = short_uuid()
         player.akey = short_uuid()
-        self.players.append(player)
+        self.players[player.id] = player
+        self.akeys[player.akey] = player
+        player.last_activity = time.monotonic()
+        if self.session_ttl is not None:
+            self._reaper.schedule(('player', player), player.last_activity + self.session_ttl)
         return player.rpc_encode(private=True)
 
-    def _ensure_auth(self, akey: str):
+    def _unregister_player(self, player: 'RPCProxyPlayer'):
+        """
+        Remove a player from the server.
         """
-        Check the given authentication (session) key and set self.authenticated_player.
+        del self.players[player.id]
+        del self.akeys[player.akey]
+
+    def _add_game(self, game: GameController):
+        """
+        Add a new game to the server, giving it an id.
+        """
+        game.id = short_uuid()
+        game.status_hook = self._game_status_changed
+        game.players_hook = self._game_players_changed
+        with self._games_lock:
+            self.games[game.id] = game
+            self.games_by_status.setdefault(game.state.status, {})[game.id] = game
+            self.games_version += 1
+        now = time.monotonic()
+        self._game_activity[game.id] = (game.version, now)
+        if self.game_ttl is not None:
+            self._reaper.schedule(('game', game), now + self.game_ttl)
+
+    def _remove_game(self, game: GameController):
+        """
+        Remove a game from the server.
+        """
+        game.status_hook = None
+        game.players_hook = None
+        with self._games_lock:
+            self.games.pop(game.id, None)
+            # the status may have changed just before the hook was removed
+            for games in self.games_by_status.values():
+                games.pop(game.id, None)
+            self.games_version += 1
+        self._game_activity.pop(game.id, None)
+
+    def _game_status_changed(self, game: GameController, old_status: int):
+        """
+        Move a game in the status index.
+        """
+        with self._games_lock:
+            if game.id in self.games:
+                self.games_by_status.get(old_status, {}).pop(game.id, None)
+                self.games_by_status.setdefault(game.state.status, {})[game.id] = game
+                self.games_version += 1
+
+    def _game_players_changed(self, game: GameController):
+        with self._games_lock:
+            self.games_version += 1
+
+    def _expire(self, key: tuple, now: float) -> Optional[float]:
+        """
+        Remove a player or a game if it has been idle for longer than its
+        TTL. Called by the reaper when the TTL may have passed.
+
+        Return the time of the next check, or None if there is none.
+        """
+        kind, obj = key
+        if kind == 'player':
+            return self._expire_player(obj, now)
+        return self._expire_game(obj, now)
+
+    def _expire_player(self, player: 'RPCProxyPlayer', now: float) -> Optional[float]:
+        with self.lock:
+            if self.session_ttl is None or self.akeys.get(player.akey) is not player:
+                return None
+            deadline = player.last_activity + self.session_ttl
+            if deadline > now:
+                return deadline
+            logger.info('Session of player %s expired', player.id)
+            game = player.game
+            if game is None or game.state.status == GameState.OPEN:
+                # as if the player quit
+                self.player_quit(player.akey)
+                return None
+            # leaving a started game would reset it holding the lock, so
+            # the game is ended like an expired one
+            self._detach_game(game)
+            self._unregister_player(player)
+
+        game.stop()
+        return None
+
+    def _expire_game(self, game: GameController, now: float) -> Optional[float]:
+        with self.lock:
+            if self.game_ttl is None or self.games.get(game.id) is not game:
+                return None
+            version, seen = self._game_activity.get(game.id, (None, now))
+            if game.version != version:
+                self._game_activity[game.id] = (game.version, now)
+                return now + self.game_ttl
+            if seen + self.game_ttl > now:
+                return seen + self.game_ttl
+            logger.info('Game %s expired', game.id)
+            self._detach_game(game)
+
+        # stopping joins the bot threads, which must not be waited for
+        # holding the lock of the requests
+        game.stop()
+        return None
+
+    def _detach_game(self, game: GameController):
+        """
+        Remove a game from the server and from its remote players, to be
+        stopped without holding the lock.
+        """
+        for player in game.players:
+            if isinstance(player, RPCProxyPlayer):
+                player.game = None
+        self._remove_game(game)
+
+    def _result_version(self, method: str, params: dict) -> Optional[tuple]:
+        """
+        Get the cache key and the version of the result of a JSON method
+        call, for the methods whose results change only with the version.
+
+        Return a tuple of (key, version), or None if the result is not
+        versioned or the call fails.
+        """
+        try:
+            if method == 'game_list':
+                return ((method, str(params.get('status'))), self.games_version)
+            if method == 'game_get_info':
+                game = self._get_game(params['game_id'])
+                return ((method, game.id), game.version)
+            if method == 'game_get_state':
+                player = self._get_auth_player(params['akey'])
+                game = self._get_game(params['game_id'])
+                return ((method, game.id, player.id), game.version)
+        except (KeyError, TypeError, GameError):
+            # the call reports the error
+            pass
+        return None
+
+    def _result_reused(self, method: str, params: dict, result):
+        """
+        Called when a cached result is sent again instead of calling the
+        method. Raises GameError if the client may not get it anymore.
+        """
+        if method == 'game_get_state':
+            # as in the authenticated decorator and game_get_state
+            player = self._get_auth_player(params['akey'])
+            player.last_activity = time.monotonic()
+            player.state_deltas.reset(result['game_state'])
+
+    @property
+    def authenticated_player(self) -> Optional['RPCProxyPlayer']:
+        """
+        The player authenticated for the current request.
+        """
+        return _authenticated_player.get()
+
+    def _get_auth_player(self, akey: str) -> 'RPCProxyPlayer':
+        """
+        Get the player with the given authentication (session) key.
 
         Raises GameError if akey is not valid.
         """
-        for plr in self.players:
-            if plr.akey == akey:
-                self.authenticated_player = plr
-                return self.authenticated_player
+        try:
+            return self.akeys[akey]
+        except (KeyError, TypeError):
+            raise GameError("Invalid authentication key") from None
 
-        raise GameError("Invalid authentication key")
+    def _ensure_auth(self, akey: str):
+        """
+        Check the given authentication (session) key and set
+        self.authenticated_player for the current request.
+
+        Raises GameError if akey is not valid.
+        """
+        plr = self._get_auth_player(akey)
+        _authenticated_player.set(plr)
+        return plr
 
     def _clear_auth(self):
         """
         Clear info about the authenticated player.
         """
-        self.authenticated_player = None
+        _authenticated_player.set(None)
 
     def _get_game(self, game_id: str):
         """
         Get game by id or raise an error.
         """
-        for game in self.games:
-            if game.id == game_id:
-                return game
-
-        raise GameError('Game %s does not exist' % game_id)
+        try:
+            return self.games[game_id]
+        except (KeyError, TypeError):
+            raise GameError('Game %s does not exist' % game_id) from None
 
     def echo(self, test):
         return test
@@ -259,7 +630,7 @@ class TupeloRPCInterface():
         realname = method.replace('.', '_')
         if realname in list(self.methods.keys()):
             func = getattr(self, realname)
-            return func(*params)
+            return self._call(func, *params)
 
         raise ProtocolError('Method "%s" is not supported' % method)
 
@@ -274,12 +645,22 @@ class TupeloRPCInterface():
                 if k not in self.methods[method]:
                     del kwparams[k]
             try:
-                return func(**kwparams)
+                return self._call(func, **kwparams)
             except TypeError as err:
                 raise ProtocolError(str(err))
 
         raise ProtocolError('Method "%s" is not supported' % method)
 
+    def _call(self, func, *args, **kwargs):
+        """
+        Call an interface method, holding the lock unless it is unlocked.
+        """
+        if getattr(func, 'unlocked', False):
+            return func(*args, **kwargs)
+
+        with self.lock:
+            return func(*args, **kwargs)
+
     ### PUBLIC METHODS
 
     def hello(self, akey=None):
@@ -312,6 +693,7 @@ class TupeloRPCInterface():
         Return the player id.
         """
         player_obj = RPCProxyPlayer.rpc_decode(player)
+        player_obj.events = EventQueue(self.event_queue_size, self.event_queue_policy)
         return self._register_player(player_obj)
 
     @authenticated
@@ -328,29 +710,41 @@ class TupeloRPCInterface():
             except GameError:
                 pass
 
-        self.players.remove(player)
+        self._unregister_player(player)
         # without allow_none, XML-RPC methods must always return something
         return True
 
+    @authenticated
+    def player_events_info(self):
+        """
+        Get the depth and the counters of the event queues of all players.
+
+        Return a dict of player_id => queue info.
+        """
+        return {player_id: player.events.stats()
+                for player_id, player in self.players.items()}
+
     @authenticated
     def player_list(self):
         """
         List all players on server.
         """
-        return [rpc_encode(player) for player in self.players]
+        return [rpc_encode(player) for player in self.players.values()]
 
     def game_list(self, status=None):
         """
         List all games on server that are in the given state.
         """
         response = {}
-        if status is not None:
-            status = int(status)
+        with self._games_lock:
+            if status is None:
+                games = list(self.games.values())
+            else:
+                games = list(self.games_by_status.get(int(status), {}).values())
 
         # TODO: add game state, joinable yes/no, password?
-        for game in self.games:
-            if status is None or game.state.status == status:
-                response[str(game.id)] = _game_get_rpc_info(game)
+        for game in games:
+            response[str(game.id)] = _game_get_rpc_info(game)
 
         return response
 
@@ -362,13 +756,11 @@ class TupeloRPCInterface():
         Return the game id.
         """
         game = GameController()
-        # TODO: slight chance of race
-        self.games.append(game)
-        game.id = short_uuid()
+        self._add_game(game)
         try:
             self.game_enter(self.authenticated_player.akey, game.id)
         except GameError:
-            self.games.remove(game)
+            self._remove_game(game)
             raise
 
         return game.id
@@ -400,7 +792,7 @@ class TupeloRPCInterface():
         player.game = None
         # if the game was terminated we need to kill the old game instance
         if len(game.players) == 0:
-            self.games.remove(game)
+            self._remove_game(game)
 
         return True
 
@@ -413,6 +805,8 @@ class TupeloRPCInterface():
         response = {}
         response['game_state'] = rpc_encode(game.state)
         response['hand'] = rpc_encode(self.authenticated_player.hand)
+        # the following state deltas are based on this state
+        self.authenticated_player.state_deltas.reset(response['game_state'])
         return response
 
     def game_get_info(self, game_id: str):
@@ -422,12 +816,24 @@ class TupeloRPCInterface():
         game = self._get_game(game_id)
         return _game_get_rpc_info(game)
 
+    @unlocked
     @authenticated
-    def get_events(self):
+    def get_events(self, delta=False, timeout=0):
         """
         Get the list of new events for given player.
+
+        If delta is true, the game states of the events are sent as deltas
+        to the previous state (see tupelo.events.StateDeltaEncoder). If
+        there are no events, wait for at most timeout seconds for one.
         """
-        return rpc_encode(self.authenticated_player.pop_events())
+        if timeout and blocking_calls.get():
+            timeout = min(float(timeout), MAX_EVENTS_TIMEOUT)
+        else:
+            timeout = None
+        events = self.authenticated_player.pop_events(timeout)
+        if delta:
+            return self.authenticated_player.state_deltas.encode(events)
+        return rpc_encode(events)
 
     @authenticated
     def game_start(self, game_id: str):
@@ -447,7 +853,7 @@ class TupeloRPCInterface():
         i = 1
         while len(game.players) < 4:
             # register bots only to game so that we don't need to unregister them
-            game.register_player(DummyBotPlayer('Robotti %d' % i))
+            game.register_player(self.bot_factory('Robotti %d' % i))
             i += 1
 
         return self.game_start(self.authenticated_player.akey, game_id)
@@ -463,15 +869,36 @@ class TupeloRPCInterface():
         return True
 
 
+def _shared_event(game_state, event_cls, *args):
+    """
+    Get the event for a game state notification, shared with the other
+    players notified with the same snapshot.
+    """
+    if not isinstance(game_state, GameStateSnapshot):
+        game_state = GameStateSnapshot(game_state)
+    return game_state.shared_event(event_cls, *args)
+
+
 class RPCProxyPlayer(Player):
     """
     Server-side class for remote/RPC players.
     """
-    def __init__(self, name):
+    def __init__(self, name, events: Optional[EventQueue] = None):
         super().__init__(name)
-        self.events = queue.Queue()
+        self.events = events if events is not None else EventQueue()
         self.game = None
         self.akey = None
+        self.state_deltas = StateDeltaEncoder()
+        # time.monotonic() of the last authenticated call
+        self.last_activity = time.monotonic()
+        # callbacks waiting for the next event
+        self._event_waiters = []
+        self._event_lock = threading.Lock()
+        # sequence number of the last event sent and of the last event
+        # popped, and the last popped events for resuming event streams
+        self.event_seq = 0
+        self.popped_seq = 0
+        self.popped_events = collections.deque(maxlen=EVENT_REPLAY_SIZE)
 
     def rpc_encode(self, private=False) -> dict:
         rpcobj = Player.rpc_encode(self)
@@ -489,32 +916,81 @@ class RPCProxyPlayer(Player):
         self.play_card()
 
     def play_card(self):
-        self.send_event(TurnEvent(copy.deepcopy(self.game_state)))
+        self.send_event(TurnEvent(GameStateSnapshot(self.game_state)))
 
     def card_played(self, player, card, game_state):
-        self.send_event(CardPlayedEvent(player, card, copy.deepcopy(game_state)))
+        self.send_event(_shared_event(game_state, CardPlayedEvent, player, card))
 
     def trick_played(self, player, game_state):
-        self.send_event(TrickPlayedEvent(player, copy.deepcopy(game_state)))
+        self.send_event(_shared_event(game_state, TrickPlayedEvent, player))
 
     def state_changed(self, game_state):
-        self.send_event(StateChangedEvent(copy.deepcopy(game_state)))
+        self.send_event(_shared_event(game_state, StateChangedEvent))
 
     def send_message(self, sender, msg):
         self.send_event(MessageEvent(sender, msg))
 
     def send_event(self, event):
-        self.events.put(event)
-
-    def pop_events(self):
-        eventlist = EventList()
-        try:
-            while True:
-                eventlist.append(self.events.get_nowait())
-        except queue.Empty:
-            pass
-
-        return eventlist
+        with self._event_lock:
+            self.event_seq += 1
+            self.events.put(self.event_seq, event)
+            waiters, self._event_waiters = self._event_waiters, []
+        for wake in waiters:
+            wake()
+
+    def add_event_waiter(self, wake) -> bool:
+        """
+        Call wake() once, from the thread that sends it, when the next event
+        is sent. Return False without adding the callback if there already
+        are events to pop.
+        """
+        with self._event_lock:
+            if not self.events.empty():
+                return False
+            self._event_waiters.append(wake)
+            return True
+
+    def remove_event_waiter(self, wake):
+        with self._event_lock:
+            if wake in self._event_waiters:
+                self._event_waiters.remove(wake)
+
+    def pop_sequenced_events(self, timeout: Optional[float] = None) -> list:
+        """
+        Get the events sent since the last call as (sequence number, event)
+        pairs. If timeout is given, wait for at most timeout seconds for the
+        first event.
+        """
+        events = self.events.get_all(timeout)
+        if events:
+            self.popped_events.extend(events)
+            self.popped_seq = events[-1][0]
+        return events
+
+    def pop_events(self, timeout: Optional[float] = None) -> EventList:
+        """
+        Get the events sent since the last call. If timeout is given, wait
+        for at most timeout seconds for the first event.
+        """
+        return EventList(event for _, event in self.pop_sequenced_events(timeout))
+
+    def replay_events(self, last_seq: int) -> Optional[list]:
+        """
+        Get the popped events after the one with sequence number last_seq,
+        as (sequence number, event) pairs. Return None if some of them are
+        not kept any more.
+        """
+        if last_seq > self.event_seq:
+            return None
+        if last_seq >= self.popped_seq:
+            return []
+        # the queue may have dropped events, so the kept events must include
+        # the one with last_seq itself
+        popped = list(self.popped_events)
+        for i, (seq, _) in enumerate(popped):
+            if seq == last_seq:
+                return popped[i + 1:]
+        return None
 
     def act(self, controller, game_state: GameState):
         self.controller = controller
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+"""
+Server-Sent Events stream of the events of a player.
+
+GET /api/events/stream keeps the connection open and sends each event of
+the authenticated player (akey cookie or query parameter) as an SSE
+message as soon as it is sent. The message id is the event's sequence
+number and the data is the event in RPC form as JSON, with the full game
+state. Comment lines are sent as heartbeats when there are no events.
+
+A client reconnecting with a Last-Event-ID header (or a last_event_id
+query parameter) first gets the events it missed. If they are not kept
+any more, it gets a "resync" message and should fetch the game state.
+"""
+
+import json
+from typing import Iterator, List, Optional
+
+from tupelo.rpc import rpc_encode
+
+STREAM_PATH = '/api/events/stream'
+
+CONTENT_TYPE = 'text/event-stream'
+
+# seconds between heartbeats when there are no events
+HEARTBEAT_INTERVAL = 15.0
+
+HEARTBEAT = b': heartbeat\n\n'
+
+RESYNC = b'event: resync\ndata: {}\n\n'
+
+# tell EventSource clients to reconnect after two seconds
+STREAM_START = b'retry: 2000\n\n'
+
+
+def format_event(seq: int, event) -> bytes:
+    """
+    Format an event as an SSE message.
+    """
+    return b'id: %d\ndata: %s\n\n' % (seq, json.dumps(rpc_encode(event)).encode())
+
+def format_events(events) -> bytes:
+    return b''.join(format_event(seq, event) for seq, event in events)
+
+def replay(player, last_event_id: Optional[int]) -> List[bytes]:
+    """
+    Get the messages to send first on a stream resumed after last_event_id.
+    """
+    if last_event_id is None:
+        return [STREAM_START]
+    events = player.replay_events(last_event_id)
+    if events is None:
+        return [STREAM_START, RESYNC]
+    return [STREAM_START, format_events(events)]
+
+def stream(player, last_event_id: Optional[int], alive,
+        heartbeat: float = HEARTBEAT_INTERVAL) -> Iterator[bytes]:
+    """
+    Generate the messages of a stream, blocking while waiting for events,
+    for as long as alive() returns True.
+    """
+    yield from replay(player, last_event_id)
+    while alive():
+        events = player.pop_sequenced_events(heartbeat)
+        if events:
+            yield format_events(events)
+        else:
+            yield HEARTBEAT
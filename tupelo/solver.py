@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+"""
+Double-dummy solver for nolo and rami.
+
+Given all four hands, the solver finds the number of tricks each team gets
+when everybody plays perfectly, and a move that achieves it. Cards and
+hands are card indices and masks like in tupelo.position.
+
+The search is a null-window alpha-beta search ("can team 0 get at least
+n tricks of the kind it wants?") driven by a binary search on n. Only the
+lowest card of each sequence of equivalent cards in a hand is searched,
+and results are stored in a bounded transposition table at trick
+boundaries, where they do not depend on the tricks already taken. The
+leader's sure tricks cut the search in rami, and a leader with only top
+cards in nolo.
+"""
+
+import functools
+from typing import List, NamedTuple, Optional, Sequence
+
+from .common import NOLO, RAMI, SUIT_BITS
+from .rules import SUIT_MASKS as _SUIT_MASKS, trick_winner
+
+_RANK_MASK = (1 << SUIT_BITS) - 1
+
+# the size of the caches of the suit functions below
+_CACHE_SIZE = 1 << 16
+
+@functools.lru_cache(maxsize=_CACHE_SIZE)
+def _reduce_suit(remaining: int, hand: int) -> int:
+    """
+    Get the ranks of hand that are not equivalent to a lower rank of hand.
+
+    remaining is the mask of ranks of the suit still in play. Cards of a
+    hand are equivalent if no other card in play falls between them.
+    """
+    kept = 0
+    prev_in_hand = False
+    bit = 1
+    while bit <= remaining:
+        if remaining & bit:
+            in_hand = bool(hand & bit)
+            if in_hand and not prev_in_hand:
+                kept |= bit
+            prev_in_hand = in_hand
+        bit <<= 1
+    return kept
+
+@functools.lru_cache(maxsize=_CACHE_SIZE)
+def _suit_key(h0: int, h1: int, h2: int, h3: int) -> int:
+    """
+    Get a key for the ranks of one suit in the four hands that only
+    depends on the order of the ranks: the owners of the cards from the
+    lowest to the highest, two bits each, after a start bit.
+    """
+    code = 1
+    bit = 1
+    remaining = h0 | h1 | h2 | h3
+    while bit <= remaining:
+        if h0 & bit:
+            code = code << 2
+        elif h1 & bit:
+            code = code << 2 | 1
+        elif h2 & bit:
+            code = code << 2 | 2
+        elif h3 & bit:
+            code = code << 2 | 3
+        bit <<= 1
+    return code
+
+@functools.lru_cache(maxsize=_CACHE_SIZE)
+def _top_cards(remaining: int, hand: int) -> int:
+    """
+    Get the number of the highest ranks of a suit still in play that are
+    all in hand. Each of them wins the trick when led.
+    """
+    count = 0
+    while remaining and hand & (1 << (remaining.bit_length() - 1)):
+        remaining ^= 1 << (remaining.bit_length() - 1)
+        count += 1
+    return count
+
+def _cards(mask: int) -> List[int]:
+    """
+    Get the card indices of a mask in increasing order.
+    """
+    cards = []
+    while mask:
+        low = mask & -mask
+        cards.append(low.bit_length() - 1)
+        mask ^= low
+    return cards
+
+def _rank(card: int) -> int:
+    return card % SUIT_BITS
+
+def reduce_moves(moves: int, in_play: int) -> int:
+    """
+    Drop the moves that are equivalent to a lower move of the same suit.
+
+    moves is a mask of cards in one hand and in_play the mask of all the
+    cards not yet played, including the current trick.
+    """
+    kept = 0
+    for suit in range(4):
+        shift = suit * SUIT_BITS
+        hand = (moves >> shift) & _RANK_MASK
+        if hand:
+            kept |= _reduce_suit((in_play >> shift) & _RANK_MASK, hand) << shift
+    return kept
+
+
+class SolveResult(NamedTuple):
+    """
+    Result of a double-dummy search.
+
+    tricks has the final trick counts of both teams, including the tricks
+    taken before the position, and move is the best card index for the
+    player in turn (None if the hand is over).
+    """
+    tricks: List[int]
+    move: Optional[int]
+
+
+class Solver():
+    """
+    Double-dummy solver with a transposition table of at most tt_size
+    entries. The table is kept between solve() calls; it is emptied when
+    it gets full.
+    """
+
+    def __init__(self, tt_size: int = 1 << 20):
+        self.tt_size = tt_size
+        self.table = {}
+        self.nodes = 0
+        # search state, set by solve()
+        self._hands = None
+        self._score_team = 0
+
+    def clear(self):
+        """
+        Empty the transposition table.
+        """
+        self.table = {}
+
+    def solve(self, hands: Sequence[int], mode: int = NOLO, leader: int = 0,
+            table: Sequence[int] = (), tricks: Sequence[int] = (0, 0)) -> SolveResult:
+        """
+        Solve a position.
+
+        hands are the card masks of the seats, table the cards already
+        played to the current trick, starting from leader's card, and tricks
+        the tricks taken so far by both teams.
+        """
+        if mode not in (NOLO, RAMI):
+            raise ValueError('Unknown mode %r' % mode)
+
+        self._hands = list(hands)
+        # team 0 maximizes the tricks of this team: in rami its own, in
+        # nolo the other team's
+        self._score_team = 0 if mode == RAMI else 1
+        self.nodes = 0
+
+        remaining = sum(bin(hand).count('1') for hand in self._hands)
+        total = (remaining + len(table)) // 4
+        turn = (leader + len(table)) % 4
+
+        if remaining == 0:
+            return SolveResult(list(tricks), None)
+
+        # the current trick as the winning card so far, its player and the
+        # mask of the cards played
+        trick = (-1, 0, 0)
+        if table:
+            best = trick_winner(table)
+            trick = (table[best], (leader + best) % 4,
+                    sum(1 << card for card in table))
+
+        # binary search on the number of tricks team 0 can secure
+        low, high = 0, total
+        while low < high:
+            target = (low + high + 1) // 2
+            if self._search(turn, leader, target, total, *trick):
+                low = target
+            else:
+                high = target - 1
+
+        move = self._best_move(turn, leader, low, total, *trick)
+        future = [0, 0]
+        future[self._score_team] = low
+        future[1 - self._score_team] = total - low
+        return SolveResult([tricks[0] + future[0], tricks[1] + future[1]], move)
+
+    def _best_move(self, turn: int, leader: int, value: int, total: int,
+            best: int, winner: int, played: int) -> int:
+        """
+        Find a move of the player in turn that keeps the value.
+        """
+        hands = self._hands
+        for card in self._moves(turn, leader, best, winner, played):
+            bit = 1 << card
+            hands[turn] ^= bit
+            if turn % 2 == 0:
+                ok = self._play(turn, leader, value, total, best, winner, played, card)
+            else:
+                ok = not self._play(turn, leader, value + 1, total, best, winner, played, card)
+            hands[turn] ^= bit
+            if ok:
+                return card
+
+        raise AssertionError('No move keeps the value %d' % value)
+
+    def _play(self, turn: int, leader: int, target: int, total: int,
+            best: int, winner: int, played: int, card: int) -> bool:
+        """
+        Search the position after card of the player in turn, removed from
+        the hand already.
+        """
+        if best < 0:
+            return self._search((turn + 1) % 4, leader, target, total, card, turn, 1 << card)
+        if card > best and card // SUIT_BITS == best // SUIT_BITS:
+            best, winner = card, turn
+        if (turn + 1) % 4 == leader:
+            won = int(winner % 2 == self._score_team)
+            return self._search(winner, winner, target - won, total - 1, -1, 0, 0)
+        return self._search((turn + 1) % 4, leader, target, total, best, winner,
+                played | 1 << card)
+
+    def _moves(self, turn: int, leader: int, best: int, winner: int, played: int) -> List[int]:
+        """
+        Get the moves of the player in turn as a list, the most promising
+        first.
+        """
+        hands = self._hands
+        hand = hands[turn]
+        in_play = hands[0] | hands[1] | hands[2] | hands[3] | played
+        if best < 0:
+            cards = _cards(reduce_moves(hand, in_play))
+            if self._score_team == 0:
+                # high cards first when taking tricks
+                cards.sort(key=_rank, reverse=True)
+            return cards
+
+        led = best // SUIT_BITS
+        moves = hand & _SUIT_MASKS[led] or hand
+        wants = self._score_team == 0
+        partner_wins = winner % 2 == turn % 2
+        last = (turn + 1) % 4 == leader
+        # the cheapest winning or highest losing card first, as it suits
+        # the team, then discards from the top
+        first, middle, rest = [], [], []
+        for card in _cards(reduce_moves(moves, in_play)):
+            if card // SUIT_BITS != led:
+                middle.append(card)
+            elif card > best:
+                if wants:
+                    (rest if partner_wins else first).append(card)
+                elif last:
+                    # the trick is ours anyway, get rid of a high card
+                    middle.append(card)
+                else:
+                    rest.append(card)
+            elif wants:
+                rest.append(card)
+            elif last and partner_wins:
+                middle.append(card)
+            else:
+                first.append(card)
+        if not wants:
+            first.reverse()
+        middle.reverse()
+        return first + middle + rest
+
+    def _search(self, turn: int, leader: int, target: int, total: int,
+            best: int, winner: int, played: int) -> bool:
+        """
+        Return True if team 0 gets at least target of the total tricks left
+        (including the current trick) for the scoring team.
+
+        best is the winning card of the current trick (-1 if the player in
+        turn leads), winner its player and played the mask of the cards in
+        the trick.
+        """
+        if target <= 0:
+            return True
+        if target > total:
+            return False
+
+        self.nodes += 1
+        hands = self._hands
+        score_team = self._score_team
+        key = None
+        if best < 0:
+            # positions with the same order of cards in each suit have
+            # the same value, whatever the cards played before; the mode
+            # is part of the key as the table is kept between solve() calls
+            h0, h1, h2, h3 = hands
+            key = (score_team, leader,
+                    _suit_key(h0 & _RANK_MASK, h1 & _RANK_MASK,
+                        h2 & _RANK_MASK, h3 & _RANK_MASK),
+                    _suit_key((h0 >> 13) & _RANK_MASK, (h1 >> 13) & _RANK_MASK,
+                        (h2 >> 13) & _RANK_MASK, (h3 >> 13) & _RANK_MASK),
+                    _suit_key((h0 >> 26) & _RANK_MASK, (h1 >> 26) & _RANK_MASK,
+                        (h2 >> 26) & _RANK_MASK, (h3 >> 26) & _RANK_MASK),
+                    _suit_key(h0 >> 39, h1 >> 39, h2 >> 39, h3 >> 39))
+            entry = self.table.get(key)
+            if entry is not None:
+                if entry[0] >= target:
+                    return True
+                if entry[1] < target:
+                    return False
+
+            if total == 1:
+                # the last trick plays itself
+                last = [hands[(leader + i) % 4].bit_length() - 1 for i in range(4)]
+                winner = (leader + trick_winner(last)) % 4
+                return winner % 2 == score_team
+
+            in_play = h0 | h1 | h2 | h3
+            lead_hand = hands[leader]
+            partner_hand = hands[(leader + 2) % 4]
+            sure = partner_sure = 0
+            reach = False
+            for shift in (0, 13, 26, 39):
+                remaining = (in_play >> shift) & _RANK_MASK
+                sure += _top_cards(remaining, (lead_hand >> shift) & _RANK_MASK)
+                tops = _top_cards(remaining, (partner_hand >> shift) & _RANK_MASK)
+                partner_sure += tops
+                if tops and (lead_hand >> shift) & _RANK_MASK:
+                    reach = True
+            if score_team == 0:
+                # in rami the leader can cash its top cards, or lead to a
+                # top card of the partner and let the partner cash them
+                if reach:
+                    sure = max(sure, partner_sure)
+                if leader % 2 == 0:
+                    if sure >= target:
+                        return True
+                elif total - sure < target:
+                    return False
+            elif sure == bin(lead_hand).count('1'):
+                # in nolo a leader with only top cards takes all the tricks
+                return leader % 2 == 1
+
+        maximizing = turn % 2 == 0
+        result = not maximizing
+        search = self._search
+        next_turn = (turn + 1) % 4
+        last = next_turn == leader
+        led = best // SUIT_BITS
+        for card in self._moves(turn, leader, best, winner, played):
+            bit = 1 << card
+            hands[turn] ^= bit
+            if best < 0:
+                value = search(next_turn, leader, target, total, card, turn, bit)
+            elif last:
+                if card > best and card // SUIT_BITS == led:
+                    won = int(turn % 2 == score_team)
+                    value = search(turn, turn, target - won, total - 1, -1, 0, 0)
+                else:
+                    won = int(winner % 2 == score_team)
+                    value = search(winner, winner, target - won, total - 1, -1, 0, 0)
+            elif card > best and card // SUIT_BITS == led:
+                value = search(next_turn, leader, target, total, card, turn, played | bit)
+            else:
+                value = search(next_turn, leader, target, total, best, winner, played | bit)
+            hands[turn] ^= bit
+            if value == maximizing:
+                result = value
+                break
+
+        if key is not None:
+            if len(self.table) >= self.tt_size:
+                self.table = {}
+            low, high = self.table.get(key, (0, total))
+            if result:
+                low = max(low, target)
+            else:
+                high = min(high, target - 1)
+            self.table[key] = (low, high)
+
+        return result
+
+
+def solve(hands: Sequence[int], mode: int = NOLO, leader: int = 0,
+        table: Sequence[int] = (), tricks: Sequence[int] = (0, 0)) -> SolveResult:
+    """
+    Solve a position with a new Solver, see Solver.solve().
+    """
+    return Solver().solve(hands, mode, leader, table, tricks)
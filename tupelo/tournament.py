@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# vim: set sts=4 sw=4 et:
+
+import math
+import random
+import multiprocessing
+from typing import List, Optional
+
+from . import players
+from .game import GameController
+
+# games played by one worker task
+CHUNK_SIZE = 50
+
+def get_bot_class(name: str) -> type:
+    """
+    Get a bot player class from tupelo.players by name.
+    """
+    cls = getattr(players, name, None)
+    if not isinstance(cls, type) or not issubclass(cls, players.Player) or \
+            issubclass(cls, players.CliPlayer) or cls in (players.Player,
+                    players.ThreadedPlayer):
+        raise ValueError('%s is not a bot player class' % name)
+
+    return cls
+
+def _play_game(bot_classes: List[type], game_no: int, rng, max_hands: int):
+    """
+    Play one headless game.
+
+    The bots swap teams on every other game and the dealer rotates, so
+    that no bot gets a seating advantage. Return a tuple of
+    (team of first bot, GameResult).
+    """
+    team_of_first = game_no % 2
+    game = GameController(rng)
+    for seat in range(4):
+        bot_cls = bot_classes[(seat + team_of_first) % 2]
+        game.register_player(bot_cls('%s %d' % (bot_cls.__name__, seat)))
+
+    game.state.dealer = (game_no // 2) % 4
+    return (team_of_first, game.run_headless(max_hands))
+
+def _play_chunk(args):
+    """
+    Play a chunk of games in a worker process.
+
+    Return a list of (score of first bot, score of second bot, winner
+    index, hands played) tuples, with winner None for unfinished games.
+    """
+    bot_names, seed, first_game, count, max_hands = args
+    bot_classes = [get_bot_class(name) for name in bot_names]
+    # seed per chunk, so the results do not depend on the number of workers
+    rng = random.Random(seed * 1000003 + first_game)
+    results = []
+    for game_no in range(first_game, first_game + count):
+        team_of_first, result = _play_game(bot_classes, game_no, rng, max_hands)
+        teams = (team_of_first, 1 - team_of_first)
+        winner = None
+        if result.winner is not None:
+            winner = teams.index(result.winner)
+        results.append((result.score[teams[0]], result.score[teams[1]],
+            winner, len(result.hands)))
+
+    return results
+
+
+class BotStats():
+    """
+    Aggregated tournament statistics for one bot.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.games = 0
+        self.wins = 0
+        self.score_sum = 0
+        self.score_sq_sum = 0
+
+    def add(self, score: int, won: bool):
+        self.games += 1
+        self.wins += int(won)
+        self.score_sum += score
+        self.score_sq_sum += score * score
+
+    @property
+    def win_rate(self) -> float:
+        if self.games == 0:
+            return 0.0
+        return self.wins / self.games
+
+    def win_rate_interval(self, z: float = 1.96):
+        """
+        Get the Wilson score interval for the win rate.
+        """
+        if self.games == 0:
+            return (0.0, 1.0)
+        n = self.games
+        p = self.win_rate
+        center = (p + z * z / (2 * n)) / (1 + z * z / n)
+        half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+        return (center - half, center + half)
+
+    @property
+    def avg_score(self) -> float:
+        if self.games == 0:
+            return 0.0
+        return self.score_sum / self.games
+
+    def avg_score_interval(self, z: float = 1.96):
+        """
+        Get the normal approximation confidence interval for the average score.
+        """
+        if self.games < 2:
+            return (self.avg_score, self.avg_score)
+        n = self.games
+        var = (self.score_sq_sum - self.score_sum * self.score_sum / n) / (n - 1)
+        half = z * math.sqrt(max(var, 0.0) / n)
+        return (self.avg_score - half, self.avg_score + half)
+
+
+class TournamentResult():
+    """
+    Result of a tournament between two bots.
+    """
+    def __init__(self, bot_names: List[str]):
+        self.stats = [BotStats(name) for name in bot_names]
+        self.games = 0
+        self.unfinished = 0
+        self.hands = 0
+
+    def add(self, score1: int, score2: int, winner: Optional[int], hands: int):
+        self.games += 1
+        self.hands += hands
+        if winner is None:
+            self.unfinished += 1
+        self.stats[0].add(score1, winner == 0)
+        self.stats[1].add(score2, winner == 1)
+
+    def __str__(self):
+        lines = ['%d games, %d hands, %d unfinished' % (self.games, self.hands,
+            self.unfinished)]
+        for stats in self.stats:
+            wlow, whigh = stats.win_rate_interval()
+            slow, shigh = stats.avg_score_interval()
+            lines.append('%-20s wins %5.1f%% (95%% CI %5.1f-%5.1f%%), '
+                    'avg score %5.1f (95%% CI %5.1f-%5.1f)' % (stats.name,
+                        stats.win_rate * 100, wlow * 100, whigh * 100,
+                        stats.avg_score, slow, shigh))
+        return '\n'.join(lines)
+
+
+def run_tournament(bot_names: List[str], games: int, processes: Optional[int] = None,
+        seed: int = 0, max_hands: int = 1000) -> TournamentResult:
+    """
+    Play games between two bot classes using a process pool.
+
+    processes defaults to the number of CPUs; with processes=1 the games
+    are played in the calling process.
+    """
+    if len(bot_names) != 2:
+        raise ValueError('Exactly two bots are needed')
+
+    for name in bot_names:
+        get_bot_class(name)
+
+    tasks = [(bot_names, seed, first, min(CHUNK_SIZE, games - first), max_hands)
+            for first in range(0, games, CHUNK_SIZE)]
+    result = TournamentResult(bot_names)
+
+    if processes == 1:
+        for chunk in map(_play_chunk, tasks):
+            for game in chunk:
+                result.add(*game)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            for chunk in pool.imap_unordered(_play_chunk, tasks):
+                for game in chunk:
+                    result.add(*game)
+
+    return result
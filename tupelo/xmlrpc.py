@@ -2,11 +2,20 @@
 # vim: set sts=4 sw=4 et:
 
 import time
+import json
+import zlib
+import http.client
+import urllib.parse
 import xmlrpc.client
 from . import players
 from . import rpc
-from .common import GameState, CardSet, GameError, RuleError, ProtocolError, simple_decorator
-from .events import EventList, CardPlayedEvent, MessageEvent, TrickPlayedEvent, TurnEvent, StateChangedEvent
+from . import binary
+from .common import GameState, CardSet, TURN_NONE, GameError, RuleError, ProtocolError, simple_decorator
+from .events import EventList, CardPlayedEvent, MessageEvent, TrickPlayedEvent, TurnEvent, StateChangedEvent, \
+        ResyncEvent, StateDeltaDecoder
+
+# seconds the server may wait for events in one get_events call
+EVENTS_TIMEOUT = 30
 
 @simple_decorator
 def error2fault(func):
@@ -53,38 +62,79 @@ class XMLRPCCliPlayer(players.CliPlayer):
         players.CliPlayer.__init__(self, player_name)
         self.game_state = GameState()
         self.hand = None
+        # the state fetched while handling the current events
+        self.fetched_state = None
+        # the version of the game state of the last turn
+        self.turn_version = None
 
     def handle_event(self, event):
         if isinstance(event, CardPlayedEvent):
+            self.game_state.update(event.game_state)
+            if event.player.id == self.id and self.hand and event.card in self.hand and \
+                    event.game_state.status == GameState.ONGOING:
+                # the hand is kept up to date without asking the server
+                self.hand.remove(event.card)
             self.card_played(event.player, event.card, event.game_state)
         elif isinstance(event, MessageEvent):
             self.send_message(event.sender, event.message)
         elif isinstance(event, TrickPlayedEvent):
+            self.game_state.update(event.game_state)
             self.trick_played(event.player, event.game_state)
         elif isinstance(event, TurnEvent):
             self.game_state.update(event.game_state)
-            state = self.controller.get_state(self.id)
-            self.hand = state['hand']
-            self.game_state.update(state['game_state'])
+            if not self.hand:
+                self.update_state()
         elif isinstance(event, StateChangedEvent):
             self.game_state.update(event.game_state)
+            if event.game_state.status == GameState.VOTING:
+                # a new hand was dealt
+                self.update_state()
+        elif isinstance(event, ResyncEvent):
+            # the server dropped events
+            self.update_state()
         else:
             print("unknown event: %s" % event)
 
+    def update_state(self):
+        """
+        Fetch the hand and the game state from the server, once for the
+        events got at a time. They are taken into use after the events, as
+        the state is newer than any of them.
+        """
+        if self.fetched_state is None:
+            self.fetched_state = self.controller.get_state(self.id)
+
     def wait_for_turn(self):
         """
         Wait for this player's turn.
         """
         while True:
-
-            time.sleep(0.5)
-
             if self.controller is not None:
-                events = self.controller.get_events(self.id)
-                for event in events:
-                    self.handle_event(event)
+                # returns as soon as there are events; the state is needed
+                # only for a new hand, and then it comes in the same request
+                if self.hand:
+                    events = self.controller.get_events(self.id,
+                            EVENTS_TIMEOUT)
+                else:
+                    events, self.fetched_state = \
+                        self.controller.get_events_and_state(self.id,
+                                EVENTS_TIMEOUT)
+                try:
+                    for event in events:
+                        self.handle_event(event)
+                    if self.fetched_state is not None:
+                        self.hand = self.fetched_state['hand']
+                        self.game_state.update(self.fetched_state['game_state'])
+                finally:
+                    self.fetched_state = None
+            else:
+                time.sleep(0.5)
 
-            if self.game_state.turn_id == self.id:
+            # events from before the last turn may come after it was played
+            if self.game_state.turn_id == self.id and \
+                    self.game_state.turn != TURN_NONE and \
+                    self.game_state.version != self.turn_version:
+                self.turn_version = self.game_state.version
                 break
 
 
@@ -92,7 +142,7 @@ class XMLRPCProxyController():
     """
     Client-side proxy object for the server/GameController.
     """
-    def __init__(self, server_uri):
+    def __init__(self, server_uri, use_binary=False, use_delta=False):
         super(XMLRPCProxyController, self).__init__()
         if not server_uri.startswith('http://') and \
             not server_uri.startswith('https://'):
@@ -101,18 +151,121 @@ class XMLRPCProxyController():
         self.server = xmlrpc.client.ServerProxy(server_uri)
         self.game_id = None
         self.akey = None
+        # poll events and state from the /api/ paths in the binary format
+        self.use_binary = use_binary
+        self.api_uri = urllib.parse.urlsplit(server_uri)
+        # poll events with the game states as deltas
+        self.use_delta = use_delta
+        self.state_deltas = StateDeltaDecoder(self._resync_state)
+        # persistent connection for the /api/ calls
+        self._api_conn = None
+
+    def _api_get(self, path: str, decoder, **params):
+        """
+        Call an /api/ method, asking for the binary format.
+
+        Return the result in RPC form.
+        """
+        url = '/api/' + path
+        if params:
+            url += '?' + urllib.parse.urlencode(dict((key, json.dumps(value))
+                for key, value in params.items()))
+        headers = {'Accept': binary.CONTENT_TYPE, 'Accept-Encoding': 'gzip, deflate',
+                'Cookie': 'akey=%s' % self.akey}
+        reused = self._api_conn is not None
+        if not reused:
+            if self.api_uri.scheme == 'https':
+                self._api_conn = http.client.HTTPSConnection(self.api_uri.netloc)
+            else:
+                self._api_conn = http.client.HTTPConnection(self.api_uri.netloc)
+        conn = self._api_conn
+        try:
+            try:
+                conn.request('GET', url, headers=headers)
+                response = conn.getresponse()
+            except (ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+                # the server closed the idle connection, reconnect
+                conn.close()
+                conn.request('GET', url, headers=headers)
+                response = conn.getresponse()
+            data = response.read()
+        except:
+            conn.close()
+            self._api_conn = None
+            raise
+
+        if response.status != 200:
+            code = response.getheader('X-Error-Code')
+            for klass in (GameError, RuleError, ProtocolError):
+                if code == str(klass.rpc_code):
+                    raise klass(response.getheader('X-Error-Message'))
+            raise ProtocolError('%s failed with HTTP status %d' % (path,
+                response.status))
+
+        if response.getheader('Content-Encoding') in ('gzip', 'deflate'):
+            # wbits 47 detects the gzip and the zlib header
+            data = zlib.decompress(data, 32 + zlib.MAX_WBITS)
+
+        if response.getheader('Content-Type') == binary.CONTENT_TYPE:
+            return decoder(data)
+        # the server does not support the binary format
+        return json.loads(data.decode('utf-8'))
 
     @fault2error
     def play_card(self, _player, card):
         self.server.game.play_card(self.akey, self.game_id, rpc.rpc_encode(card))
 
     @fault2error
-    def get_events(self, _player_id):
-        return rpc.rpc_decode(EventList, self.server.get_events(self.akey))
+    def get_events(self, _player_id, timeout=0):
+        """
+        Get the new events, waiting for at most timeout seconds for one.
+        """
+        if self.use_binary:
+            return rpc.rpc_decode(EventList, self._api_get('get_events',
+                binary.decode_events, timeout=timeout))
+        return self._decode_events(self.server.get_events(self.akey, self.use_delta, timeout))
+
+    @fault2error
+    def get_events_and_state(self, _player_id, timeout=0):
+        """
+        Get the new events like get_events() and then the state like
+        get_state(), in one system.multicall request. The state is None if
+        the player has no game.
+        """
+        if self.use_binary or self.game_id is None:
+            return (self.get_events(_player_id, timeout), None)
+        multicall = xmlrpc.client.MultiCall(self.server)
+        multicall.get_events(self.akey, self.use_delta, timeout)
+        multicall.game.get_state(self.akey, self.game_id)
+        rpcevents, state = multicall()
+        # the state deltas of the events come before the state
+        return (self._decode_events(rpcevents), self._decode_state(state))
+
+    def _decode_events(self, rpcevents: list) -> EventList:
+        if self.use_delta:
+            return self.state_deltas.decode(rpcevents)
+        return rpc.rpc_decode(EventList, rpcevents)
+
+    def _resync_state(self) -> dict:
+        """
+        Get the full game state in RPC form, for decoding state deltas.
+        """
+        return self.server.game.get_state(self.akey, self.game_id)['game_state']
 
     @fault2error
     def get_state(self, _player_id):
-        state = self.server.game.get_state(self.akey, self.game_id)
+        if self.use_binary:
+            state = self._api_get('game/get_state', binary.decode_state,
+                    game_id=self.game_id)
+        else:
+            state = self.server.game.get_state(self.akey, self.game_id)
+        return self._decode_state(state)
+
+    def _decode_state(self, state: dict) -> dict:
+        # the server bases the following state deltas on this state
+        self.state_deltas.state = state['game_state']
         state['game_state'] = rpc.rpc_decode(GameState, state['game_state'])
         state['hand'] = rpc.rpc_decode(CardSet, state['hand'])
         return state
@@ -8,13 +8,19 @@
   $ = jQuery;
 
   $(document).ready(function() {
-    var ajaxErr, cardClicked, cardPlayed, clearTable, dbg, escapeHtml, eventsOk, gameCreateOk, gameInfoOk, getGameState, getTeamPlayers, hello, leaveOk, leftGame, listGamesOk, listPlayersOk, messageReceived, processEvent, quitOk, registerOk, request, setState, startOk, stateChanged, states, trickPlayed, tupelo, turnEvent, updateGameLinks, updateGameState, updateHand, updateLists;
+    var ajaxErr, applyStateDelta, cardClicked, cardPlayed, clearTable, dbg, escapeHtml, eventsOk, gameCreateOk, gameInfoOk, getGameState, getTeamPlayers, hello, leaveOk, leftGame, listGamesOk, listPlayersOk, messageReceived, processEvent, quitOk, registerOk, releaseEvents, request, resyncEvent, setState, startOk, stateChanged, states, trickPlayed, tupelo, turnEvent, updateGameLinks, updateGameState, updateHand, updateLists;
     // status object
     tupelo = {
       game_state: {},
+      // the last full game state received, the base of the state deltas
+      delta_state: null,
       events: [],
+      // events waiting for the full state while resyncing
+      held_events: [],
       config: {
-        serverBaseUrl: "/api"
+        serverBaseUrl: "/api",
+        // seconds the server may wait for events in one get_events request
+        eventsTimeout: 30
       }
     };
     states = {
@@ -208,12 +214,19 @@
         tupelo.event_fetch_timer.disable();
         tupelo.event_fetch_timer = null;
       }
+      if (tupelo.event_source != null) {
+        tupelo.event_source.close();
+        tupelo.event_source = null;
+      }
       if (tupelo.event_timer != null) {
         clearTimeout(tupelo.event_timer);
         tupelo.event_timer = null;
       }
       tupelo.game_id = null;
       tupelo.game_state = {};
+      tupelo.delta_state = null;
+      tupelo.resyncing = false;
+      tupelo.held_events = [];
       tupelo.hand = null;
       tupelo.my_turn = null;
     };
@@ -241,11 +254,24 @@
       dbg();
       $("p#joined_game").html(`joined game ${tupelo.game_id}`);
       setState("gameCreated", "fast");
-      tupelo.event_fetch_timer = new T.Timer(tupelo.config.serverBaseUrl + "/get_events", 2000, eventsOk, {
-        data: {
-          akey: tupelo.player.akey
-        }
-      });
+      if (window.EventSource != null) {
+        // the server pushes the events as they happen
+        tupelo.event_source = new EventSource(tupelo.config.serverBaseUrl + "/events/stream?akey=" + encodeURIComponent(tupelo.player.akey));
+        tupelo.event_source.onmessage = function(msg) {
+          return eventsOk([JSON.parse(msg.data)]);
+        };
+        // missed events, get the current state
+        tupelo.event_source.addEventListener("resync", getGameState);
+      } else {
+        // long poll: the server answers when there are events
+        tupelo.event_fetch_timer = new T.Timer(tupelo.config.serverBaseUrl + "/get_events", 100, eventsOk, {
+          data: {
+            akey: tupelo.player.akey,
+            delta: true,
+            timeout: tupelo.config.eventsTimeout
+          }
+        });
+      }
       return updateLists();
     };
     cardPlayed = function(event) {
@@ -391,6 +417,12 @@
         url: "/game/get_state",
         success: function(result) {
           T.log(result);
+          // the server sends the following state deltas based on this state
+          tupelo.delta_state = result.game_state;
+          if (tupelo.resyncing) {
+            tupelo.resyncing = false;
+            releaseEvents(result.game_state);
+          }
           if (result.game_state != null) {
             updateGameState(result.game_state);
           }
@@ -410,6 +442,12 @@
       getGameState();
       return true;
     };
+    // the server dropped events, the full state must be fetched
+    resyncEvent = function(event) {
+      T.log("resyncEvent");
+      getGameState();
+      return true;
+    };
     stateChanged = function(event) {
       T.log("stateChanged");
       if (event.game_state.status === T.VOTING) { // game started!
@@ -451,6 +489,9 @@
         case 5:
           handled = stateChanged(event);
           break;
+        case 6:
+          handled = resyncEvent(event);
+          break;
         default:
           T.log("unknown event " + event.type);
       }
@@ -458,18 +499,77 @@
         return tupelo.event_timer = setTimeout(processEvent, 0);
       }
     };
+    // queue the events held during a resync with the fetched state
+    releaseEvents = function(state) {
+      var event, j, len, ref;
+      ref = tupelo.held_events;
+      for (j = 0, len = ref.length; j < len; j++) {
+        event = ref[j];
+        event.game_state = state;
+        tupelo.events.push(event);
+      }
+      tupelo.held_events = [];
+      if (tupelo.events.length > 0 && (tupelo.event_timer == null)) {
+        return tupelo.event_timer = setTimeout(processEvent, 0);
+      }
+    };
+    // rebuild the full game state of an event from its state delta
+    applyStateDelta = function(event) {
+      var delta, j, key, len, ref, ref1, state, value;
+      delta = event.state_delta;
+      delete event.state_delta;
+      if ((tupelo.delta_state != null) && delta.base === tupelo.delta_state.version) {
+        state = {};
+        ref = tupelo.delta_state;
+        for (key in ref) {
+          if (!hasProp.call(ref, key)) continue;
+          value = ref[key];
+          state[key] = value;
+        }
+        for (key in delta) {
+          if (!hasProp.call(delta, key)) continue;
+          value = delta[key];
+          if (key !== "base" && key !== "removed") {
+            state[key] = value;
+          }
+        }
+        ref1 = (ref = delta.removed) != null ? ref : [];
+        for (j = 0, len = ref1.length; j < len; j++) {
+          key = ref1[j];
+          delete state[key];
+        }
+        tupelo.delta_state = state;
+        return event.game_state = state;
+      } else if (!tupelo.resyncing) {
+        // out of sync, fetch the full state
+        T.log("state delta out of sync");
+        tupelo.delta_state = null;
+        tupelo.resyncing = true;
+        return getGameState();
+      }
+    };
     eventsOk = function(result) {
       var event, j, len;
+      /*
+      if (result.length > 0)
+        eventLog = $("#event_log")
+        eventLog.append(JSON.stringify(result) + "\n")
+        eventLog.scrollTop(eventLog[0].scrollHeight - eventLog.height())
+      */
+      // push events to queue
       for (j = 0, len = result.length; j < len; j++) {
         event = result[j];
-        /*
-        if (result.length > 0)
-          eventLog = $("#event_log")
-          eventLog.append(JSON.stringify(result) + "\n")
-          eventLog.scrollTop(eventLog[0].scrollHeight - eventLog.height())
-        */
-        // push events to queue
-        tupelo.events.push(event);
+        if (event.state_delta != null) {
+          applyStateDelta(event);
+        } else if (event.game_state != null) {
+          tupelo.delta_state = event.game_state;
+        }
+        if (tupelo.resyncing) {
+          // the state of the event is lost, wait for the full state
+          tupelo.held_events.push(event);
+        } else {
+          tupelo.events.push(event);
+        }
       }
       if (tupelo.events.length > 0 && (tupelo.event_timer == null)) {
         tupelo.event_timer = setTimeout(processEvent, 0);